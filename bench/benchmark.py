@@ -0,0 +1,291 @@
+#! /usr/bin/env python
+# -*- encoding: utf-8 -*-
+# vim:fenc=utf-8:
+
+"""Benchmarks of the listing and provisioning paths of the AWS library at
+fleet scale, against the fake AWS backend (see :mod:`mico.lib.aws.fake`),
+so no AWS account is needed and the results do not depend on the network.
+
+Each case runs in a child process, over a fresh fleet of the given size,
+and reports the wall time, the number of AWS API calls (by operation) and
+the peak memory of the process. The latency of AWS is simulated adding a
+fixed delay to each request. Results are printed as JSON, to be compared
+between releases::
+
+    python bench/benchmark.py --sizes 100,1000 --latency 0.05 -o out.json
+
+Run ``python bench/benchmark.py --help`` for the complete list of options
+and cases.
+"""
+
+import os
+import sys
+import time
+import json
+import platform
+import resource
+import argparse
+import subprocess
+import multiprocessing
+
+sys.path.insert(0, os.path.join(os.path.dirname(os.path.abspath(__file__)), ".."))
+
+# The connect helpers require credentials, but any value is valid for the
+# fake backend.
+os.environ.setdefault("AWS_ACCESS_KEY_ID", "fake")
+os.environ.setdefault("AWS_SECRET_ACCESS_KEY", "fake")
+
+import mico
+import mico.output
+
+from mico.util.workers import max_workers
+from mico.lib.aws.fake import aws_fake
+from mico.lib.aws.fake import aws_fake_seed
+from mico.lib.aws.fake.ec2 import new_security_group
+from mico.lib.aws.connection import api_calls
+from mico.lib.aws.connection import aws_api_calls_reset
+from mico.lib.aws.ec2 import ec2_list
+from mico.lib.aws.ec2 import ec2_ensure
+from mico.lib.aws.ec2 import ec2_tag_flush
+from mico.lib.aws.ec2.ebs import ebs_list
+from mico.lib.aws.ec2.sg import sg_delete
+from mico.lib.aws.ec2.autoscale import as_list_instances
+from mico.lib.aws.ec2.autoscale import as_list_alarms
+from mico.lib.aws.ec2.autoscale import as_config
+from mico.lib.aws.ec2.autoscale import as_policy
+from mico.lib.aws.ec2.autoscale import as_alarm
+from mico.lib.aws.ec2.autoscale import as_event
+from mico.lib.aws.ec2.autoscale import as_ensure
+from mico.lib.aws.r53 import r53_list
+
+
+BENCH_REGION = "us-east-1"
+BENCH_SIZES = (100, 1000, 10000)
+
+
+def _setup_sg_delete(size, options):
+    # An unused group, which is referenced by all the groups of the fleet.
+    ret = aws_fake_seed(instances=size, security_groups=max(2, size // 100))
+    region = aws_fake().region(BENCH_REGION)
+    target = new_security_group(region, "bench-target")
+    for group_id in ret.security_groups:
+        region.security_groups[group_id]["rules"].append(
+            ("tcp", "0", "65535", "group", target["id"]))
+    return ret
+
+
+def _run_ec2_ensure(size, options):
+    for i in range(options.provision):
+        ec2_ensure("ami-00000000", name="bench-%05d" % i,
+                   instance_type="m1.small", security_groups=["group-000"])
+
+
+def _run_as_ensure(size, options):
+    config = as_config("bench-config", "ami-00000000",
+                       security_groups=["group-000"])
+    up = as_policy("bench-up", scaling_adjustment=1)
+    down = as_policy("bench-down", scaling_adjustment=-1)
+    high = as_alarm("bench-cpu-high", metric="CPUUtilization",
+                    namespace="AWS/EC2", statistic="Average",
+                    comparison=">=", threshold=80, period=60,
+                    evaluation_periods=2)
+    low = as_alarm("bench-cpu-low", metric="CPUUtilization",
+                   namespace="AWS/EC2", statistic="Average",
+                   comparison="<=", threshold=20, period=60,
+                   evaluation_periods=2)
+    as_ensure("bench", ["us-east-1a", "us-east-1b"], config,
+              events=[as_event(high, up), as_event(low, down)],
+              min_size=options.provision, max_size=options.provision * 2)
+
+
+# The cases, as tuples of (name, setup, run), where setup creates the
+# fleet of the size passed as argument, and run is the timed code, which
+# returns the list of items listed, if any.
+BENCH_CASES = (
+    ("ec2_list",
+     lambda size, options: aws_fake_seed(instances=size),
+     lambda size, options: list(ec2_list())),
+    ("ebs_list",
+     lambda size, options: aws_fake_seed(instances=size, volumes=size),
+     lambda size, options: list(ebs_list())),
+    ("as_list_instances",
+     lambda size, options: aws_fake_seed(autoscaling_groups=max(1, size // 10),
+                                         autoscaling_size=10),
+     lambda size, options: list(as_list_instances())),
+    ("as_list_alarms",
+     lambda size, options: aws_fake_seed(autoscaling_groups=max(1, size // 10),
+                                         autoscaling_size=0, alarms=size),
+     lambda size, options: list(as_list_alarms())),
+    ("r53_list",
+     lambda size, options: aws_fake_seed(records=size),
+     lambda size, options: list(r53_list())),
+    ("sg_delete",
+     _setup_sg_delete,
+     lambda size, options: sg_delete("bench-target", force=True)),
+    ("ec2_ensure",
+     lambda size, options: aws_fake_seed(instances=size),
+     _run_ec2_ensure),
+    ("as_ensure",
+     lambda size, options: aws_fake_seed(instances=size),
+     _run_as_ensure),
+)
+
+
+def _rss_kb():
+    """Return the current resident memory of the process, in KiB."""
+    try:
+        with open("/proc/self/statm") as fd:
+            pages = int(fd.read().split()[1])
+        return pages * resource.getpagesize() // 1024
+    except (IOError, OSError, ValueError, IndexError):
+        return None
+
+
+def _revision():
+    """Return the git revision of the working copy, if any."""
+    try:
+        return subprocess.check_output(
+            ["git", "describe", "--always", "--dirty"],
+            cwd=os.path.dirname(os.path.abspath(__file__)),
+            stderr=open(os.devnull, "w")).strip() or None
+    except (OSError, subprocess.CalledProcessError):
+        return None
+
+
+def bench_case(case, size, options):
+    """Run the case passed as argument over a fleet of the size passed as
+    argument in the current process, and return the result as a dict.
+    """
+    name, setup, run = case
+
+    env.aws_backend = "fake"
+    env.ec2_region = BENCH_REGION
+    env.aws_fake_latency = 0
+    # Do not depend on the defaults of fabric and mico, which differ.
+    env.parallel = options.workers > 1
+    env.aws_max_workers = options.workers
+    env.loglevel = set(["abort", "error"])
+
+    setup(size, options)
+    seeded = _rss_kb()
+
+    env.aws_fake_latency = options.latency
+    aws_api_calls_reset()
+
+    start = time.time()
+    ret = run(size, options)
+    # As mico does at the end of each command.
+    ec2_tag_flush()
+    wall = time.time() - start
+
+    operations = {}
+    for (service, operation), count in api_calls.items():
+        operations["%s:%s" % (service, operation)] = count
+
+    return {
+        "case": name,
+        "size": size,
+        "workers": max_workers(),
+        "wall": round(wall, 4),
+        "items": len(ret) if isinstance(ret, list) else None,
+        "api_calls": sum(operations.values()),
+        "operations": operations,
+        "seeded_kb": seeded,
+        "peak_kb": resource.getrusage(resource.RUSAGE_SELF).ru_maxrss,
+    }
+
+
+def _bench_child(case, size, options, pipe):
+    try:
+        pipe.send(bench_case(case, size, options))
+    except Exception as e:
+        pipe.send({"case": case[0], "size": size,
+                   "error": "%s: %s" % (e.__class__.__name__, e)})
+    finally:
+        pipe.close()
+
+
+def bench_fork(case, size, options):
+    """Run the case in a new process, so the peak memory of each case is
+    measured apart, and return the result as a dict.
+    """
+    parent, child = multiprocessing.Pipe(duplex=False)
+    process = multiprocessing.Process(target=_bench_child,
+                                      args=(case, size, options, child))
+    process.start()
+    child.close()
+    try:
+        result = parent.recv()
+    except EOFError:
+        result = {"case": case[0], "size": size,
+                  "error": "benchmark process died"}
+    process.join()
+    return result
+
+
+def main(argv=None):
+    cmdopt = argparse.ArgumentParser(
+        description="Benchmark the AWS library of mico at fleet scale.")
+    cmdopt.add_argument("-s", "--sizes", action="store",
+                        default=",".join(map(str, BENCH_SIZES)),
+                        help="comma separated list of fleet sizes (default: %(default)s)")
+    cmdopt.add_argument("-c", "--case", action="append", dest="cases",
+                        choices=[x[0] for x in BENCH_CASES],
+                        help="case to run, can be repeated (default: all)")
+    cmdopt.add_argument("-l", "--latency", action="store", type=float,
+                        default=0.02,
+                        help="seconds of latency of each request (default: %(default)s)")
+    cmdopt.add_argument("-p", "--provision", action="store", type=int,
+                        default=2,
+                        help="instances to provision in the ensure cases (default: %(default)s)")
+    cmdopt.add_argument("-w", "--workers", action="store", type=int,
+                        default=8,
+                        help="threads to fan out AWS requests, 1 to run "
+                             "them serially (default: %(default)s)")
+    cmdopt.add_argument("-L", "--label", action="store", default=None,
+                        help="label of the results, i.e. the release name")
+    cmdopt.add_argument("-o", "--output", action="store", default=None,
+                        help="file to write the results to (default: stdout)")
+    options = cmdopt.parse_args(argv)
+
+    sizes = [int(x) for x in options.sizes.split(",") if x.strip()]
+    cases = [x for x in BENCH_CASES
+             if not options.cases or x[0] in options.cases]
+
+    results = []
+    for case in cases:
+        for size in sizes:
+            result = bench_fork(case, size, options)
+            sys.stderr.write("%-18s %6d %s\n" % (
+                case[0], size, result.get("error", None) or
+                "%.3fs %d calls %d KiB" % (result["wall"], result["api_calls"],
+                                           result["peak_kb"],)))
+            results.append(result)
+
+    report = {
+        "label": options.label,
+        "revision": _revision(),
+        "python": platform.python_version(),
+        "timestamp": time.strftime("%Y-%m-%dT%H:%M:%SZ", time.gmtime()),
+        "latency": options.latency,
+        "provision": options.provision,
+        "workers": options.workers,
+        "concurrent": options.workers > 1,
+        "results": results,
+    }
+
+    if options.output:
+        with open(options.output, "w") as fd:
+            json.dump(report, fd, indent=2, sort_keys=True,
+                      separators=(",", ": "))
+            fd.write("\n")
+    else:
+        json.dump(report, sys.stdout, indent=2, sort_keys=True,
+                      separators=(",", ": "))
+        sys.stdout.write("\n")
+
+    return 1 if [x for x in results if "error" in x] else 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
@@ -0,0 +1,192 @@
+#! /usr/bin/env python
+# -*- encoding: utf-8 -*-
+# vim:fenc=utf-8:
+
+"""The cache module provides a persistent inventory cache for AWS listings,
+stored under the mico cache path (see :func:`mico.path.get_cache_path`).
+
+The cache is disabled by default. To enable it set the ``cache_ttl``
+variable in the environment to the number of seconds that a listing is
+considered fresh, for example::
+
+    mico -e cache_ttl=300 ec2 ls 'web-*'
+
+Setting ``cache_refresh`` to True in the environment (or using the
+``--refresh`` option of mico command line) forces the listings to be
+downloaded again and stored in the cache.
+
+Listings are stored apart for each access key, so switching credentials
+never serves the resources of another account.
+
+The cache is always disabled when using the fake backend (see
+:mod:`mico.lib.aws.fake`), whose resources only live in memory.
+"""
+
+import os
+import time
+import hashlib
+import tempfile
+import threading
+import cPickle as pickle
+from functools import wraps
+
+from boto.connection import AWSAuthConnection
+
+import mico.path
+import mico.output
+from mico.lib.aws.region import aws_region
+from mico.lib.aws.region import aws_regions
+from mico.lib.aws.connection import aws_backend
+
+
+class InventoryCache(object):
+    """Models an on-disk cache of listings of AWS resources, stored per
+    credentials, kind of listing, region and arguments of the listing.
+
+    :type path: str
+    :param path: the path to the folder where cache will live, by default
+        the inventory folder in the mico cache path.
+    """
+    def __init__(self, path=None):
+        self.path = path or os.path.join(mico.path.get_cache_path(), "inventory")
+        self._lock = threading.Lock()
+
+    @staticmethod
+    def _account():
+        """Return a hash of the backend and the access key in use, so the
+        listings of different accounts are never mixed.
+        """
+        return hashlib.sha1("%s:%s" % (
+            aws_backend(),
+            os.environ.get("AWS_ACCESS_KEY_ID", ""),
+        )).hexdigest()[:16]
+
+    def _filename(self, kind, region, args):
+        key = hashlib.sha1(repr(tuple(args))).hexdigest()
+        return os.path.join(self.path, self._account(), region or "global",
+                            "%s-%s" % (kind, key,))
+
+    def get(self, kind, region, args, ttl, connect):
+        """Return the list of objects stored in the cache for the listing
+        or None if the listing is not in the cache or it is older than ttl
+        seconds.
+
+        :type connect: callable
+        :param connect: a function which receive the region and returns the
+            connection to be set in the objects recovered from cache.
+        """
+        _path = self._filename(kind, region, args)
+
+        try:
+            if time.time() - os.path.getmtime(_path) > ttl:
+                return None
+            with open(_path, "rb") as f:
+                unpickler = pickle.Unpickler(f)
+                unpickler.persistent_load = lambda x: connect(region)
+                return unpickler.load()
+        except (OSError, IOError, EOFError, pickle.UnpicklingError):
+            return None
+
+    def set(self, kind, region, args, items):
+        """Store the list of objects passed as argument in the cache. The
+        connections to AWS are not stored, but restored when reading.
+        """
+        _path = self._filename(kind, region, args)
+
+        def _persistent_id(obj):
+            if isinstance(obj, AWSAuthConnection):
+                return "connection"
+            return None
+
+        with self._lock:
+            try:
+                if not os.path.isdir(os.path.dirname(_path)):
+                    os.makedirs(os.path.dirname(_path))
+                fd, _tmp = tempfile.mkstemp(dir=os.path.dirname(_path))
+                with os.fdopen(fd, "wb") as f:
+                    pickler = pickle.Pickler(f, pickle.HIGHEST_PROTOCOL)
+                    pickler.persistent_id = _persistent_id
+                    pickler.dump(items)
+                os.rename(_tmp, _path)
+            except (OSError, IOError, pickle.PicklingError) as e:
+                mico.output.debug("unable to cache %s listing: %s" % (kind, e,))
+
+    def invalidate(self, kind=None, region=None):
+        """Remove the cached listings of the kind and region passed as
+        arguments, or all of them if None, for the credentials in use.
+        """
+        _path = os.path.join(self.path, self._account())
+        with self._lock:
+            for _region in os.listdir(_path) if os.path.isdir(_path) else []:
+                if region is not None and _region != region:
+                    continue
+                for _name in os.listdir(os.path.join(_path, _region)):
+                    if kind is None or _name.startswith("%s-" % kind):
+                        try:
+                            os.unlink(os.path.join(_path, _region, _name))
+                        except OSError:
+                            pass
+
+
+inventory_cache = InventoryCache()
+
+
+def aws_cache_ttl():
+    """Return the time to live of the cached listings, as configured in the
+    ``cache_ttl`` environment variable, or 0 if cache is disabled.
+    """
+    if aws_backend() == "fake":
+        return 0
+    try:
+        return int(env.get("cache_ttl", 0) or 0)
+    except ValueError:
+        return 0
+
+
+def aws_cache_invalidate(*kinds, **kwargs):
+    """Invalidate the cached listings of the kinds passed as arguments in
+    current regions (or in the region passed in keyword argument region).
+    """
+    regions = [kwargs["region"]] if kwargs.get("region", None) else aws_regions()
+    for region in regions:
+        for kind in kinds:
+            inventory_cache.invalidate(kind, region)
+
+
+def aws_cached(kind, connect, regional=True):
+    """Decorator to cache the result of a listing function in the inventory
+    cache. The decorated function must return an iterable of objects, which
+    will be stored as a list.
+
+    :type kind: str
+    :param kind: the kind of the listing, used as part of the key in the
+        cache.
+
+    :type connect: callable
+    :param connect: the connect function for the objects in the listing.
+
+    :type regional: bool
+    :param regional: if set to False, the listing is the same for all
+        regions (i.e. Route53).
+    """
+    def _decorator(fn):
+        @wraps(fn)
+        def _inner(*args):
+            ttl = aws_cache_ttl()
+            if not ttl:
+                return fn(*args)
+
+            region = aws_region() if regional else None
+            items = None
+            if not env.get("cache_refresh", False):
+                items = inventory_cache.get(kind, region, args, ttl, connect)
+
+            if items is None:
+                items = list(fn(*args))
+                inventory_cache.set(kind, region, args, items)
+            else:
+                mico.output.debug("using cached %s listing" % kind)
+
+            return iter(items)
+        return _inner
+    return _decorator
@@ -0,0 +1,628 @@
+#! /usr/bin/env python
+# -*- encoding: utf-8 -*-
+# vim:fenc=utf-8:
+
+"""The connection module keeps a registry of AWS connections, so library
+functions can ask for a connection as many times as they want without
+paying for a new connection (and a new region resolution) each time.
+
+Connections are keyed by service, region and credentials, and they are
+never shared between threads, so functions running under ``@async`` get
+their own connection objects.
+
+Every connection handed out by this module is instrumented to count the
+API calls issued through it, per service and operation, and to retry the
+requests which are throttled by AWS. Throttled requests are retried with
+exponential backoff and jitter, and the rate of requests to the service is
+limited by an adaptive token bucket from then on. The retries can be
+configured using the following variables in the environment:
+
+``retry_attempts``
+    maximum number of attempts for a single request (5 by default).
+
+``retry_budget``
+    maximum number of retries in a run, or in a command when using the
+    mico command line (500 by default). When the budget is exhausted,
+    throttling errors are raised to the caller.
+
+Setting ``profile_api`` in the environment also records the latency and
+the size of the response of every call, see :func:`aws_api_profile`.
+
+Setting ``aws_backend`` to "fake" in the environment makes every
+connection handed out by this module a connection to the in-memory fake
+backend (see :mod:`mico.lib.aws.fake`) instead of to AWS, for example::
+
+    mico -e aws_backend=fake ec2 ls 'web-*'
+
+The module also provides :func:`aws_paginate` to iterate over paginated
+results page by page, instead of download all of them at once. The page
+size can be set using the ``page_size`` variable in the environment.
+"""
+
+import re
+import time
+import random
+import weakref
+import threading
+import itertools
+from functools import wraps
+from functools import partial
+from os import environ as os_environ
+
+from boto.exception import BotoServerError
+
+import mico.output
+from mico import env
+from mico.util.dicts import AttrDict
+
+
+# Error codes used by AWS services when a request is throttled.
+AWS_THROTTLING_ERRORS = (
+    "Throttling",
+    "ThrottlingException",
+    "ThrottledException",
+    "RequestThrottled",
+    "RequestLimitExceeded",
+    "TooManyRequestsException",
+    "PriorRequestNotComplete",
+)
+
+# Base and maximum time in seconds to wait between attempts.
+RETRY_BACKOFF_BASE = 0.5
+RETRY_BACKOFF_MAX = 20.0
+
+
+def _env_int(name, default):
+    """Return the integer value of the environment variable name, or the
+    default value if the variable is not set or it is not an integer.
+    """
+    try:
+        return int(env.get(name, default))
+    except (TypeError, ValueError):
+        return default
+
+
+class ApiCallCounter(object):
+    """Models a thread safe counter of AWS API calls, indexed by service and
+    operation name.
+    """
+    def __init__(self):
+        self._lock = threading.Lock()
+        self._calls = {}
+
+    def add(self, service, operation):
+        with self._lock:
+            key = (service, operation)
+            self._calls[key] = self._calls.get(key, 0) + 1
+
+    def count(self, service=None, operation=None):
+        """Return the number of calls for the service and operation passed
+        as arguments, or the total if both are None.
+        """
+        with self._lock:
+            return sum([v for (s, o), v in self._calls.items()
+                        if (service is None or s == service) and
+                           (operation is None or o == operation)])
+
+    def items(self):
+        with self._lock:
+            return self._calls.items()
+
+    def reset(self):
+        with self._lock:
+            self._calls.clear()
+
+
+api_calls = ApiCallCounter()
+
+
+def _operation_name(service, args, kwargs):
+    """Return the operation name of a call to make_request. Query based APIs
+    receive the action as first argument, while REST based APIs (Route53)
+    receive the HTTP method and path.
+    """
+    if service == "route53":
+        method = args[0] if args else kwargs.get("method")
+        path = args[1] if len(args) > 1 else kwargs.get("path", "")
+        path = re.sub(r"/[A-Z0-9]{8,}", "/*", path.split("?")[0])
+        return "%s %s" % (method, path,)
+    return args[0] if args else kwargs.get("action")
+
+
+class TokenBucket(object):
+    """Models an adaptive token bucket which limits the rate of requests to
+    an AWS service. The bucket does not limit anything until the service
+    throttles a request. Then the rate is set to the half of the observed
+    rate, halved again on each throttled request, and slowly increased on
+    each successful one.
+
+    :type min_rate: float
+    :param min_rate: the minimum rate, in requests per second.
+    """
+    def __init__(self, min_rate=1.0):
+        self._lock = threading.Lock()
+        self.min_rate = min_rate
+        self.rate = None
+        self._tokens = 0.0
+        self._last = time.time()
+        self._window = (time.time(), 0)
+
+    def _observed_rate(self, now):
+        start, count = self._window
+        return count / max(1.0, now - start)
+
+    def acquire(self):
+        """Take a token from the bucket and return the time in seconds that
+        the caller must wait before send the request.
+        """
+        with self._lock:
+            now = time.time()
+            start, count = self._window
+            self._window = (start, count + 1) if now - start < 1.0 else (now, 1)
+
+            if self.rate is None:
+                return 0.0
+
+            self._tokens = min(max(1.0, self.rate),
+                               self._tokens + (now - self._last) * self.rate)
+            self._last = now
+            self._tokens -= 1.0
+            return max(0.0, -self._tokens / self.rate)
+
+    def throttled(self):
+        """Notify the bucket that a request was throttled."""
+        with self._lock:
+            now = time.time()
+            rate = self.rate or self._observed_rate(now)
+            self.rate = max(self.min_rate, rate / 2.0)
+            self._tokens = min(self._tokens, 0.0)
+            self._last = now
+
+    def succeeded(self):
+        """Notify the bucket that a request was successful."""
+        with self._lock:
+            if self.rate is not None:
+                self.rate += 1.0 / self.rate
+
+    def reset(self):
+        """Stop limiting the rate of requests, until the service throttles
+        a request again.
+        """
+        with self._lock:
+            self.rate = None
+            self._tokens = 0.0
+            self._last = time.time()
+            self._window = (time.time(), 0)
+
+
+class RetryStats(object):
+    """Models a thread safe account of the retries and the time spent
+    waiting, because of throttling, per service.
+    """
+    def __init__(self):
+        self._lock = threading.Lock()
+        self._buckets = {}
+        self.reset()
+
+    def bucket(self, service):
+        """Return the token bucket of the service passed as argument."""
+        with self._lock:
+            if service not in self._buckets:
+                self._buckets[service] = TokenBucket()
+            return self._buckets[service]
+
+    def add_retry(self, service, delay):
+        """Account a retry for the service, if the retry budget allows it,
+        and return True, otherwise return False.
+        """
+        budget = _env_int("retry_budget", 500)
+
+        with self._lock:
+            if self.retries >= budget:
+                return False
+            self.retries += 1
+            self.backoff += delay
+            self.services[service] = self.services.get(service, 0) + 1
+            return True
+
+    def add_wait(self, delay):
+        with self._lock:
+            self.waited += delay
+
+    def reset(self):
+        """Reset the counters and the rate of the token buckets, so a burst
+        of throttled requests in a command does not limit the next ones.
+        """
+        with self._lock:
+            for bucket in self._buckets.values():
+                bucket.reset()
+            self.retries = 0
+            self.backoff = 0.0
+            self.waited = 0.0
+            self.services = {}
+
+    def stats(self):
+        with self._lock:
+            return AttrDict(
+                retries=self.retries,
+                backoff=self.backoff,
+                waited=self.waited,
+                services=dict(self.services)
+            )
+
+
+retry_stats = RetryStats()
+
+
+def _percentile(values, percent):
+    """Return the percentile of a sorted list of values, using the nearest
+    rank method.
+    """
+    if not values:
+        return 0.0
+    return values[max(0, min(len(values) - 1,
+                             int(round(percent / 100.0 * len(values))) - 1))]
+
+
+class ApiProfiler(object):
+    """Models a thread safe profile of the AWS API calls, which accounts the
+    latency, the size of the response and the number of retries of each
+    call, per service and operation. The profiler is enabled when the
+    ``profile_api`` variable in the environment is set (the
+    ``--profile-api`` option of mico command line).
+    """
+    def __init__(self):
+        self._lock = threading.Lock()
+        self._calls = {}
+
+    def enabled(self):
+        return bool(env.get("profile_api", None))
+
+    def add(self, service, operation, latency, size, retry=False):
+        with self._lock:
+            entry = self._calls.setdefault((service, operation), {
+                "latencies": [],
+                "bytes": 0,
+                "retries": 0,
+            })
+            entry["latencies"].append(latency)
+            entry["bytes"] += size
+            if retry:
+                entry["retries"] += 1
+
+    def reset(self):
+        with self._lock:
+            self._calls.clear()
+
+    def summary(self):
+        """Return a list of dictionaries with the calls, retries, total,
+        p50 and p99 latency (in seconds) and the bytes received for each
+        service and operation, sorted by total latency.
+        """
+        with self._lock:
+            ret = []
+            for (service, operation), entry in self._calls.items():
+                latencies = sorted(entry["latencies"])
+                ret.append(AttrDict(
+                    service=service,
+                    operation=operation,
+                    calls=len(latencies),
+                    retries=entry["retries"],
+                    total=sum(latencies),
+                    p50=_percentile(latencies, 50),
+                    p99=_percentile(latencies, 99),
+                    bytes=entry["bytes"]
+                ))
+            return sorted(ret, key=lambda x: x.total, reverse=True)
+
+
+api_profiler = ApiProfiler()
+
+
+def _throttling_error(response):
+    """Return the error code of the response passed as argument if the
+    request was throttled, or None otherwise. The body of boto responses
+    is cached once read, so it can be read again by the caller.
+    """
+    if getattr(response, "status", 200) < 400:
+        return None
+    match = re.search(r"<Code>([^<]+)</Code>", response.read() or "")
+    if match and match.group(1) in AWS_THROTTLING_ERRORS:
+        return match.group(1)
+    return None
+
+
+def _throttling_handler(response, attempt, delay):
+    """Handler of the responses for the boto retry loop, which raises the
+    throttled responses as BotoServerError at once. boto retries the 5xx
+    responses (like the RequestLimitExceeded of EC2) by itself, without
+    any backoff between threads, so throttling is left to the caller.
+    """
+    if _throttling_error(response):
+        raise BotoServerError(response.status, response.reason, response.read())
+    return None
+
+
+def aws_instrument(connection, service):
+    """Wrap the make_request method of the connection passed as argument,
+    which is the method used by boto for every API call, to account the
+    calls made through the connection and to retry throttled requests.
+
+    Throttled requests are detected in the response returned by boto, or
+    in the BotoServerError raised for 5xx responses.
+    """
+    make_request = connection.make_request
+    bucket = retry_stats.bucket(service)
+
+    mexe = getattr(connection, "_mexe", None)
+    if mexe is not None:
+        @wraps(mexe)
+        def _mexe(request, sender=None, override_num_retries=None,
+                  retry_handler=None):
+            return mexe(request, sender, override_num_retries,
+                        retry_handler=retry_handler or _throttling_handler)
+        connection._mexe = _mexe
+
+    @wraps(make_request)
+    def _make_request(*args, **kwargs):
+        operation = _operation_name(service, args, kwargs)
+        attempts = max(1, _env_int("retry_attempts", 5))
+
+        for attempt in range(attempts):
+            wait = bucket.acquire()
+            if wait:
+                retry_stats.add_wait(wait)
+                time.sleep(wait)
+
+            api_calls.add(service, operation)
+            start = time.time()
+            try:
+                response = make_request(*args, **kwargs)
+                exception = None
+            except BotoServerError as e:
+                if e.error_code not in AWS_THROTTLING_ERRORS:
+                    raise
+                response = None
+                exception = e
+
+            if api_profiler.enabled():
+                # read the body to account the transfer too, boto caches it.
+                size = len((response.read() if response is not None
+                            else exception.body) or "")
+                api_profiler.add(service, operation, time.time() - start,
+                                 size, retry=attempt > 0)
+
+            if exception is not None:
+                error = exception.error_code
+            else:
+                error = _throttling_error(response)
+            if error is None:
+                bucket.succeeded()
+                return response
+
+            bucket.throttled()
+            delay = random.uniform(0, min(RETRY_BACKOFF_MAX,
+                                          RETRY_BACKOFF_BASE * 2 ** attempt))
+            if attempt == attempts - 1 or \
+                    not retry_stats.add_retry(service, delay):
+                break
+
+            mico.output.debug("%s %s throttled (%s), retry in %.2fs" % (
+                service, operation, error, delay,))
+            time.sleep(delay)
+
+        if exception is not None:
+            raise exception
+        return response
+
+    connection.make_request = _make_request
+    return connection
+
+
+class _Connections(dict):
+    """The connections owned by a thread (a dict can not be weakly
+    referenced, but a subclass can).
+    """
+
+
+class ConnectionPool(object):
+    """Models a registry of reusable connections to AWS services.
+
+    The pool keeps one connection per service, region, credentials and
+    thread, and count how many connections are created and how many
+    times an existent connection is reused. Connections are stored in
+    thread local storage, so the connections of a thread are released as
+    soon as the thread exits.
+    """
+    def __init__(self):
+        self._lock = threading.Lock()
+        self._local = threading.local()
+        self._threads = weakref.WeakValueDictionary()
+        self._serial = itertools.count()
+        self.created = 0
+        self.reused = 0
+
+    @staticmethod
+    def _credentials():
+        return (
+            os_environ.get("AWS_ACCESS_KEY_ID"),
+            os_environ.get("AWS_SECRET_ACCESS_KEY"),
+        )
+
+    def _connections(self):
+        connections = getattr(self._local, "connections", None)
+        if connections is None:
+            connections = self._local.connections = _Connections()
+            with self._lock:
+                self._threads[next(self._serial)] = connections
+        return connections
+
+    def get(self, service, region, factory):
+        """Return a connection for the service and region passed as
+        arguments, creating a new one using factory if there are no
+        connection yet for the current thread.
+
+        :type service: str
+        :param service: the name of the service (i.e. ec2, autoscale...)
+
+        :type region: str
+        :param region: the region name for the connection
+
+        :type factory: callable
+        :param factory: a function which receive the region name and
+            returns a new connection.
+        """
+        key = (aws_backend(), service, region, self._credentials())
+        connections = self._connections()
+
+        if key in connections:
+            with self._lock:
+                self.reused += 1
+            return connections[key]
+
+        connection = connections[key] = aws_instrument(factory(region),
+                                                       service)
+        with self._lock:
+            self.created += 1
+        return connection
+
+    def clear(self):
+        """Drop all the connections in the pool and reset counters."""
+        with self._lock:
+            for connections in self._threads.values():
+                connections.clear()
+            self.created = 0
+            self.reused = 0
+
+    def stats(self):
+        """Return a dictionary with the number of connections created and
+        reused by the pool, and the number of connections alive, owned by
+        threads which are still running.
+        """
+        with self._lock:
+            return AttrDict(
+                created=self.created,
+                reused=self.reused,
+                alive=sum(len(x) for x in self._threads.values())
+            )
+
+
+connection_pool = ConnectionPool()
+
+
+def aws_backend():
+    """Return the name of the backend which serves the AWS requests, as
+    configured in the ``aws_backend`` environment variable: "aws" (by
+    default) or "fake".
+    """
+    return env.get("aws_backend", None) or "aws"
+
+
+def aws_connection(service, region, factory, *args, **kwargs):
+    """Helper to get a pooled connection for the service and region passed
+    as arguments. See :class:`ConnectionPool` for more details.
+
+    If extra arguments are passed, they are passed to factory too, and the
+    connection is created from scratch, without using the pool. Extra
+    arguments are ignored by the fake backend.
+    """
+    if aws_backend() == "fake":
+        from mico.lib.aws.fake import aws_fake_connection
+        return connection_pool.get(service, region,
+                                   partial(aws_fake_connection, service))
+    if args or kwargs:
+        return aws_instrument(factory(region, *args, **kwargs), service)
+    return connection_pool.get(service, region, factory)
+
+
+def aws_connection_stats():
+    """Return the counters of created and reused connections."""
+    return connection_pool.stats()
+
+
+def aws_api_calls(service=None, operation=None):
+    """Return the number of API calls issued to AWS for the service and
+    operation passed as arguments (i.e. "ec2", "DescribeInstances"), or the
+    total number of calls if None.
+    """
+    return api_calls.count(service, operation)
+
+
+def aws_api_calls_reset():
+    """Reset the counters of API calls."""
+    api_calls.reset()
+
+
+def aws_retry_stats():
+    """Return a dictionary with the number of retries of throttled requests,
+    the time spent in backoff between retries, the time spent waiting for
+    the rate limit, and the number of retries per service.
+    """
+    return retry_stats.stats()
+
+
+def aws_retry_stats_reset():
+    """Reset the counters of retries, which also resets the retry budget."""
+    retry_stats.reset()
+
+
+def aws_api_profile():
+    """Return the profile of the API calls issued to AWS since the last
+    reset, see :class:`ApiProfiler`.
+    """
+    return api_profiler.summary()
+
+
+def aws_api_profile_reset():
+    """Reset the profile of API calls."""
+    api_profiler.reset()
+
+
+def aws_page_size(limit):
+    """Return the page size to use in paginated calls, according to the
+    ``page_size`` environment variable, but never greater than limit, which
+    is the maximum allowed by the API.
+    """
+    size = _env_int("page_size", 0)
+    return max(min(5, limit), min(size or limit, limit))
+
+
+def aws_pages(method, size_arg, limit, **kwargs):
+    """Iterate over the pages of a paginated AWS call, like
+    :func:`aws_paginate`, but yielding each page (a ResultSet) as a whole,
+    so callers can process the items of a page together.
+    """
+    kwargs[size_arg] = aws_page_size(limit)
+
+    while True:
+        page = method(**kwargs)
+        yield page
+        token = getattr(page, "next_token", None)
+        if not token:
+            break
+        kwargs["next_token"] = token
+
+
+def aws_paginate(method, size_arg, limit, **kwargs):
+    """Iterate over the results of a paginated AWS call, requesting the next
+    page (using next_token argument) only when the previous one has been
+    consumed. Example::
+
+        for group in aws_paginate(conn.get_all_groups, "max_records", 100):
+            print group.name
+
+    :type method: callable
+    :param method: the boto method to call, which must accept next_token
+        argument and return a ResultSet.
+
+    :type size_arg: str
+    :param size_arg: the name of the argument which sets the page size in
+        method (i.e. max_records or max_results).
+
+    :type limit: int
+    :param limit: the maximum page size allowed by the API.
+    """
+    for page in aws_pages(method, size_arg, limit, **kwargs):
+        for item in page:
+            yield item
+
@@ -11,32 +11,45 @@ Example of usage in host definitions::
     ec2_run('ami-12345')
 """
 
-import time
 from os import environ as os_environ
-from fnmatch import fnmatch
 
 from boto.ec2 import get_region
 from boto.ec2.connection import EC2Connection
+from boto.exception import EC2ResponseError
 
 import mico.output
 from mico.util.dicts import AttrDict
+from mico.util.matcher import GlobMatcher
+from mico.util.workers import imap_unordered
+from mico.lib.aws.region import aws_region
+from mico.lib.aws.region import aws_multiregion
+from mico.lib.aws.connection import aws_connection
+from mico.lib.aws.connection import aws_paginate
+from mico.lib.aws.cache import aws_cached
+from mico.lib.aws.cache import aws_cache_invalidate
+from mico.lib.aws.inventory import aws_inventory
+from mico.lib.aws.inventory import aws_inventory_invalidate
+from mico.lib.aws.ec2.tags import ec2_tag_batch
+from mico.lib.aws.ec2.tags import ec2_tag_flush
+from mico.lib.aws.ec2.tags import ec2_tag_barrier
+from mico.lib.aws.ec2.tags import ec2_tag_immediate
+from mico.lib.aws.ec2.waiter import ec2_wait
 
 class EC2LibraryError(Exception):
     """Model an exception related with EC2 API."""
 
 
-def ec2_connect(region=None):
-    """Helper to connect to Amazon Web Services EC2, using identify provided
-    by environment, as also optional region in arguments.
-    """
-    if not os_environ.get("AWS_ACCESS_KEY_ID", None):
-        raise EC2LibraryError("Environment variable AWS_ACCESS_KEY_ID is not set.")
-    if not os_environ.get("AWS_SECRET_ACCESS_KEY", None):
-        raise EC2LibraryError("Environment variable AWS_SECRET_ACCESS_KEY is not set.")
+# States of the instances which are not terminated yet.
+EC2_ALIVE_STATES = ["pending", "running", "shutting-down", "stopping", "stopped"]
 
-    if not region:
-        region = env.get("ec2_region")
+# Maximum number of instance ids sent in a single bulk state change call.
+EC2_BULK_SIZE = 100
 
+# Maximum number of values sent in a single filter of a describe call.
+EC2_DESCRIBE_SIZE = 200
+
+
+def _ec2_new_connection(region):
     region = get_region(region,
             aws_access_key_id=os_environ.get("AWS_ACCESS_KEY_ID"),
             aws_secret_access_key=os_environ.get("AWS_ACCESS_SECRET_KEY")
@@ -51,28 +64,49 @@ def ec2_connect(region=None):
     return connection
 
 
+def ec2_connect(region=None):
+    """Helper to connect to Amazon Web Services EC2, using identify provided
+    by environment, as also optional region in arguments. Connections are
+    reused from the connection pool when possible.
+    """
+    if not os_environ.get("AWS_ACCESS_KEY_ID", None):
+        raise EC2LibraryError("Environment variable AWS_ACCESS_KEY_ID is not set.")
+    if not os_environ.get("AWS_SECRET_ACCESS_KEY", None):
+        raise EC2LibraryError("Environment variable AWS_SECRET_ACCESS_KEY is not set.")
+
+    if not region:
+        region = aws_region()
+
+    return aws_connection("ec2", region, _ec2_new_connection)
+
+
 def ec2_tag(resource, **kwargs):
-    """Tag a resource with specified tags.
+    """Tag a resource with specified tags. Tags are written in batches
+    (see :mod:`mico.lib.aws.ec2.tags`).
 
     Example::
         tag(instance, Name='example.host')
     """
-    connection = ec2_connect()
-    connection.create_tags([resource.id], kwargs)
-    mico.output.debug("tag instance %s:" % (
+    ec2_tag_batch([resource], kwargs)
+    mico.output.debug("tag instance %s: %s" % (
         resource.id,
         ",".join(map(lambda x: "%s=%s" % x, [x for x in kwargs.iteritems()]))
     ))
 
 
-def ec2_tag_volumes(instance):
+def ec2_tag_volumes(instance, refresh=True):
     """Tag volumes in the instance following a basic notation Name as
     hostname of the instance host and Device to the properly device in
-    the system.
-    """
-    connection = ec2_connect()
+    the system. Tags are written in batches (see
+    :mod:`mico.lib.aws.ec2.tags`).
 
-    _obj = instance.get_attribute("blockDeviceMapping")
+    If refresh is False, the block device mapping already described in
+    the instance object is used, which saves a request per instance.
+    """
+    if refresh:
+        _obj = instance.get_attribute("blockDeviceMapping")
+    else:
+        _obj = {u"blockDeviceMapping": instance.block_device_mapping or {}}
     if u"blockDeviceMapping" in _obj:
         _obj = _obj[u"blockDeviceMapping"]
         for device, obj in _obj.items():
@@ -80,7 +114,8 @@ def ec2_tag_volumes(instance):
                 _d = {"Device": device}
                 if "Name" in instance.tags:
                     _d["Name"] = instance.tags["Name"]
-                connection.create_tags([obj.volume_id], _d)
+                ec2_tag_batch([obj.volume_id], _d,
+                              region=_ec2_instance_region(instance))
 
 
 def ec2_ensure(ami, name=None, address=None, wait_until_running=True,
@@ -175,59 +210,45 @@ def ec2_ensure(ami, name=None, address=None, wait_until_running=True,
     :type volumes: dict
     :param volumes: a dictionary in the form {device: ebs_volume}, where
         device is a string which identify the aws device for the volume (i.e
-        /dev/sdf), and ebs_volume is a volume object created by ebs_ensure.
+        /dev/sdf), and ebs_volume is a volume object created by ebs_ensure,
+        or the spec of a new volume (see
+        :func:`mico.lib.aws.ec2.ebs.ebs_ensure_many`). Volumes are created
+        and attached concurrently.
     """
 
     if not force:
         _obj = ec2_exists({"Name": name})
         if _obj:
-            status = _obj.update()
-            if status != "terminated":
-                mico.output.info("use existent instance: %s [%s]" % (_obj.id, _obj.ip_address or 'no ip found'))
-                if getattr(_obj, "ip_address", None) and _obj.ip_address:
-                    if 'mico' in env.roledefs:
-                        env.roledefs['mico'].append(_obj.ip_address)
-                    else:
-                        env.roledefs['mico'] = [_obj.ip_address]
-                    if 'mico' not in env.roles:
-                        env.roles.append('mico')
-                return _obj
+            if isinstance(_obj, list):
+                mico.output.warn("found %d instances named %s, using %s" % (len(_obj), name, _obj[0].id))
+                _obj = _obj[0]
+            mico.output.info("use existent instance: %s [%s]" % (_obj.id, _obj.ip_address or 'no ip found'))
+            _ec2_add_role(_obj)
+            return _obj
 
     kwargs["disable_api_termination"] = termination_protection
 
     connection = ec2_connect()
     reservation = connection.run_instances(ami, **kwargs)
     instance = reservation.instances[0]
+    aws_cache_invalidate("ec2_list", "ebs_list")
+    aws_inventory_invalidate("instances", "volumes")
 
-    status = instance.update()
-
+    _tags = dict(tags)
     if name is not None:
-        connection.create_tags([instance.id], {"Name": name})
-
-    if tags:
-        connection.create_tags([instance.id], tags)
+        _tags["Name"] = name
+    ec2_tag_batch([instance], _tags, region=_ec2_instance_region(instance))
 
     if not wait_until_running:
         return instance
 
-    while status == 'pending':
-        mico.output.debug("waiting 10 secs for instance initialiation...")
-        time.sleep(10)
-        status = instance.update()
-    time.sleep(2)  # yes... amazon weird behaviour :/
-
-    for device, volume in volumes.items():
-        connection.attach_volume(volume.id, instance.id, device)
-        ec2_tag_volumes(instance)
-        mico.output.info("attach volume %s as device %s at instance %s" % (
-            volume.id,
-            device,
-            instance.id
-        ))
+    ec2_wait([instance], "running")
+    instance.tags.update(_tags)
 
-    if not volumes:
-        # tag only root device
-        ec2_tag_volumes(instance)
+    if volumes:
+        from mico.lib.aws.ec2.ebs import ebs_ensure_many
+        ebs_ensure_many(volumes, instance=instance)
+    ec2_tag_volumes(instance)
 
     if address:
         mico.output.info("associated address %s at instance %s" % (
@@ -235,10 +256,120 @@ def ec2_ensure(ami, name=None, address=None, wait_until_running=True,
             instance.id
         ))
         connection.associate_address(instance.id, address)
-        time.sleep(2)  # amazon needs time to think about how to associate an address.
+        ec2_wait([instance], lambda x: x.ip_address == address)
+        instance.tags.update(_tags)
 
     if getattr(instance, "ip_address", None) and instance.ip_address:
         mico.output.info("created instance: %s as %s [%s]" % (instance.id, instance.instance_type, instance.ip_address))
+        _ec2_add_role(instance)
+    else:
+        mico.output.info("created instance: %s [<unassigned address>]" % (instance.id,))
+
+    return instance
+
+
+def ec2_ensure_many(ami, names, wait_until_running=True, tags={},
+                    force=False, termination_protection=True, **kwargs):
+    """Create a number of EC2 instances which share the same launch
+    parameters, one for each name passed as argument, and return the
+    instances in the same order than names.
+
+    The instances which already exist (by Name tag) are looked up with a
+    single request, and the missing ones are launched with a single
+    RunInstances call. The instances are tagged in batches and waited
+    for together (see :mod:`mico.lib.aws.ec2.waiter`), so the cost of
+    the function barely depends on the number of instances.
+
+    :type ami: string
+    :param ami: An string which contains the AMI identifier for the
+        instances.
+
+    :type names: list of strings
+    :param names: the names of the hosts, which will be used as Name tag
+        of each instance.
+
+    :type wait_until_running: bool
+    :param wait_until_running: when setting to True (the default), thread
+        will be blocked until all the instances are 'running'.
+
+    :type tags: dict
+    :param tags: a dictionary which contains tags for all the instances.
+
+    :type force: bool
+    :param force: if set to True create all the instances, tough some of
+        them already exist.
+
+    :type termination_protection: bool
+    :param termination_protection: set the termination protection of the
+        instances, true by default.
+
+    Other keyword arguments are passed to RunInstances as in
+    :func:`ec2_ensure` (i.e. instance_type, key_name, security_groups,
+    user_data or placement).
+    """
+    _seen = set()
+    names = [x for x in names if not (x in _seen or _seen.add(x))]
+    region = aws_region()
+    connection = ec2_connect()
+    found = {}
+
+    if not force and names:
+        ec2_tag_barrier(region)
+        for i in range(0, len(names), EC2_DESCRIBE_SIZE):
+            filters = {
+                "tag:Name": names[i:i + EC2_DESCRIBE_SIZE],
+                "instance-state-name": EC2_ALIVE_STATES,
+            }
+            for reservation in aws_paginate(connection.get_all_reservations,
+                    "max_results", 1000, filters=filters):
+                for instance in reservation.instances:
+                    found.setdefault(instance.tags.get("Name"), []).append(instance)
+
+    ret = {}
+    for name in names:
+        if name in found:
+            if len(found[name]) > 1:
+                mico.output.warn("found %d instances named %s, using %s" % (len(found[name]), name, found[name][0].id))
+            ret[name] = found[name][0]
+            mico.output.info("use existent instance: %s [%s]" % (ret[name].id, ret[name].ip_address or 'no ip found'))
+
+    missing = [x for x in names if x not in ret]
+    created = []
+
+    if missing:
+        kwargs["disable_api_termination"] = termination_protection
+        kwargs["min_count"] = kwargs["max_count"] = len(missing)
+
+        reservation = connection.run_instances(ami, **kwargs)
+        created = sorted(reservation.instances,
+                         key=lambda x: int(x.ami_launch_index or 0))
+        aws_cache_invalidate("ec2_list", "ebs_list")
+        aws_inventory_invalidate("instances", "volumes")
+
+        ec2_tag_batch(created, tags, region=region)
+        for name, instance in zip(missing, created):
+            ec2_tag_batch([instance], {"Name": name}, region=region)
+            ret[name] = instance
+
+        if wait_until_running:
+            ec2_wait(created, "running")
+            for name, instance in zip(missing, created):
+                instance.tags.update(tags)
+                instance.tags["Name"] = name
+                ec2_tag_volumes(instance, refresh=False)
+
+    for name in names:
+        instance = ret[name]
+        if instance in created:
+            mico.output.info("created instance: %s as %s [%s]" % (instance.id, instance.instance_type, instance.ip_address or "<unassigned address>"))
+        _ec2_add_role(instance)
+
+    return [ret[x] for x in names]
+
+
+def _ec2_add_role(instance):
+    """Add the IP address of the instance, if any, to the mico role."""
+    if getattr(instance, "ip_address", None) and instance.ip_address:
         if 'mico' in env.roledefs:
             env.roledefs['mico'].append(instance.ip_address)
         else:
@@ -247,25 +378,20 @@ def ec2_ensure(ami, name=None, address=None, wait_until_running=True,
         if 'mico' not in env.roles:
             env.roles.append('mico')
 
-    else:
-        mico.output.info("created instance: %s [<unassigned address>]" % (instance.id,))
-
-    time.sleep(2)  # yes... another amazon weird behaviour :/
-
-    return instance
-
 
 def ec2_exists(tags={}):
     """Returns if tagged instance already exists, if exists return the object,
-    otherwise returns None.
+    otherwise returns None. Terminated instances are discarded by EC2, so
+    only one DescribeInstances call is issued.
     """
+    ec2_tag_barrier(aws_region(), tags, "i-")
     connection = ec2_connect()
-    ret = []
 
-    for reservation in connection.get_all_instances(None, dict(map(lambda (x, y): ("tag:%s" % x, y), tags.items()))):
-        for instance in reservation.instances:
-            if instance.update() != "terminated":
-                ret.append(instance)
+    filters = dict(map(lambda (x, y): ("tag:%s" % x, y), tags.items()))
+    filters["instance-state-name"] = EC2_ALIVE_STATES
+
+    ret = [i for r in connection.get_all_instances(filters=filters)
+             for i in r.instances]
 
     if len(ret) == 1:
         return ret[0]
@@ -273,41 +399,152 @@ def ec2_exists(tags={}):
         return ret
 
 
+# DescribeInstances filters for each kind of pattern allowed in ec2_list.
+EC2_LIST_FILTERS = {
+    "name": "tag:Name",
+    "ip": "ip-address",
+    "sec": "instance.group-name",
+}
+
+
+def _ec2_parse_pattern(arg):
+    """Split a pattern for :func:`ec2_list` in a tuple (kind, glob), where
+    kind is one of "ip", "sec" or "name".
+    """
+    if arg.startswith("ip:"):
+        return ("ip", arg[3:])
+    elif arg.startswith("sec:"):
+        return ("sec", arg[4:])
+    elif arg.startswith("tag:"):
+        return ("name", arg[4:])
+    else:
+        return ("name", arg)
+
+
+def _ec2_list_queries(args):
+    """Translate patterns for :func:`ec2_list` into a list of tuples (kind,
+    filters) to be used in DescribeInstances calls. If some pattern cannot
+    be expressed as EC2 filter (EC2 only understand * and ? wildcards), then
+    returns a unique query with kind None, which means that patterns must
+    be matched in the client side.
+    """
+    _kinds = []
+    _patterns = {}
+
+    for arg in args:
+        kind, pattern = _ec2_parse_pattern(arg)
+        if "[" in pattern or "\\" in pattern:
+            return [(None, {"instance-state-name": EC2_ALIVE_STATES})]
+        if kind not in _patterns:
+            _kinds.append(kind)
+            _patterns[kind] = []
+        _patterns[kind].append(pattern)
+
+    return [(kind, {
+                "instance-state-name": EC2_ALIVE_STATES,
+                EC2_LIST_FILTERS[kind]: _patterns[kind],
+            }) for kind in _kinds]
+
+
+def _ec2_list_matchers(args):
+    """Compile patterns for :func:`ec2_list` into a list of tuples (kind,
+    matcher), one for each kind of pattern, in the same order than kinds
+    appear in patterns.
+    """
+    _kinds = []
+    _patterns = {}
+
+    for arg in args:
+        kind, pattern = _ec2_parse_pattern(arg)
+        if kind not in _patterns:
+            _kinds.append(kind)
+            _patterns[kind] = []
+        _patterns[kind].append(pattern)
+
+    return [(kind, GlobMatcher(_patterns[kind])) for kind in _kinds]
+
+
+def _ec2_match(instance, kind, matcher):
+    """Return True if the instance matches the matcher of the specified
+    kind in the client side.
+    """
+    if kind == "ip":
+        return matcher.match(instance.ip_address)
+    elif kind == "sec":
+        return any(map(lambda x: matcher.match(x.name), instance.groups))
+    else:
+        return matcher.match(instance.tags.get("Name", None))
+
+
+def _ec2_list_match(instances, args):
+    """Filter instances matching patterns for :func:`ec2_list` in the
+    client side. Each instance is yielded once, even if it matches many
+    patterns.
+    """
+    matchers = _ec2_list_matchers(args)
+
+    for instance in instances:
+        if instance.state == "terminated":
+            continue
+        for kind, matcher in matchers:
+            if _ec2_match(instance, kind, matcher):
+                yield _ec2_set_name(instance, kind)
+                break
+
+
+def _ec2_set_name(instance, kind):
+    instance.name = instance.ip_address or "pending"
+    if kind != "ip" and "Name" in instance.tags:
+        instance.name = instance.tags["Name"]
+    return instance
+
+
+@aws_multiregion
+@aws_cached("ec2_list", ec2_connect)
 def ec2_list(*args):
     """List instances filtering with tag name, provided in arguments. Glob
     expressions are allowed in filters as multiple filters too, for
     example::
 
         ec2_list('host-*', '*database*')
+
+    Patterns prefixed by ``ip:`` are matched against the public IP address
+    of the instance, and patterns prefixed by ``sec:`` against the names of
+    the security groups of the instance. Whenever is possible, patterns are
+    sent to EC2 as filters, so only the matching instances are downloaded.
+    Instances are downloaded page by page, and yielded as each page
+    arrives. If the instances are already loaded in the inventory (see
+    :mod:`mico.lib.aws.inventory`) no request is sent to EC2.
     """
-    conn = ec2_connect()
     args = args or ('*',)
+    ec2_tag_barrier(aws_region())
+    inventory = aws_inventory()
+
+    if inventory.loaded("instances"):
+        for instance in _ec2_list_match(inventory.instances(), args):
+            yield instance
+        return
+
+    conn = ec2_connect()
+    seen = set()
+
+    for kind, filters in _ec2_list_queries(args):
+        reservations = aws_paginate(conn.get_all_reservations,
+                                    "max_results", 1000, filters=filters)
+        instances = (i for r in reservations for i in r.instances)
+        if kind is not None:
+            instances = (_ec2_set_name(i, kind) for i in instances
+                         if i.state != "terminated")
+        else:
+            instances = _ec2_list_match(instances, args)
+
+        for instance in instances:
+            if instance.id not in seen:
+                seen.add(instance.id)
+                yield instance
 
-    for reservation in conn.get_all_instances():
-        for instance in reservation.instances:
-            if instance.state == "terminated":
-                continue
-            instance.name = instance.ip_address or "pending"
-            for arg in args:
-                if arg.startswith("ip:"):
-                    arg = arg[3:]
-                    if instance.ip_address and fnmatch(instance.ip_address, arg):
-                        yield instance
-                elif arg.startswith("sec:"):
-                    arg = arg[4:]
-                    for group in map(lambda x: x.name, instance.groups):
-                        if fnmatch(group, arg):
-                            if "Name" in instance.tags:
-                                instance.name = instance.tags["Name"]
-                            yield instance
-                elif "Name" in instance.tags:
-                    if arg.startswith("tag:"):
-                        arg = arg[4:]
-
-                    if fnmatch(instance.tags["Name"], arg):
-                        instance.name = instance.tags["Name"]
-                        yield instance
 
+@aws_multiregion
 def ec2_events():
     """Return pending events in EC2"""
     conn = ec2_connect()
@@ -326,6 +563,157 @@ def ec2_events():
                    l.append(ev)
     return l
 
+
+def _ec2_get_instances(instance_ids, region=None):
+    """Return a dictionary with the instances which ids are passed as
+    argument, indexed by id. Instances are taken from the inventory if it
+    is already loaded, otherwise they are described in chunks of
+    :data:`EC2_DESCRIBE_SIZE` ids, and the chunks run concurrently.
+    Instances which do not exist are not included in the result.
+    """
+    region = region or aws_region()
+    instance_ids = list(set(instance_ids))
+    ec2_tag_barrier(region)
+    inventory = aws_inventory(region)
+
+    if inventory.loaded("instances"):
+        ret = {}
+        for instance_id in instance_ids:
+            instance = inventory.instance(instance_id)
+            if instance is not None:
+                ret[instance_id] = instance
+        return ret
+
+    def _describe(chunk):
+        conn = ec2_connect(region)
+        reservations = aws_paginate(conn.get_all_reservations, "max_results",
+                                    1000, filters={"instance-id": list(chunk)})
+        return [i for r in reservations for i in r.instances]
+
+    chunks = [tuple(instance_ids[i:i + EC2_DESCRIBE_SIZE])
+              for i in range(0, len(instance_ids), EC2_DESCRIBE_SIZE)]
+
+    ret = {}
+    for chunk, instances in imap_unordered(_describe, chunks):
+        for instance in instances:
+            ret[instance.id] = instance
+    return ret
+
+
+def _ec2_instance_region(instance):
+    """Return the region name of the instance passed as argument."""
+    if getattr(instance, "region_name", None):
+        return instance.region_name
+    if getattr(instance, "region", None) is not None:
+        return instance.region.name
+    return aws_region()
+
+
+def _ec2_bulk(action, instances, prepare=None, **kwargs):
+    """Run the bulk action passed as argument (i.e. "stop_instances") over
+    the instances, grouped by region in chunks of :data:`EC2_BULK_SIZE`
+    ids, and run the chunks concurrently. Yields tuples (instance, error)
+    as soon as each chunk is done, where error is None on success.
+
+    If a bulk call fails, the instances of the chunk are retried one by one,
+    so errors are reported only for the instances which actually fail.
+
+    :type prepare: callable
+    :param prepare: optional function which receive the connection and an
+        instance, called for each instance before the bulk call.
+    """
+    regions = {}
+    for instance in instances:
+        regions.setdefault(_ec2_instance_region(instance), []).append(instance)
+
+    chunks = []
+    for region, _instances in regions.items():
+        for i in range(0, len(_instances), EC2_BULK_SIZE):
+            chunks.append((region, tuple(_instances[i:i + EC2_BULK_SIZE])))
+
+    def _run(chunk):
+        region, _instances = chunk
+        conn = ec2_connect(region)
+        method = getattr(conn, action)
+        ret = []
+        ready = []
+
+        for instance in _instances:
+            try:
+                if prepare is not None:
+                    prepare(conn, instance)
+                ready.append(instance)
+            except EC2ResponseError as e:
+                ret.append((instance, e))
+
+        if not ready:
+            return ret
+
+        try:
+            method([x.id for x in ready], **kwargs)
+            return ret + [(x, None) for x in ready]
+        except EC2ResponseError as e:
+            if len(ready) == 1:
+                return ret + [(ready[0], e)]
+
+        for instance in ready:
+            try:
+                method([instance.id], **kwargs)
+                ret.append((instance, None))
+            except EC2ResponseError as e:
+                ret.append((instance, e))
+        return ret
+
+    try:
+        for chunk, results in imap_unordered(_run, chunks):
+            for result in results:
+                yield result
+    finally:
+        for region in regions:
+            aws_cache_invalidate("ec2_list", "ebs_list", region=region)
+            aws_inventory_invalidate("instances", "volumes", region=region)
+
+
+def ec2_stop(instances, force=False):
+    """Stop the instances passed as argument using bulk calls. Yields tuples
+    (instance, error) for each instance, where error is None on success.
+    """
+    return _ec2_bulk("stop_instances", instances, force=force)
+
+
+def ec2_start(instances):
+    """Start the instances passed as argument using bulk calls. Yields
+    tuples (instance, error) for each instance, where error is None on
+    success.
+    """
+    return _ec2_bulk("start_instances", instances)
+
+
+def ec2_reboot(instances):
+    """Reboot the instances passed as argument using bulk calls. Yields
+    tuples (instance, error) for each instance, where error is None on
+    success.
+    """
+    return _ec2_bulk("reboot_instances", instances)
+
+
+def ec2_terminate(instances, force=False):
+    """Terminate the instances passed as argument using bulk calls. Yields
+    tuples (instance, error) for each instance, where error is None on
+    success.
+
+    :type force: bool
+    :param force: if True, disable the termination protection of the
+        instances before terminate them.
+    """
+    def _disable_protection(conn, instance):
+        conn.modify_instance_attribute(instance.id, "disableApiTermination", False)
+        mico.output.debug("Disabling termination protection for instance %s (%s)"
+                          % (instance.tags.get("Name", instance.id), instance.id,))
+
+    return _ec2_bulk("terminate_instances", instances,
+                     prepare=_disable_protection if force else None)
+
 ec2_launch = ec2_create = ec2_run = ec2_ensure
 
 from mico.lib.aws.ec2.sg import *
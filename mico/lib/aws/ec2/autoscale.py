@@ -8,7 +8,6 @@ techniques.
 
 import time
 from os import environ as os_environ
-from fnmatch import fnmatch
 
 import boto.ec2.autoscale
 from boto.ec2.securitygroup import SecurityGroup
@@ -19,8 +18,21 @@ from boto.ec2.autoscale import ScalingPolicy
 from boto.ec2.autoscale import Tag
 
 import mico.output
+from mico.util.matcher import GlobMatcher
+from mico.util.workers import imap_unordered
+from mico.lib.aws.region import aws_region
+from mico.lib.aws.region import aws_regions
+from mico.lib.aws.region import aws_multiregion
+from mico.lib.aws.connection import aws_connection
+from mico.lib.aws.connection import aws_paginate
+from mico.lib.aws.connection import aws_page_size
+from mico.lib.aws.cache import aws_cached
+from mico.lib.aws.cache import aws_cache_invalidate
+from mico.lib.aws.inventory import aws_inventory
+from mico.lib.aws.inventory import aws_inventory_invalidate
 from mico.lib.aws.ec2 import EC2LibraryError
 from mico.lib.aws.ec2 import ec2_connect
+from mico.lib.aws.ec2 import _ec2_get_instances
 from mico.lib.aws.ec2.cw import cw_connect
 from mico.lib.aws.ec2.cw import _cw_define
 from mico.lib.aws.ec2.cw import cw_exists
@@ -33,18 +45,7 @@ def _as_get_timestamp():
     return _as_get_timestamp._timestamp
 
 
-def as_connect(region=None, *args, **kwargs):
-    """Helper to connect to Amazon Web Services EC2, using identify provided
-    by environment, as also optional region in arguments.
-    """
-    if not os_environ.get("AWS_ACCESS_KEY_ID", None):
-        raise EC2LibraryError("Environment variable AWS_ACCESS_KEY_ID is not set.")
-    if not os_environ.get("AWS_SECRET_ACCESS_KEY", None):
-        raise EC2LibraryError("Environment variable AWS_SECRET_ACCESS_KEY is not set.")
-
-    if not region:
-        region = env.get("ec2_region")
-
+def _as_new_connection(region, *args, **kwargs):
     for reg in boto.ec2.autoscale.regions():
         if reg.name == region:
             region = reg
@@ -60,6 +61,22 @@ def as_connect(region=None, *args, **kwargs):
     return connection
 
 
+def as_connect(region=None, *args, **kwargs):
+    """Helper to connect to Amazon Web Services EC2, using identify provided
+    by environment, as also optional region in arguments. Connections
+    without extra arguments are reused from the connection pool.
+    """
+    if not os_environ.get("AWS_ACCESS_KEY_ID", None):
+        raise EC2LibraryError("Environment variable AWS_ACCESS_KEY_ID is not set.")
+    if not os_environ.get("AWS_SECRET_ACCESS_KEY", None):
+        raise EC2LibraryError("Environment variable AWS_SECRET_ACCESS_KEY is not set.")
+
+    if not region:
+        region = aws_region()
+
+    return aws_connection("autoscale", region, _as_new_connection, *args, **kwargs)
+
+
 def as_config_exists(name):
     """Return the instance config with specific name."""
     connection = as_connect()
@@ -156,6 +173,8 @@ def as_pause(group):
 
     as_con = as_connect()
     _x = as_con.suspend_processes(group.name)
+    aws_cache_invalidate("as_list")
+    aws_inventory_invalidate("autoscaling_groups")
 
     mico.output.info("paused autoscaling group %s" % group.name)
 
@@ -171,6 +190,8 @@ def as_resume(group):
 
     as_con = as_connect()
     _x = as_con.resume_processes(group.name)
+    aws_cache_invalidate("as_list")
+    aws_inventory_invalidate("autoscaling_groups")
 
     mico.output.info("resume autoscaling group %s" % group.name)
 
@@ -190,6 +211,8 @@ def as_resize(group, size):
     as_con = as_connect()
     old_capacity = group.desired_capacity
     _x = as_con.set_desired_capacity(group.name, size)
+    aws_cache_invalidate("as_list")
+    aws_inventory_invalidate("autoscaling_groups")
 
     mico.output.info("changing autoscaling group %s desired capacity from %d to %d" % (group.name, old_capacity, size))
 
@@ -292,6 +315,8 @@ def as_ensure(
                           max_size=max_size,
                           desired_capacity=desired_size)
     connection.create_auto_scaling_group(ag)
+    aws_cache_invalidate("as_list")
+    aws_inventory_invalidate("autoscaling_groups")
     mico.output.info("created new autoscaling group: %s" % ag_name)
 
     as_tag = Tag(key='Name', value="%s" % name, propagate_at_launch=True, resource_id=ag_name)
@@ -299,12 +324,37 @@ def as_ensure(
     # Add the tag to the autoscale group
     connection.create_or_update_tags([as_tag])
 
-    cw_connection = cw_connect()
+    region = aws_region()
+    _events = []
+    _policies = {}
+
     for condition, actions in events:
         if not isinstance(actions, list):
             actions = [actions]
-
+        _events.append((condition, actions))
+        for action in actions:
+            _policies.setdefault(action["name"], action)
+
+    def _create_policy(name):
+        policy = ScalingPolicy(_policies[name]["name"], as_name=ag_name,
+                               **_policies[name])
+        as_connect(region).create_scaling_policy(policy)
+
+    for name, _ in imap_unordered(_create_policy, _policies.keys()):
+        mico.output.info("create policy %s" % name)
+
+    # PutScalingPolicy does not return the policy, so all the ARNs of the
+    # group are resolved at once.
+    _arns = {}
+    if _policies:
+        for policy in aws_paginate(connection.get_all_policies, "max_records",
+                                   100, as_group=ag_name):
+            _arns[policy.name] = policy.policy_arn
+
+    _alarms = []
+    for condition, actions in _events:
         condition.dimensions = {"AutoScalingGroupName": ag_name}
+        condition.name = "%s-%s" % (condition.name, _as_get_timestamp())
 
         # XXX: boto does not handle very well the alarm_actions list when the
         # same connection is used for two different cloudwatch alarms, so the
@@ -313,16 +363,14 @@ def as_ensure(
         condition.alarm_actions = []
 
         for action in actions:
-            policy = ScalingPolicy(action["name"], as_name=ag_name, **action)
-            mico.output.info("create policy %s" % policy.name)
-            connection.create_scaling_policy(policy)
+            condition.add_alarm_action(_arns[action["name"]])
+            mico.output.debug("add new alarm for condition %s: %s" % (condition.name, action["name"]))
+        _alarms.append(condition)
 
-            action = connection.get_all_policies(as_group=ag_name, policy_names=[action["name"]])[0]
-            condition.name = "%s-%s" % (condition.name, _as_get_timestamp())
-            condition.add_alarm_action(action.policy_arn)
-            mico.output.debug("add new alarm for condition %s: %s" % (condition.name, action.name))
+    def _create_alarm(condition):
+        cw_connect(region).create_alarm(condition)
 
-        cw_connection.create_alarm(condition)
+    for condition, _ in imap_unordered(_create_alarm, _alarms):
         mico.output.info("create alarm %s" % condition.name)
     return ag
 
@@ -400,6 +448,8 @@ def as_delete(name, force=False):
     """
     conn = as_connect()
     _x = conn.delete_auto_scaling_group(name, force)
+    aws_cache_invalidate("as_list")
+    aws_inventory_invalidate("autoscaling_groups")
     mico.output.info("Delete autoscaling group: %s" % name)
     return _x
 
@@ -432,7 +482,8 @@ def as_delete_config(name):
 
 
 def as_activity(name, max_records=None):
-    """Get the scaling activity for an autoscale group
+    """Get the scaling activity for an autoscale group. Activities are
+    downloaded page by page, and yielded as each page arrives.
 
     :type name: str
     :param name: the name of the autoscale group
@@ -442,15 +493,29 @@ def as_activity(name, max_records=None):
         default) to get all of them.
     """
 
-    def _set_activity_name(activity):
-        activity.name = activity.group_name
-
-        return activity
-
     conn = as_connect()
-    return map(_set_activity_name, conn.get_all_activities(name, max_records))
-
-
+    count = 0
+    token = None
+
+    # The size of each page is capped to the records left, so no page is
+    # requested once max_records are read.
+    while max_records is None or count < max_records:
+        limit = 100 if max_records is None else min(100, max_records - count)
+        page = conn.get_all_activities(name, max_records=aws_page_size(limit),
+                                       next_token=token)
+        for activity in page:
+            if max_records is not None and count >= max_records:
+                break
+            count += 1
+            activity.name = activity.group_name
+            yield activity
+        token = getattr(page, "next_token", None)
+        if not token:
+            break
+
+
+@aws_multiregion
+@aws_cached("as_list", as_connect)
 def as_list(*args):
     """List autoscaling groups filtering by autoscale name, provided as
     argument. Glob expressiosn are allowed in filters as multiple filtes
@@ -458,16 +523,15 @@ def as_list(*args):
 
         as_list('apaches-*')
     """
-    args = args or ('*',)
+    matcher = GlobMatcher(args or ('*',))
     conn = as_connect()
 
-    for arg in args:
-        for group in conn.get_all_groups():
-            if group.suspended_processes:
-                group.paused = True
-            if fnmatch(group.name, arg):
-                group.total_instances = len(group.instances)
-                yield group
+    for group in aws_paginate(conn.get_all_groups, "max_records", 100):
+        if group.suspended_processes:
+            group.paused = True
+        if matcher.match(group.name):
+            group.total_instances = len(group.instances)
+            yield group
 
 
 def as_list_policies(*args):
@@ -477,13 +541,12 @@ def as_list_policies(*args):
 
         as_list_policies('apaches-*')
     """
-    args = args or ('*',)
+    matcher = GlobMatcher(args or ('*',))
     conn = as_connect()
 
-    for arg in args:
-        for policy in conn.get_all_policies():
-            if fnmatch(policy.name, arg):
-                yield policy
+    for policy in aws_paginate(conn.get_all_policies, "max_records", 100):
+        if matcher.match(policy.name):
+            yield policy
 
 
 def as_list_alarms(*args):
@@ -492,16 +555,25 @@ def as_list_alarms(*args):
     example::
 
         as_list_alarms('apaches-*')
+
+    The alarms are described together, in batches, once all the policies
+    are listed.
     """
-    args = args or ('*',)
+    matcher = GlobMatcher(args or ('*',))
+    names = []
+    seen = set()
+
+    for policy in as_list_policies('*'):
+        for alarm in policy.alarms:
+            if alarm.name not in seen and matcher.match(alarm.name):
+                seen.add(alarm.name)
+                names.append(alarm.name)
 
-    for arg in args:
-        for policy in as_list_policies('*'):
-            for alarm in policy.alarms:
-                if fnmatch(alarm.name, arg):
-                    cw_alarm = cw_exists(alarm.name)[0]
-                    cw_alarm.name = alarm.name
-                    yield cw_alarm
+    alarms = dict([(x.name, x) for x in cw_exists(names)]) if names else {}
+
+    for name in names:
+        if name in alarms:
+            yield alarms[name]
 
 
 def as_list_instances(*args):
@@ -509,14 +581,37 @@ def as_list_instances(*args):
     autoscaling group passed as argument. For example::
 
         as_list_instances('apaches-*')
+
+    The autoscaling groups of each region are taken from the inventory
+    (see :mod:`mico.lib.aws.inventory`), and the instances of all the
+    groups are described together, using as few calls as possible (see
+    :func:`mico.lib.aws.ec2._ec2_get_instances`), or taken from the
+    inventory too if they are already loaded.
     """
-    for ag in as_list(*args):
-        for instance in ag.instances:
-            res = ec2_connect().get_all_instances([instance.instance_id])
-            for insobj in [i for r in res for i in r.instances]:
-                insobj.autoscaling_group = ag.name
-                insobj.launch_config_name = instance.launch_config_name
-                if "Name" in insobj.tags:
-                    insobj.name = insobj.tags["Name"]
-                yield insobj
+    matcher = GlobMatcher(args or ('*',))
+
+    def _list(region):
+        inventory = aws_inventory(region)
+        members = [(ag, instance)
+                   for ag in inventory.autoscaling_groups()
+                   if matcher.match(ag.name)
+                   for instance in ag.instances]
+        instances = _ec2_get_instances([x.instance_id for _, x in members],
+                                       region)
+        ret = []
+        for ag, instance in members:
+            insobj = instances.get(instance.instance_id, None)
+            if insobj is None:
+                continue
+            insobj.autoscaling_group = ag.name
+            insobj.launch_config_name = instance.launch_config_name
+            if "Name" in insobj.tags:
+                insobj.name = insobj.tags["Name"]
+            ret.append(insobj)
+        return ret
+
+    regions = [x or aws_region() for x in aws_regions()]
+    for _, instances in imap_unordered(_list, regions):
+        for insobj in instances:
+            yield insobj
 
@@ -11,6 +11,9 @@ from boto.ec2.cloudwatch import CloudWatchConnection
 from boto.ec2.cloudwatch import MetricAlarm
 
 import mico.output
+from mico.lib.aws.region import aws_region
+from mico.lib.aws.connection import aws_connection
+from mico.lib.aws.connection import aws_paginate
 from mico.lib.aws.ec2 import EC2LibraryError
 
 import boto.ec2.cloudwatch
@@ -18,18 +21,10 @@ import boto.ec2.cloudwatch
 from mico import env
 
 
-def cw_connect(region=None, *args, **kwargs):
-    """Helper to connect to Amazon Web Services EC2, using identify provided
-    by environment, as also optional region in arguments.
-    """
-    if not os_environ.get("AWS_ACCESS_KEY_ID", None):
-        raise EC2LibraryError("Environment variable AWS_ACCESS_KEY_ID is not set.")
-    if not os_environ.get("AWS_SECRET_ACCESS_KEY", None):
-        raise EC2LibraryError("Environment variable AWS_SECRET_ACCESS_KEY is not set.")
-
-    if not region:
-        region = env.get("ec2_region")
+# Maximum number of alarm names sent in a single DescribeAlarms call.
+CW_DESCRIBE_SIZE = 100
 
+def _cw_new_connection(region):
     for reg in boto.ec2.cloudwatch.regions():
         if reg.name == region:
             region = reg
@@ -43,13 +38,35 @@ def cw_connect(region=None, *args, **kwargs):
     return connection
 
 
+def cw_connect(region=None, *args, **kwargs):
+    """Helper to connect to Amazon Web Services EC2, using identify provided
+    by environment, as also optional region in arguments. Connections are
+    reused from the connection pool when possible.
+    """
+    if not os_environ.get("AWS_ACCESS_KEY_ID", None):
+        raise EC2LibraryError("Environment variable AWS_ACCESS_KEY_ID is not set.")
+    if not os_environ.get("AWS_SECRET_ACCESS_KEY", None):
+        raise EC2LibraryError("Environment variable AWS_SECRET_ACCESS_KEY is not set.")
+
+    if not region:
+        region = aws_region()
+
+    return aws_connection("cloudwatch", region, _cw_new_connection)
+
+
 def cw_exists(name):
-    """Return the metric which match with specific name"""
+    """Return the metric which match with specific name. If a list of names
+    is passed, the alarms are described in batches of
+    :data:`CW_DESCRIBE_SIZE` names.
+    """
     connection = cw_connect()
-    if isinstance(name, list):
-        return connection.describe_alarms(alarm_names=name)
-    else:
-        return connection.describe_alarms(alarm_names=[name])
+    names = name if isinstance(name, list) else [name]
+    ret = []
+
+    for i in range(0, len(names), CW_DESCRIBE_SIZE):
+        ret.extend(aws_paginate(connection.describe_alarms, "max_records", 100,
+                                alarm_names=names[i:i + CW_DESCRIBE_SIZE]))
+    return ret
 
 
 def _cw_define(name, alarm_actions=[], *args, **kwargs):
@@ -5,14 +5,29 @@
 """The ec2.ebs library provides methods to work with AWS EC2 EBS volumes.
 """
 
-import time
-from fnmatch import fnmatch
+from functools import partial
+
+from boto.ec2.volume import Volume
 
 import mico.output
+from mico.util.matcher import GlobMatcher
+from mico.util.workers import imap_unordered
 
 from mico.lib.aws.ec2 import ec2_connect
 from mico.lib.aws.ec2 import ec2_tag_volumes
+from mico.lib.aws.ec2 import ec2_tag_batch
+from mico.lib.aws.ec2 import ec2_tag_barrier
+from mico.lib.aws.ec2 import ec2_wait
 from mico.lib.aws.ec2 import EC2LibraryError
+from mico.lib.aws.ec2 import EC2_DESCRIBE_SIZE
+from mico.lib.aws.ec2 import _ec2_get_instances
+from mico.lib.aws.region import aws_region
+from mico.lib.aws.region import aws_multiregion
+from mico.lib.aws.connection import aws_pages
+from mico.lib.aws.cache import aws_cached
+from mico.lib.aws.cache import aws_cache_invalidate
+from mico.lib.aws.inventory import aws_inventory
+from mico.lib.aws.inventory import aws_inventory_invalidate
 
 
 def ebs_ensure(size, zone=None, instance=None, device=None, tags={},
@@ -74,21 +89,23 @@ def ebs_ensure(size, zone=None, instance=None, device=None, tags={},
     connection = ec2_connect()
 
     _obj = connection.create_volume(size, zone, **kwargs)
+    aws_cache_invalidate("ebs_list")
+    aws_inventory_invalidate("volumes")
     mico.output.info("create volume: %s (size=%s, zone=%s)" % (
         _obj.id,
         size,
         zone
     ))
 
-    while _obj.status != "available":
-        time.sleep(1)
-        _obj.update()
+    ec2_wait([_obj], "available")
 
     if tags:
-        connection.create_tags([_obj.id], tags)
+        ec2_tag_batch([_obj], tags)
 
     if device and instance:
         connection.attach_volume(_obj.id, instance.id, device)
+        aws_inventory_invalidate("instances", "volumes")
+        ec2_wait([_obj], lambda x: x.attach_data.status == "attached")
         ec2_tag_volumes(instance)
         mico.output.info("attach volume %s as device %s at instance %s" % (
             _obj.id,
@@ -96,11 +113,334 @@ def ebs_ensure(size, zone=None, instance=None, device=None, tags={},
             instance.id
         ))
 
+    return _obj
+
+
+def _ebs_spec(spec, defaults):
+    """Return the volume spec passed as argument to :func:`ebs_ensure_many`
+    as a dictionary of arguments for create_volume, with the defaults
+    passed as argument, or None if spec is already a volume.
+    """
+    if isinstance(spec, (Volume, basestring)):
+        return None
+    ret = dict(defaults)
+    if isinstance(spec, dict):
+        ret.update(spec)
+    else:
+        ret["size"] = spec
+    return ret
+
+
+def ebs_ensure_many(volumes, zone=None, instance=None, tags={}, force=False,
+                    **kwargs):
+    """Create a number of EBS volumes and attach them to an instance, if
+    passed, and return a dictionary with the volumes by device.
+
+    The volumes which already exist are looked up with a single request,
+    the missing ones are created concurrently and waited for together (see
+    :mod:`mico.lib.aws.ec2.waiter`), and then all of them are attached
+    concurrently, so the cost of the function is the cost of the slowest
+    volume.
+
+    :type volumes: dict
+    :param volumes: a dictionary in the form {device: spec}, where device
+        is the aws device for the volume (i.e. /dev/sdf), and spec is the
+        size of the volume in GiB, a dictionary of arguments for
+        :func:`ebs_ensure` (i.e. size, snapshot, volume_type, iops or
+        tags), or an existent volume object (or id) to be attached.
+
+    :type zone: string or :class:`boto.ec2.zone.Zone`
+    :param zone: The availability zone in which the volumes will be
+        created, by default the zone of the instance.
+
+    :type instance: :class:`boto.ec2.instance.Instance`
+    :param instance: the instance to attach the volumes to, if any.
+
+    :type tags: dict
+    :param tags: a dictionary of tags for all the volumes. Each volume is
+        tagged with its Device too, and with the Name of the instance.
+
+    :type force: bool
+    :param force: if set to True force the creation of the volumes tough
+        they already exist.
+
+    Other keyword arguments are used as default arguments of the volumes
+    specs (i.e. volume_type or iops).
+    """
+    if zone is None and instance is None:
+        raise EC2LibraryError("volume require zone or instance to be created.")
+
+    if zone is None:
+        zone = instance.placement
+
+    connection = ec2_connect()
+    region = aws_region()
+
+    specs = {}
+    for device, spec in volumes.items():
+        _spec = _ebs_spec(spec, kwargs)
+        if _spec is not None:
+            _tags = dict(tags)
+            _tags.update(_spec.pop("tags", {}))
+            _tags["Device"] = device
+            if instance is not None and "Name" in instance.tags:
+                _tags["Name"] = instance.tags["Name"]
+            _spec["tags"] = _tags
+            specs[device] = _spec
+
+    ret = dict([(k, v) for k, v in volumes.items() if isinstance(v, Volume)])
+    _ids = dict([(v, k) for k, v in volumes.items()
+                 if k not in specs and k not in ret])
+    if _ids:
+        for _obj in connection.get_all_volumes(_ids.keys()):
+            ret[_ids[_obj.id]] = _obj
+
+    if not force and specs:
+        ec2_tag_barrier(region)
+        inventory = aws_inventory(region)
+        if instance is not None and inventory.loaded("volumes"):
+            existent = [x for x in inventory.volumes_by_instance(instance.id)
+                        if x.attach_data.device in specs]
+        elif instance is not None:
+            existent = connection.get_all_volumes(filters={
+                "attachment.instance-id": instance.id,
+                "attachment.device": specs.keys()})
+        else:
+            existent = connection.get_all_volumes(filters={
+                "tag:Device": specs.keys(),
+                "availability-zone": str(getattr(zone, "name", zone)),
+                "status": ["creating", "available", "in-use"]})
+        for _obj in existent:
+            device = _obj.attach_data.device if instance is not None else \
+                _obj.tags.get("Device", None)
+            spec = specs.get(device, None)
+            if spec is None or device in ret:
+                continue
+            if instance is None and [k for k, v in spec["tags"].items()
+                                     if _obj.tags.get(k, None) != v]:
+                continue
+            mico.output.info("use existent volume: %s" % _obj.id)
+            ret[device] = _obj
+
+    def _create(device):
+        spec = dict(specs[device])
+        spec.pop("tags")
+        size = spec.pop("size", None)
+        _obj = ec2_connect(region).create_volume(size, zone, **spec)
+        mico.output.info("create volume: %s (size=%s, zone=%s)" % (
+            _obj.id,
+            size,
+            zone
+        ))
+        return _obj
+
+    missing = [x for x in sorted(specs) if x not in ret]
+    created = []
+    try:
+        for device, _obj in imap_unordered(_create, missing):
+            ret[device] = _obj
+            created.append(_obj)
+            ec2_tag_batch([_obj], specs[device]["tags"], region=region)
+    finally:
+        if created:
+            aws_cache_invalidate("ebs_list")
+            aws_inventory_invalidate("volumes")
+
+    ec2_wait(created, "available")
+
+    if instance is None:
+        return ret
+
+    def _attach(device):
+        ec2_connect(region).attach_volume(ret[device].id, instance.id, device)
+        mico.output.info("attach volume %s as device %s at instance %s" % (
+            ret[device].id,
+            device,
+            instance.id
+        ))
+
+    detached = [x for x in sorted(ret)
+                if getattr(ret[x].attach_data, "instance_id", None) != instance.id]
+    try:
+        for _ in imap_unordered(_attach, detached):
+            pass
+    finally:
+        if detached:
+            aws_cache_invalidate("ebs_list")
+            aws_inventory_invalidate("instances", "volumes")
+
+    ec2_wait([ret[x] for x in detached],
+             lambda x: x.attach_data.status == "attached")
+
+    for device in detached:
+        if device not in specs:
+            _tags = {"Device": device}
+            if "Name" in instance.tags:
+                _tags["Name"] = instance.tags["Name"]
+            ec2_tag_batch([ret[device]], _tags, region=region)
+
+    return ret
+
+
+def _ebs_devices(first, count):
+    """Return a list of count consecutive aws devices, starting in first
+    (i.e. /dev/sdf, /dev/sdg...).
+    """
+    if ord(first[-1]) + count - 1 > ord("z"):
+        raise EC2LibraryError("unable to allocate %d devices from %s" % (
+            count, first,))
+    return ["%s%s" % (first[:-1], chr(ord(first[-1]) + i)) for i in range(count)]
+
+
+def _ebs_local_device(device, timeout=60):
+    """Return the name of the block device in the host for the aws device
+    passed as argument, which could be renamed by the kernel (i.e. /dev/sdf
+    is seen as /dev/xvdf in Xen hosts), waiting until the device appears.
+    """
+    _names = " ".join([device, device.replace("/dev/sd", "/dev/xvd")])
+    _x = run("for i in $(seq %d); do for d in %s; do "
+             "test -b $d && echo $d && exit 0; done; sleep 1; done; exit 1" % (
+                 timeout, _names,), force=True)[0]
+    if _x.return_code != 0:
+        raise EC2LibraryError("device %s not found in host" % device)
+    return str(_x).strip().splitlines()[-1]
+
+
+def ebs_raid_ensure(instance, count, size, device="/dev/md0",
+                    first_device="/dev/sdf", volume_type=None, iops=None,
+                    chunk=256, readahead=4096, filesystem="ext4",
+                    mkfs_options="", mount=None, mount_options="defaults,noatime",
+                    tags={}, force=False):
+    """Ensure that the instance has a RAID0 array striped over count EBS
+    volumes, and return the volumes by aws device.
+
+    The volumes are ensured and attached to consecutive devices with
+    :func:`ebs_ensure_many`. Then the array is assembled with mdadm, the
+    filesystem is created and the array is mounted, if mount is passed.
+    Each step is skipped if it is already done, so the function can be run
+    again safely: an existent array is assembled again, but never created,
+    and an existent filesystem is never formatted.
+
+    The commands run in the current host (as the functions in
+    :mod:`mico.lib.core`), so the function must be called in a task
+    running on the instance itself. For example::
+
+        ebs_raid_ensure(instance, 4, 100, volume_type="io1", iops=1000,
+                        mount="/var/lib/postgresql")
+
+    :type instance: :class:`boto.ec2.instance.Instance`
+    :param instance: the instance to attach the volumes to.
+
+    :type count: int
+    :param count: the number of volumes of the array.
+
+    :type size: int
+    :param size: the size of each volume, in GiB.
+
+    :type device: string
+    :param device: the md device of the array in the host.
+
+    :type first_device: string
+    :param first_device: the aws device of the first volume, the rest of
+        them are attached to the next ones (/dev/sdg, /dev/sdh...).
+
+    :type volume_type: string
+    :param volume_type: the type of the volumes (i.e. standard, gp2 or
+        io1).
+
+    :type iops: int
+    :param iops: the provisioned IOPs of each volume.
+
+    :type chunk: int
+    :param chunk: the chunk size of the array, in KiB.
+
+    :type readahead: int
+    :param readahead: the readahead of the array, in 512 bytes sectors.
+
+    :type filesystem: string
+    :param filesystem: the filesystem to create in the array, or None to
+        leave the array unformatted.
+
+    :type mkfs_options: string
+    :param mkfs_options: extra options for mkfs.
+
+    :type mount: string
+    :param mount: the mount point of the array, if any. The mount is
+        added to /etc/fstab too.
+
+    :type mount_options: string
+    :param mount_options: the options of the mount.
+
+    :type tags: dict
+    :param tags: a dictionary of tags for all the volumes.
+
+    :type force: bool
+    :param force: if set to True force the creation of the volumes tough
+        they already exist.
+    """
+    spec = {"size": size}
+    if volume_type is not None:
+        spec["volume_type"] = volume_type
+    if iops is not None:
+        spec["iops"] = iops
+
+    devices = _ebs_devices(first_device, count)
+    volumes = ebs_ensure_many(dict([(x, dict(spec)) for x in devices]),
+                              instance=instance, tags=tags, force=force)
+
+    if run("mdadm --detail %s" % device, force=True)[0].return_code == 0:
+        mico.output.info("use existent array: %s" % device)
+    else:
+        _local = [_ebs_local_device(x) for x in devices]
+        _devs = " ".join(_local)
+        _members = [x for x in _local
+                    if run("mdadm --examine %s" % x, force=True)[0].return_code == 0]
+        if _members and len(_members) != len(_local):
+            raise EC2LibraryError("unable to create array %s: only %s are "
+                                  "members of an array" % (device, " ".join(_members),))
+        elif _members:
+            run("mdadm --assemble %s %s" % (device, _devs))
+            mico.output.info("assemble array %s from %s" % (device, _devs))
+        else:
+            run("mdadm --create %s --run --level=0 --chunk=%d "
+                "--raid-devices=%d %s" % (device, chunk, count, _devs))
+            mico.output.info("create array %s (level=0, chunk=%dK, devices=%s)" % (
+                device,
+                chunk,
+                _devs
+            ))
+
+        _conf = "$(test -d /etc/mdadm && echo /etc/mdadm/mdadm.conf || echo /etc/mdadm.conf)"
+        run("grep -qs '^ARRAY %s ' %s || mdadm --detail --scan | "
+            "grep '^ARRAY %s ' >> %s" % (device, _conf, device, _conf))
+
+    run("blockdev --setra %d %s" % (readahead, device))
+
+    if filesystem:
+        _x = run("blkid -o value -s TYPE %s" % device, force=True)[0]
+        if str(_x).strip():
+            mico.output.info("use existent filesystem in %s: %s" % (
+                device, str(_x).strip(),))
+        else:
+            run("mkfs -t %s %s %s" % (filesystem, mkfs_options, device))
+            mico.output.info("create filesystem %s in %s" % (filesystem, device))
+
+    if mount:
+        run("mkdir -p '%s'" % mount)
+        run("grep -qs '^%s ' /etc/fstab || echo '%s %s %s %s 0 0' >> /etc/fstab" % (
+            device, device, mount, filesystem or "auto", mount_options,))
+        if run("mountpoint -q '%s'" % mount, force=True)[0].return_code != 0:
+            run("mount '%s'" % mount)
+            mico.output.info("mount %s at %s" % (device, mount))
+
+    return volumes
+
 
 def ebs_exists(tags={}):
     """Returns if tagged volume already exists, if exists return the object,
     otherwise returns None.
     """
+    ec2_tag_barrier(aws_region(), tags, "vol-")
     connection = ec2_connect()
 
     _x = connection.get_all_volumes(None,
@@ -128,6 +468,9 @@ def ebs_delete(volumes):
             connection.delete_volume(x.id)
             mico.output.info("Remove volume: %s" % x.id)
 
+    aws_cache_invalidate("ebs_list")
+    aws_inventory_invalidate("volumes")
+
 
 def ebs_detach(volumes, force=False):
     """Detach a number of volumes passed as arguments.
@@ -148,27 +491,136 @@ def ebs_detach(volumes, force=False):
             connection.detach_volume(x.id, force)
             mico.output.info("Detached volume: %s" % x.id)
 
+    aws_cache_invalidate("ebs_list")
+    aws_inventory_invalidate("instances", "volumes")
+
+
+def _ebs_get_volumes(connection, filters=None, max_results=None, next_token=None):
+    """Get a page of volumes. The boto get_all_volumes method does not
+    support pagination, so build the DescribeVolumes request here.
+    """
+    params = {}
+    if filters:
+        connection.build_filter_params(params, filters)
+    if max_results:
+        params["MaxResults"] = max_results
+    if next_token:
+        params["NextToken"] = next_token
+    return connection.get_list("DescribeVolumes", params,
+                               [("item", Volume)], verb="POST")
+
+
+# DescribeVolumes filters for each kind of pattern allowed in ebs_list.
+EBS_LIST_FILTERS = {
+    "name": "tag:Name",
+    "status": "status",
+    "zone": "availability-zone",
+}
+
+
+def _ebs_parse_pattern(arg):
+    """Split a pattern for :func:`ebs_list` in a tuple (kind, glob), where
+    kind is one of "status", "zone" or "name".
+    """
+    if arg.startswith("status:"):
+        return ("status", arg[7:])
+    elif arg.startswith("zone:"):
+        return ("zone", arg[5:])
+    elif arg.startswith("tag:"):
+        return ("name", arg[4:])
+    else:
+        return ("name", arg)
+
+
+def _ebs_list_query(args, local=False):
+    """Translate patterns for :func:`ebs_list` into a tuple (filters,
+    matchers), where filters are the filters of the DescribeVolumes calls
+    and matchers a dictionary of the patterns, by kind, which cannot be
+    expressed as EC2 filter (EC2 only understand * and ? wildcards) and
+    must be matched in the client side. If local is True, all the
+    patterns are matched in the client side.
+    """
+    _patterns = {}
+    for arg in args:
+        kind, pattern = _ebs_parse_pattern(arg)
+        _patterns.setdefault(kind, []).append(pattern)
+    _patterns.setdefault("name", ["*"])
+
+    filters = {}
+    matchers = {}
+    for kind, patterns in _patterns.items():
+        if local or [x for x in patterns if "[" in x or "\\" in x]:
+            matchers[kind] = GlobMatcher(patterns)
+        else:
+            filters[EBS_LIST_FILTERS[kind]] = patterns
+    return filters, matchers
+
+
+def _ebs_match(volume, matchers):
+    """Return True if the volume matches all the matchers passed as
+    argument in the client side.
+    """
+    values = {
+        "name": volume.tags.get("Name", None),
+        "status": volume.status,
+        "zone": volume.zone,
+    }
+    return all([values[k] is not None and m.match(values[k])
+                for k, m in matchers.items()])
+
 
+@aws_multiregion
+@aws_cached("ebs_list", ec2_connect)
 def ebs_list(*args):
     """List volumes filtering with tag name, provided in arguments. Glob
     expressions are allowed in filters as multiple filters too, for
     example::
 
         ebs_list('host-*', '*database*')
+
+    Patterns prefixed by ``status:`` are matched against the status of the
+    volume, and patterns prefixed by ``zone:`` against its availability
+    zone. A volume is listed if it matches any of the patterns of each
+    kind, for example::
+
+        ebs_list('db-*', 'status:in-use', 'zone:us-east-1a')
+
+    Whenever is possible, patterns are sent to EC2 as filters, so only the
+    matching volumes are downloaded. Volumes are downloaded page by page,
+    and yielded as each page arrives, and only the instances attached to
+    the volumes of each page are described (or all the instances at once,
+    if the listing references too many of them). If the volumes are already
+    loaded in the inventory (see :mod:`mico.lib.aws.inventory`) they are
+    matched there, without any request.
     """
-    conn = ec2_connect()
-    vol = conn.get_all_volumes()
-    ins = dict(map(lambda x: (x.id, x), [i for r in conn.get_all_instances() for i in r.instances]))
-    args = args or ('*',)
-
-    for x in vol:
-        x.name = x.id
-        for arg in args:
-            if x.tags.get("Name", False) and fnmatch(x.tags["Name"], arg):
-                x.device = x.attach_data.device
-                x.instance_id = ("%s (%s)" %
-                                 (ins[x.attach_data.instance_id].tags.get("Name", None),
-                                  x.attach_data.instance_id)) if x.attach_data.id is not None \
-                                 else None
-                yield x
+    ec2_tag_barrier(aws_region())
+    inventory = aws_inventory()
 
+    if inventory.loaded("volumes"):
+        _, matchers = _ebs_list_query(args, local=True)
+        pages = [inventory.volumes()]
+    else:
+        filters, matchers = _ebs_list_query(args)
+        pages = aws_pages(partial(_ebs_get_volumes, ec2_connect(), filters),
+                          "max_results", 1000)
+
+    for page in pages:
+        page = [x for x in page if _ebs_match(x, matchers)]
+        _ids = set([x.attach_data.instance_id for x in page
+                    if x.attach_data.id is not None])
+        if len(_ids) > EC2_DESCRIBE_SIZE:
+            # Broad listings reference most of the fleet, so it is cheaper
+            # to load all the instances in the inventory once.
+            instances = dict([(x, inventory.instance(x)) for x in _ids])
+        else:
+            instances = _ec2_get_instances(_ids)
+        for x in page:
+            x.name = x.id
+            x.device = x.attach_data.device
+            x.instance_id = None
+            if x.attach_data.id is not None:
+                instance = instances.get(x.attach_data.instance_id, None)
+                x.instance_id = "%s (%s)" % (
+                        instance.tags.get("Name", None) if instance else None,
+                        x.attach_data.instance_id)
+            yield x
@@ -15,33 +15,19 @@ from boto.ec2.elb import HealthCheck
 import boto.ec2.elb
 
 import mico.output
+from mico.lib.aws.region import aws_region
+from mico.lib.aws.connection import aws_connection
 from mico.lib.aws.ec2 import EC2LibraryError
 from mico.lib.aws.ec2 import ec2_connect
 
 from mico import env
 
 
-def elb_connect(region=None, *args, **kwargs):
-    """Helper to connect to Amazon Web Services EC2, using identify provided
-    by environment, as also optional region in arguments.
-    """
-    if not os_environ.get("AWS_ACCESS_KEY_ID", None):
-        raise EC2LibraryError("Environment variable AWS_ACCESS_KEY_ID is not set.")
-    if not os_environ.get("AWS_SECRET_ACCESS_KEY", None):
-        raise EC2LibraryError("Environment variable AWS_SECRET_ACCESS_KEY is not set.")
-
-    if not region:
-        region = env.get("ec2_region")
-
+def _elb_new_connection(region, *args, **kwargs):
     for reg in boto.ec2.elb.regions():
         if reg.name == region:
             region = reg
 
-#    region = get_region(region,
-#            aws_access_key_id = os_environ.get("AWS_ACCESS_KEY_ID"),
-#            aws_secret_access_key = os_environ.get("AWS_ACCESS_SECRET_KEY")
-#    )
-#
     connection = ELBConnection(
             os_environ.get("AWS_ACCESS_KEY_ID"),
             os_environ.get("AWS_SECRET_ACCESS_KEY"),
@@ -52,6 +38,22 @@ def elb_connect(region=None, *args, **kwargs):
     return connection
 
 
+def elb_connect(region=None, *args, **kwargs):
+    """Helper to connect to Amazon Web Services EC2, using identify provided
+    by environment, as also optional region in arguments. Connections
+    without extra arguments are reused from the connection pool.
+    """
+    if not os_environ.get("AWS_ACCESS_KEY_ID", None):
+        raise EC2LibraryError("Environment variable AWS_ACCESS_KEY_ID is not set.")
+    if not os_environ.get("AWS_SECRET_ACCESS_KEY", None):
+        raise EC2LibraryError("Environment variable AWS_SECRET_ACCESS_KEY is not set.")
+
+    if not region:
+        region = aws_region()
+
+    return aws_connection("elb", region, _elb_new_connection, *args, **kwargs)
+
+
 def elb_check(target, interval=20, healthy_threshold=3,
               unhealthy_threshold=5, timeout=5):
     """Create a new ELB check.
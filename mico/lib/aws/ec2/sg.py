@@ -6,18 +6,35 @@
 groups.
 """
 
-from boto.exception import EC2ResponseError
 from boto.ec2.elb.securitygroup import SecurityGroup
 from boto.ec2.securitygroup import SecurityGroup as SG_Instance
+from collections import OrderedDict
 
 import mico.output
+from mico.util.workers import imap_unordered
 from mico.lib.aws.ec2 import ec2_connect
-from mico.lib.aws.ec2 import ec2_list
 from mico.lib.aws.ec2 import EC2LibraryError
+from mico.lib.aws.ec2 import EC2_DESCRIBE_SIZE
+from mico.lib.aws.ec2 import EC2_ALIVE_STATES
+from mico.lib.aws.region import aws_region
+from mico.lib.aws.connection import aws_paginate
+from mico.lib.aws.inventory import aws_inventory
+from mico.lib.aws.inventory import aws_inventory_invalidate
 
 
-def sg_rule(protocol="tcp", source="0.0.0.0/32", port=None, from_port=None, to_port=None):
+def _sg_is_cidr(src):
+    # TODO: better ip check is desired here.
+    return "/" in src and "." in src
+
+
+def sg_rule(protocol="tcp", source="0.0.0.0/32", port=None, from_port=None,
+            to_port=None, vpc_id=None):
     """Return a representation of a specific security rule.
+
+    The source can be a CIDR, a security group object or the name of a
+    security group (in the VPC vpc_id, if passed), or a list of them. The
+    names of the groups are resolved together, with a single request (see
+    :func:`sg_exists_many`).
     """
 
     cidr_ip = None
@@ -41,6 +58,10 @@ def sg_rule(protocol="tcp", source="0.0.0.0/32", port=None, from_port=None, to_p
             ret["from_port"] = from_port or 0
             ret["to_port"] = to_port or 65535
 
+    _names = [x for x in (source if isinstance(source, list) else [source])
+              if isinstance(x, basestring) and not _sg_is_cidr(x)]
+    _groups = sg_exists_many(_names, vpc_id) if _names else {}
+
     def _add_source(src, d):
         r = {}
         r.update(d)
@@ -53,11 +74,10 @@ def sg_rule(protocol="tcp", source="0.0.0.0/32", port=None, from_port=None, to_p
             r["src_group"] = src
 
         elif isinstance(src, str) or isinstance(src, unicode):
-            if "/" in src and "." in src:
-                # TODO: better ip check is desired here.
+            if _sg_is_cidr(src):
                 r["cidr_ip"] = src
             else:
-                r["src_group"] = sg_exists(src)
+                r["src_group"] = _groups.get(src, None)
                 if r["src_group"] is None:
                     raise KeyError("security group %s does not exists" % src)
         else:
@@ -70,10 +90,158 @@ def sg_rule(protocol="tcp", source="0.0.0.0/32", port=None, from_port=None, to_p
         return [_add_source(source, ret)]
 
 
-def sg_ensure(name, description, vpc_id=None, rules=[], force=False):
+def _sg_port(value):
+    return str(value) if value is not None else "-1"
+
+
+def _sg_permission(r):
+    """Return the permission represented by the rule dictionary passed as
+    argument (as returned by :func:`sg_rule`), as a tuple (protocol,
+    from_port, to_port, source), where source is a tuple ("cidr", cidr),
+    ("group", group_id), or ("group-name", owner_id, name) for groups
+    without id (i.e. the groups of load balancers).
+    """
+    protocol = str(r["ip_protocol"]).lower()
+    if protocol == "-1":
+        ports = (None, None)
+    else:
+        ports = (_sg_port(r.get("from_port", None)), _sg_port(r.get("to_port", None)))
+
+    src = r.get("src_group", None)
+    if src is None:
+        source = ("cidr", r["cidr_ip"])
+    elif getattr(src, "id", None):
+        source = ("group", src.id)
+    else:
+        source = ("group-name", src.owner_id, src.name)
+    return (protocol,) + ports + (source,)
+
+
+def _sg_permissions(group):
+    """Return the current ingress permissions of the group passed as
+    argument, as a list of tuples (permission, alias), where permission
+    is like in :func:`_sg_permission` and alias is the same permission
+    with the source group referenced by owner and name, if any.
+    """
+    ret = []
+    for rule in group.rules:
+        protocol = str(rule.ip_protocol).lower()
+        if protocol == "-1":
+            ports = (None, None)
+        else:
+            ports = (_sg_port(rule.from_port), _sg_port(rule.to_port))
+        for grant in rule.grants:
+            if grant.cidr_ip:
+                ret.append(((protocol,) + ports + (("cidr", grant.cidr_ip),), None))
+            else:
+                alias = (protocol,) + ports + (("group-name", grant.owner_id, grant.name),)
+                if grant.group_id:
+                    ret.append(((protocol,) + ports + (("group", grant.group_id),), alias))
+                else:
+                    ret.append((alias, None))
+    return ret
+
+
+def _sg_permissions_params(group, permissions):
+    """Return the parameters of a request which authorizes or revokes all
+    the permissions passed as argument in the group. Permissions with the
+    same protocol and ports are merged in the same IpPermissions item.
+    """
+    params = {"GroupId": group.id}
+    _keys = []
+    _sources = {}
+    for permission in permissions:
+        if permission[:3] not in _sources:
+            _keys.append(permission[:3])
+            _sources[permission[:3]] = []
+        _sources[permission[:3]].append(permission[3])
+
+    for i, key in enumerate(_keys, 1):
+        prefix = "IpPermissions.%d" % i
+        params["%s.IpProtocol" % prefix] = key[0]
+        if key[1] is not None:
+            params["%s.FromPort" % prefix] = key[1]
+            params["%s.ToPort" % prefix] = key[2]
+        _ranges = [x for x in _sources[key] if x[0] == "cidr"]
+        _groups = [x for x in _sources[key] if x[0] != "cidr"]
+        for j, source in enumerate(_ranges, 1):
+            params["%s.IpRanges.%d.CidrIp" % (prefix, j)] = source[1]
+        for j, source in enumerate(_groups, 1):
+            if source[0] == "group":
+                params["%s.Groups.%d.GroupId" % (prefix, j)] = source[1]
+            else:
+                params["%s.Groups.%d.UserId" % (prefix, j)] = source[1]
+                params["%s.Groups.%d.GroupName" % (prefix, j)] = source[2]
+    return params
+
+
+def _sg_describe_permission(permission):
+    source = permission[3]
+    return "ip_protocol=%s,from_port=%s,to_port=%s,%s=%s" % (
+        permission[0], permission[1], permission[2],
+        "cidr_ip" if source[0] == "cidr" else "src_group",
+        source[-1],)
+
+
+def _sg_authorize(group, permissions, region=None):
+    """Authorize the permissions passed as argument in the group, with a
+    single request, and add them to the local rules of the group. The
+    region must be passed when called from a worker thread.
+    """
+    if not permissions:
+        return
+    connection = ec2_connect(region)
+    connection.get_status("AuthorizeSecurityGroupIngress",
+                          _sg_permissions_params(group, permissions), verb="POST")
+    for permission in permissions:
+        source = permission[3]
+        group.add_rule(permission[0], permission[1], permission[2],
+                       source[2] if source[0] == "group-name" else None,
+                       source[1] if source[0] == "group-name" else None,
+                       source[1] if source[0] == "cidr" else None,
+                       source[1] if source[0] == "group" else None)
+        mico.output.info("add rule to security group %s: %s" % (
+            group.name,
+            _sg_describe_permission(permission)
+        ))
+
+
+def _sg_revoke(group, permissions, region=None):
+    """Revoke the permissions passed as argument in the group, with a
+    single request, and remove them from the local rules of the group. The
+    region must be passed when called from a worker thread.
+    """
+    if not permissions:
+        return
+    connection = ec2_connect(region)
+    connection.get_status("RevokeSecurityGroupIngress",
+                          _sg_permissions_params(group, permissions), verb="POST")
+    removed = set(permissions)
+    for rule in list(group.rules):
+        protocol = str(rule.ip_protocol).lower()
+        ports = (None, None) if protocol == "-1" else \
+            (_sg_port(rule.from_port), _sg_port(rule.to_port))
+        rule.grants = [g for g in rule.grants
+                       if (protocol,) + ports + (("cidr", g.cidr_ip),) not in removed and
+                       (protocol,) + ports + (("group", g.group_id),) not in removed and
+                       (protocol,) + ports + (("group-name", g.owner_id, g.name),) not in removed]
+        if not rule.grants:
+            group.rules.remove(rule)
+    for permission in permissions:
+        mico.output.info("revoke rule from security group %s: %s" % (
+            group.name,
+            _sg_describe_permission(permission)
+        ))
+
+
+def sg_ensure(name, description, vpc_id=None, rules=[], force=False,
+              exact=False):
     """Create a new EC2 security group according with parameters passed
     as arguments.
 
+    The rules are compared with the current rules of the group, and only
+    the missing ones are authorized, all of them in a single request.
+
     :type name: string
     :param name: The name of the new security group
 
@@ -86,65 +254,318 @@ def sg_ensure(name, description, vpc_id=None, rules=[], force=False):
 
     :type rules: list
     :param rules: a list of objects rules.
+
+    :type force: bool
+    :param force: if set to True apply the rules tough the group already
+        exists. By default an existent group is returned as is.
+
+    :type exact: bool
+    :param exact: if set to True revoke also the current rules of the
+        group which are not in rules, so the group ends with exactly the
+        rules passed as argument.
     """
     connection = ec2_connect()
 
-    _obj = sg_exists(name)
+    _obj = sg_exists(name, vpc_id)
     if _obj:
         mico.output.info("use existent security group: %s" % name)
         if not force:
             return _obj
     elif not _obj:
         _obj = connection.create_security_group(name, description, vpc_id)
+        aws_inventory_invalidate("security_groups")
+        aws_inventory().remember("security_groups", (vpc_id, name), _obj)
         mico.output.info("create security group: %s" % name)
 
+    _want = []
     for rule in rules:
         for r in rule:
-            try:
-                _obj.authorize(**r)
-                mico.output.info("add rule to security group %s: %s" % (
-                    _obj.name,
-                    ",".join(map(lambda x: "%s=%s" % x, r.items()))
-                ))
-            except EC2ResponseError as e:
-                if e.error_code == "InvalidPermission.Duplicate":
-                    mico.output.debug("skip add already exists rule to security group %s: %s" % (
-                        _obj.name,
-                        ", ".join(map(lambda x: "%s=%s" % x, r.items()))
-                    ))
-            except Exception as e:
-                raise e
+            permission = _sg_permission(r)
+            if permission not in _want:
+                _want.append(permission)
+
+    _have = _sg_permissions(_obj)
+    _known = set([x for x, _ in _have] + [x for _, x in _have if x is not None])
+
+    _add = [x for x in _want if x not in _known]
+    for permission in _want:
+        if permission in _known:
+            mico.output.debug("skip add already exists rule to security group %s: %s" % (
+                _obj.name,
+                _sg_describe_permission(permission)
+            ))
+
+    _del = []
+    if exact:
+        _want = set(_want)
+        _del = [x for x, alias in _have if x not in _want and alias not in _want]
+
+    try:
+        _sg_revoke(_obj, _del)
+        _sg_authorize(_obj, _add)
+    finally:
+        if _add or _del:
+            aws_inventory_invalidate("security_groups")
+            aws_inventory().remember("security_groups", (vpc_id, name), _obj)
 
     return _obj
 
 
-def sg_exists(name):
+def sg_exists(name, vpc_id=None):
     """Return the security group with name passed as argument for specified
-    region or None if it does not exists.
+    region (and VPC, if passed) or None if it does not exists.
     """
+    return sg_exists_many([name], vpc_id).get(name, None)
+
+
+def sg_exists_many(names, vpc_id=None):
+    """Return a dictionary with the security groups which names are passed
+    as argument, indexed by name, for the current region (and the VPC
+    vpc_id, if passed). Groups which do not exist are not included.
+
+    Groups are taken from the inventory if it is already loaded, or from
+    the groups resolved before in the same run (see
+    :meth:`mico.lib.aws.inventory.Inventory.remember`), and the rest are
+    described with a single request (filtered by name), so each group is
+    described once until security groups are created or deleted.
+    """
+    inventory = aws_inventory()
+    ret = {}
+    missing = []
+
+    for name in names:
+        if name in ret or name in missing:
+            continue
+        if inventory.loaded("security_groups"):
+            _sg = [g for g in inventory.security_groups_by_name(name)
+                   if vpc_id is None or g.vpc_id == vpc_id]
+            if _sg:
+                ret[name] = _sg[0]
+            continue
+        _obj = inventory.remembered("security_groups", (vpc_id, name))
+        if _obj is not None:
+            ret[name] = _obj
+        else:
+            missing.append(name)
+
     connection = ec2_connect()
+    for i in range(0, len(missing), EC2_DESCRIBE_SIZE):
+        filters = {"group-name": missing[i:i + EC2_DESCRIBE_SIZE]}
+        if vpc_id is not None:
+            filters["vpc-id"] = vpc_id
+        for _obj in connection.get_all_security_groups(filters=filters):
+            if _obj.name not in ret:
+                ret[_obj.name] = _obj
+                inventory.remember("security_groups", (vpc_id, _obj.name), _obj)
 
-    _sg = connection.get_all_security_groups()
-    _sg = [g for g in _sg if g.name == name]
+    return ret
 
-    if len(_sg) > 0:
-        return _sg[0]
-    else:
+
+class SecurityGroupGraph(object):
+    """Models the references between the security groups of a region, and
+    the network interfaces which use each group, so both questions are
+    answered without further requests.
+
+    :type groups: list
+    :param groups: the security groups of the region.
+
+    :type interfaces: list
+    :param interfaces: the network interfaces of the region. Note that
+        instances in EC2-Classic have no network interfaces, so they are
+        not seen as users of their groups.
+    """
+    def __init__(self, groups, interfaces):
+        self._groups = OrderedDict()
+        self._names = {}
+        self._referrers = {}
+        self._users = {}
+
+        for group in groups:
+            self._groups[group.id] = group
+            self._names.setdefault(group.name, []).append(group)
+
+        for group in groups:
+            for permission, _ in _sg_permissions(group):
+                source = permission[3]
+                if source[0] == "group" and source[1] != group.id:
+                    self._referrers.setdefault(source[1], OrderedDict()) \
+                        .setdefault(group.id, []).append(permission)
+
+        for interface in interfaces:
+            for group in interface.groups:
+                self._users.setdefault(group.id, []).append(interface)
+
+    def groups(self):
+        """Return the list of security groups."""
+        return self._groups.values()
+
+    def group(self, name, vpc_id=None):
+        """Return the security group with the id or name passed as
+        argument (in the VPC vpc_id, if passed), or None if it does not
+        exist.
+        """
+        if name in self._groups:
+            return self._groups[name]
+        for group in self._names.get(name, []):
+            if vpc_id is None or group.vpc_id == vpc_id:
+                return group
         return None
 
+    def referrers(self, group_id):
+        """Return a dictionary with the permissions which reference the
+        group passed as argument, indexed by the id of the group which
+        grants them. References of a group to itself are not included.
+        """
+        return self._referrers.get(group_id, {})
+
+    def users(self, group_id):
+        """Return the list of network interfaces which use the group
+        passed as argument.
+        """
+        return self._users.get(group_id, [])
+
+
+def sg_graph(region=None):
+    """Return a :class:`SecurityGroupGraph` for the region passed as
+    argument (or the current one), built from the security groups of the
+    inventory (one request, unless they are already loaded) and one
+    request for the network interfaces.
+    """
+    return SecurityGroupGraph(aws_inventory(region).security_groups(),
+                              ec2_connect(region).get_all_network_interfaces())
+
+
+def _sg_users(graph, group_ids, region=None):
+    """Return a dictionary with the names of the users of each group passed
+    as argument, by group id: the instances in the group, taken from the
+    inventory if it is already loaded or described in chunks filtered by
+    group (instances in EC2-Classic have no network interfaces), and the
+    rest of network interfaces in the graph.
+    """
+    connection = ec2_connect(region)
+    inventory = aws_inventory(region)
+    group_ids = list(group_ids)
+    ret = {}
+    seen = set()
+
+    def _instances():
+        if inventory.loaded("instances"):
+            _ids = set()
+            for group_id in group_ids:
+                for instance in inventory.instances_by_group(group_id):
+                    if instance.id not in _ids:
+                        _ids.add(instance.id)
+                        yield instance
+            return
+
+        for i in range(0, len(group_ids), EC2_DESCRIBE_SIZE):
+            filters = {"instance.group-id": group_ids[i:i + EC2_DESCRIBE_SIZE],
+                       "instance-state-name": EC2_ALIVE_STATES}
+            for reservation in aws_paginate(connection.get_all_reservations,
+                                            "max_results", 1000, filters=filters):
+                for instance in reservation.instances:
+                    yield instance
+
+    for instance in _instances():
+        seen.add(instance.id)
+        for group in instance.groups:
+            if group.id in group_ids:
+                ret.setdefault(group.id, []).append(
+                    instance.tags.get("Name", instance.id))
+
+    for group_id in group_ids:
+        for interface in graph.users(group_id):
+            _id = getattr(getattr(interface, "attachment", None), "instance_id", None)
+            if _id not in seen:
+                ret.setdefault(group_id, []).append(_id or interface.id)
+
+    return ret
 
-def _sg_revoke_all_rules(name, target):
-    for rule in name.rules:
-        dr = rule.__dict__
-        if target.id in [g.group_id for g in dr["grants"]]:
-            mico.output.debug("Removed from %s the rule %s %s-%s that references %s" %
-               (name.name, dr["ip_protocol"], dr["from_port"], dr["to_port"], target.name, ))
-            name.revoke(
-                ip_protocol=dr["ip_protocol"],
-                from_port=dr["from_port"],
-                to_port=dr["to_port"],
-                src_group=target
-            )
+
+def sg_delete_many(names, force=False, vpc_id=None):
+    """Delete the security groups which names (or ids) are passed as
+    argument, and return them.
+
+    If you attempt to delete a security group that contains instances, or
+    is referenced by another security group, the operation fails. Use the
+    "force" flag to delete security groups that are referenced by other
+    security groups: the referencing rules of each group are revoked in a
+    single request, and the requests run concurrently.
+
+    :type names: list
+    :param names: the names or ids of the security groups.
+
+    :type force: boolean
+    :param force: delete the security groups even when they are referenced
+        by other security groups, by revoking the referencing rules.
+
+    :type vpc_id: string
+    :param vpc_id: the VPC of the security groups, if any.
+    """
+    region = aws_region()
+    connection = ec2_connect(region)
+
+    if force:
+        graph = sg_graph(region)
+        targets = OrderedDict()
+        for name in names:
+            target = graph.group(name, vpc_id)
+            if target is None:
+                raise EC2LibraryError('%s does not exist.' % (name, ))
+            targets[target.id] = target
+
+        # Nothing is revoked until all the groups are known to be unused.
+        users = _sg_users(graph, targets.keys(), region)
+        for target in targets.values():
+            if users.get(target.id, None):
+                raise EC2LibraryError('%s is in use by %s.' %
+                        (target.name, ",".join(sorted(set(users[target.id]))),))
+
+        revokes = OrderedDict()
+        for target in targets.values():
+            for group_id, permissions in graph.referrers(target.id).items():
+                revokes.setdefault(group_id, []).extend(permissions)
+
+        def _revoke(group_id):
+            group = graph.group(group_id)
+            mico.output.debug("revoke from %s the rules which reference %s" % (
+                group.name,
+                ",".join(sorted(set([targets[x[3][1]].name for x in revokes[group_id]]))),
+            ))
+            _sg_revoke(group, revokes[group_id], region)
+
+        try:
+            for _ in imap_unordered(_revoke, revokes.keys()):
+                pass
+        finally:
+            if revokes:
+                aws_inventory_invalidate("security_groups")
+    else:
+        _groups = sg_exists_many([x for x in names if not x.startswith("sg-")], vpc_id)
+        _ids = [x for x in names if x.startswith("sg-")]
+        if _ids:
+            for group in connection.get_all_security_groups(group_ids=_ids):
+                _groups[group.id] = group
+        targets = OrderedDict()
+        for name in names:
+            if name not in _groups:
+                raise EC2LibraryError('%s does not exist.' % (name, ))
+            targets[_groups[name].id] = _groups[name]
+
+    def _delete(target):
+        # boto.ec2.connection.delete_security_group() raises
+        # boto.exception.EC2ResponseError if the target security group is
+        # in use or referenced by another security group.
+        ec2_connect(region).delete_security_group(group_id=target.id)
+        mico.output.debug("delete security group: %s" % target.name)
+
+    try:
+        for _ in imap_unordered(_delete, targets.values()):
+            pass
+    finally:
+        aws_inventory_invalidate("security_groups")
+
+    return targets.values()
 
 
 def sg_delete(name, force=False):
@@ -160,21 +581,4 @@ def sg_delete(name, force=False):
     :param force: Delete a security group even when it is referenced by another security group
     by deleting the referencing rules.
     """
-    connection = ec2_connect()
-
-    target = sg_exists(name)
-    if target:
-        if force:
-            instances = [x for x in ec2_list('sec:%s' % (target.name, ))]
-            if instances:
-                raise EC2LibraryError('%s is in use by %s.' %
-                        (target.name, ",".join(map(lambda x: x.name, instances)),))
-            _sg = connection.get_all_security_groups()
-            for sg in filter(lambda x: x.name != target.name, _sg):
-                _sg_revoke_all_rules(sg, target)
-        connection.delete_security_group(target.name)
-        # boto.ec2.connection.delete_security_group() raises boto.exception.EC2ResponseError
-        # if the target security group is referenced by another security group
-        return target
-    else:
-        raise EC2LibraryError('%s does not exist.' % (name, ))
+    return sg_delete_many([name], force)[0]
@@ -0,0 +1,275 @@
+#! /usr/bin/env python
+# -*- encoding: utf-8 -*-
+# vim:fenc=utf-8:
+
+"""The ec2.tags library batches the writes of tags on EC2 resources.
+
+Tags written with :func:`ec2_tag_batch` (and with the functions which tag
+resources in the EC2 library, like :func:`mico.lib.aws.ec2.ec2_tag`) are
+not sent to EC2 at once, but collected and sent together in the next
+barrier, using as few CreateTags calls as possible: resources which get
+the same tag share the same call, so tagging a number of instances and
+their volumes costs one call by different tag (i.e. one by Name) instead
+of one call by resource.
+
+Pending tags are flushed by the functions which read tags from EC2 (like
+:func:`mico.lib.aws.ec2.ec2_list`, or :func:`mico.lib.aws.ec2.ec2_exists`
+when it looks for some pending tag), at the end of each mico command and
+at exit, or explicitly calling :func:`ec2_tag_flush`. Tags which cannot be
+written are kept pending to be retried in the next flush: an explicit
+flush raises the error, but the flush of a read just warns about it (see
+:func:`ec2_tag_barrier`). Callers which need the tags to be written at
+once can use the :func:`ec2_tag_immediate` context::
+
+    with ec2_tag_immediate():
+        ec2_tag(instance, Name="web-1")
+
+Setting ``ec2_tag_batch`` to False in the environment disables the
+batching at all.
+"""
+
+import sys
+import atexit
+import threading
+from contextlib import contextmanager
+
+from mico import env
+import mico.output
+from mico.util.dicts import AttrDict
+from mico.util.workers import imap_unordered
+from mico.lib.aws.region import aws_region
+from mico.lib.aws.cache import aws_cache_invalidate
+from mico.lib.aws.inventory import aws_inventory_invalidate
+
+
+# Maximum number of resource ids sent in a single CreateTags call.
+EC2_TAG_BATCH_SIZE = 200
+
+
+class TagBatcher(object):
+    """Models the tags pending to be written, by region and resource. The
+    tags of the same resource are merged as they are added, so the last
+    value written for a tag wins.
+    """
+    def __init__(self):
+        self._lock = threading.RLock()
+        self._pending = {}
+        self._immediate = 0
+
+    def add(self, region, resource_ids, tags):
+        """Add the tags passed as dictionary to the resources passed as
+        argument, in the region.
+        """
+        with self._lock:
+            pending = self._pending.setdefault(region, {})
+            for resource_id in resource_ids:
+                if resource_id not in pending:
+                    pending[resource_id] = AttrDict(order=len(pending), tags={})
+                pending[resource_id].tags.update(tags)
+
+    def restore(self, region, resource_ids, tags):
+        """Add again the tags of a call which failed, unless a newer value
+        was added for the same tag and resource in the meanwhile.
+        """
+        with self._lock:
+            pending = self._pending.setdefault(region, {})
+            for resource_id in resource_ids:
+                if resource_id not in pending:
+                    pending[resource_id] = AttrDict(order=len(pending), tags={})
+                for key, value in tags.items():
+                    pending[resource_id].tags.setdefault(key, value)
+
+    def pending(self, region=None):
+        """Return the number of resources with pending tags in the region,
+        or in all the regions if no region is passed.
+        """
+        with self._lock:
+            if region is not None:
+                return len(self._pending.get(region, {}))
+            return sum(map(len, self._pending.values()))
+
+    def matches(self, region, tags, prefix=None):
+        """Return True if some resource in the region, which id starts
+        with prefix (if any), could match the tags passed as dictionary
+        once its pending tags are written, that is, if some pending tag
+        has the same value than in tags, and no other pending tag has a
+        different one.
+        """
+        with self._lock:
+            for resource_id, item in self._pending.get(region, {}).items():
+                if prefix is not None and not resource_id.startswith(prefix):
+                    continue
+                _same = [k for k, v in tags.items() if item.tags.get(k, v) == v]
+                if len(_same) == len(tags) and \
+                        [k for k in _same if k in item.tags]:
+                    return True
+        return False
+
+    def calls(self, region):
+        """Take the pending tags of the region, and return the list of
+        CreateTags calls to write them, as tuples (resource_ids, tags).
+        Resources which get the same value of a tag are grouped in the
+        same call, and tags which are written on the same resources are
+        merged in the same call.
+        """
+        with self._lock:
+            pending = self._pending.pop(region, {})
+
+        resources = sorted(pending.items(), key=lambda x: x[1].order)
+
+        _tags = []
+        _ids = {}
+        for resource_id, item in resources:
+            for tag in sorted(item.tags.items()):
+                if tag not in _ids:
+                    _tags.append(tag)
+                    _ids[tag] = []
+                _ids[tag].append(resource_id)
+
+        _sets = []
+        _calls = {}
+        for tag in _tags:
+            key = tuple(_ids[tag])
+            if key not in _calls:
+                _sets.append(key)
+                _calls[key] = {}
+            _calls[key][tag[0]] = tag[1]
+
+        return [(list(key[i:i + EC2_TAG_BATCH_SIZE]), _calls[key])
+                for key in _sets
+                for i in range(0, len(key), EC2_TAG_BATCH_SIZE)]
+
+    def flush(self, region=None):
+        """Write the pending tags of the region, or of all the regions if
+        no region is passed, and return the number of CreateTags calls.
+        Calls run concurrently, and if any of them fails its tags are kept
+        pending and the exception is raised again once all the calls are
+        done.
+        """
+        from mico.lib.aws.ec2 import ec2_connect
+
+        with self._lock:
+            regions = [region] if region is not None else self._pending.keys()
+            calls = [(r, ids, tags) for r in regions for ids, tags in self.calls(r)]
+
+        if not calls:
+            return 0
+
+        def _create_tags(call):
+            try:
+                ec2_connect(call[0]).create_tags(call[1], call[2])
+            except Exception:
+                self.restore(*call)
+                return sys.exc_info()
+
+        errors = []
+        try:
+            for call, error in imap_unordered(_create_tags, calls):
+                if error is not None:
+                    errors.append(error)
+                    continue
+                mico.output.debug("tag %d resources: %s" % (
+                    len(call[1]),
+                    ",".join(["%s=%s" % x for x in sorted(call[2].items())])
+                ))
+        finally:
+            for r in set([x[0] for x in calls]):
+                aws_cache_invalidate("ec2_list", "ebs_list", region=r)
+                aws_inventory_invalidate("instances", "volumes", region=r)
+
+        if errors:
+            raise errors[0][0], errors[0][1], errors[0][2]
+        return len(calls)
+
+    def immediate(self):
+        """Return True if tags must be written at once."""
+        return self._immediate > 0 or not env.get("ec2_tag_batch", True)
+
+
+tag_batcher = TagBatcher()
+
+
+def ec2_tag_batch(resources, tags, region=None):
+    """Add tags to the EC2 resources passed as argument, which will be
+    written in the next barrier (see :func:`ec2_tag_flush`).
+
+    :type resources: list
+    :param resources: a list of resource ids or objects with an id, like
+        instances or volumes. The local tags of the objects are updated
+        too.
+
+    :type tags: dict
+    :param tags: a dictionary with the tags to write.
+
+    :type region: str
+    :param region: the region of the resources, by default the current
+        region.
+    """
+    region = region or aws_region()
+    if not tags or not resources:
+        return
+
+    for resource in resources:
+        if getattr(resource, "tags", None) is not None:
+            resource.tags.update(tags)
+
+    tag_batcher.add(region, [getattr(x, "id", x) for x in resources], tags)
+
+    if tag_batcher.immediate():
+        tag_batcher.flush(region)
+
+
+def ec2_tag_flush(region=None, tags=None, prefix=None):
+    """Write all the pending tags in the region, or in all regions if no
+    region is passed as argument. Return the number of CreateTags calls.
+
+    :type tags: dict
+    :param tags: if present, the tags of a query by tags which is about
+        to be sent. Pending tags are written only if they can change the
+        result of the query, that is, if some resource has a pending tag
+        with the same value.
+
+    :type prefix: str
+    :param prefix: if present with tags, only the resources which id
+        starts with prefix (i.e. "i-" for instances) are considered.
+    """
+    if tags and not tag_batcher.matches(region or aws_region(), tags, prefix):
+        return 0
+    return tag_batcher.flush(region)
+
+
+def ec2_tag_barrier(region=None, tags=None, prefix=None):
+    """Like :func:`ec2_tag_flush`, but for the functions which read from
+    EC2: if the pending tags cannot be written, a warning is shown and
+    the tags are kept to be retried later, instead of failing the read.
+    """
+    try:
+        return ec2_tag_flush(region, tags, prefix)
+    except Exception as e:
+        mico.output.warn("unable to write pending tags, will retry: %s" % e)
+        return 0
+
+
+@contextmanager
+def ec2_tag_immediate():
+    """Context where tags are written at once. Pending tags are flushed
+    when entering and when leaving the context.
+    """
+    tag_batcher.flush()
+    with tag_batcher._lock:
+        tag_batcher._immediate += 1
+    try:
+        yield tag_batcher
+    finally:
+        with tag_batcher._lock:
+            tag_batcher._immediate -= 1
+        tag_batcher.flush()
+
+
+def _ec2_tag_flush_at_exit():
+    try:
+        tag_batcher.flush()
+    except Exception as e:
+        mico.output.error("unable to write pending tags: %s" % e)
+
+atexit.register(_ec2_tag_flush_at_exit)
@@ -0,0 +1,254 @@
+#! /usr/bin/env python
+# -*- encoding: utf-8 -*-
+# vim:fenc=utf-8:
+
+"""The ec2.waiter library waits for a number of EC2 resources (instances
+or volumes) to reach some condition, polling all of them together: each
+round issues one describe call by region (with the ids of all the pending
+resources in a filter) instead of one call by resource, and rounds are
+spaced with an exponential backoff until a deadline. For example::
+
+    ec2_wait(instances, "running")
+    ec2_wait(volumes, lambda x: x.attach_data.status == "attached")
+
+The resources passed to the waiter are updated in place in each round, so
+when the wait finishes they reflect the last state seen in EC2. The
+following variables in the environment change the default behaviour:
+
+``ec2_wait_timeout``
+    maximum number of seconds to wait, 600 by default.
+
+``ec2_wait_delay``
+    seconds to wait after the first round, 1 by default. The delay grows
+    by half in each round, up to ``ec2_wait_max_delay`` seconds (15 by
+    default).
+"""
+
+import time
+from collections import OrderedDict
+
+from mico import env
+import mico.output
+from mico.util.dicts import AttrDict
+from mico.util.workers import imap_unordered
+from mico.lib.aws.region import aws_region
+from mico.lib.aws.connection import aws_paginate
+
+
+# States which mean that a resource will never reach the condition which
+# is being waited for, unless the condition is that state.
+EC2_WAIT_FAILED_STATES = {
+    "instances": ["shutting-down", "terminated"],
+    "volumes": ["error", "deleting", "deleted"],
+}
+
+
+def _env_float(name, default):
+    """Return the float value of the environment variable name, or the
+    default value if the variable is not set or it is not a number.
+    """
+    try:
+        return float(env.get(name, default))
+    except (TypeError, ValueError):
+        return default
+
+
+def _resource_state(kind, resource):
+    if kind == "instances":
+        return resource.state
+    return resource.status
+
+
+def _resource_region(resource):
+    region = getattr(resource, "region", None)
+    if getattr(region, "name", None):
+        return region.name
+    return aws_region()
+
+
+class Waiter(object):
+    """Models a set of EC2 resources of the same kind which are waited
+    together until each of them reach its condition.
+
+    :type kind: str
+    :param kind: the kind of resources to wait, "instances" or "volumes".
+
+    :type timeout: float
+    :param timeout: the maximum number of seconds to wait, by default the
+        ``ec2_wait_timeout`` variable in the environment.
+    """
+    def __init__(self, kind="instances", timeout=None):
+        if kind not in EC2_WAIT_FAILED_STATES:
+            raise ValueError("Unable to wait for %s" % kind)
+        self.kind = kind
+        self.timeout = timeout if timeout is not None else \
+            _env_float("ec2_wait_timeout", 600)
+        self.rounds = 0
+        self._items = OrderedDict()
+
+    def add(self, resource, until, callback=None, region=None):
+        """Add a resource to wait for.
+
+        :param resource: an instance or volume object, or its id.
+
+        :type until: str, list or callable
+        :param until: the state (or list of states) to wait for, or a
+            function which receives the resource and return True when
+            the condition is reached.
+
+        :type callback: callable
+        :param callback: a function called on each change of state of the
+            resource, which receives the resource, the old state (None the
+            first time that the resource is seen) and the new one.
+
+        :type region: str
+        :param region: the region of the resource, by default the region
+            of the resource object, or the current one.
+        """
+        if isinstance(until, basestring):
+            until = [until]
+        if not callable(until):
+            until = (lambda states: lambda x: _resource_state(self.kind, x)
+                     in states)(list(until))
+
+        resource_id = getattr(resource, "id", resource)
+        region = region or _resource_region(resource)
+        self._items[(region, resource_id)] = AttrDict(
+            id=resource_id,
+            region=region,
+            resource=resource if not isinstance(resource, basestring) else None,
+            until=until,
+            callback=callback,
+            state=None,
+            done=False,
+            failed=False,
+        )
+        return self
+
+    def pending(self):
+        """Return the list of resources which have not reached their
+        condition yet, nor failed.
+        """
+        return [x for x in self._items.values() if not x.done and not x.failed]
+
+    def _describe(self, chunk):
+        from mico.lib.aws.ec2 import ec2_connect
+
+        region, ids = chunk
+        conn = ec2_connect(region)
+        if self.kind == "instances":
+            reservations = aws_paginate(conn.get_all_reservations, "max_results",
+                                        1000, filters={"instance-id": list(ids)})
+            return [i for r in reservations for i in r.instances]
+        return conn.get_all_volumes(filters={"volume-id": list(ids)})
+
+    def poll(self):
+        """Run one round: describe all the pending resources, update them
+        and check their conditions. Return the number of resources still
+        pending.
+        """
+        from mico.lib.aws.ec2 import EC2_DESCRIBE_SIZE
+
+        regions = OrderedDict()
+        for item in self.pending():
+            regions.setdefault(item.region, []).append(item.id)
+
+        chunks = [(region, tuple(ids[i:i + EC2_DESCRIBE_SIZE]))
+                  for region, ids in regions.items()
+                  for i in range(0, len(ids), EC2_DESCRIBE_SIZE)]
+
+        self.rounds += 1
+        for (region, _), resources in imap_unordered(self._describe, chunks):
+            for resource in resources:
+                item = self._items.get((region, resource.id), None)
+                if item is None or item.done or item.failed:
+                    continue
+                if item.resource is None:
+                    item.resource = resource
+                else:
+                    item.resource._update(resource)
+
+                state = _resource_state(self.kind, item.resource)
+                if state != item.state:
+                    mico.output.debug("%s %s is %s" % (
+                        self.kind[:-1], item.id, state,))
+                    if item.callback is not None:
+                        item.callback(item.resource, item.state, state)
+                    item.state = state
+
+                if item.until(item.resource):
+                    item.done = True
+                elif state in EC2_WAIT_FAILED_STATES[self.kind]:
+                    item.failed = True
+
+        # Resources which are not described yet are still pending, EC2 is
+        # eventually consistent and new resources take a while to appear.
+        return len(self.pending())
+
+    def wait(self):
+        """Poll the resources until all of them reach their condition, and
+        return them in the same order that they were added. Raises
+        EC2LibraryError if some resource fails or the deadline is reached.
+        """
+        from mico.lib.aws.ec2 import EC2LibraryError
+
+        delay = _env_float("ec2_wait_delay", 1.0)
+        max_delay = _env_float("ec2_wait_max_delay", 15.0)
+        deadline = time.time() + self.timeout
+
+        while self.poll():
+            left = deadline - time.time()
+            if left <= 0:
+                break
+            time.sleep(min(delay, left))
+            delay = min(max_delay, delay * 1.5)
+
+        failed = [x for x in self._items.values() if x.failed]
+        if failed:
+            raise EC2LibraryError("%s failed while waiting: %s" % (
+                self.kind, ", ".join(["%s (%s)" % (x.id, x.state) for x in failed]),))
+
+        pending = self.pending()
+        if pending:
+            raise EC2LibraryError("timeout after %ds waiting for %s: %s" % (
+                self.timeout, self.kind,
+                ", ".join(["%s (%s)" % (x.id, x.state) for x in pending]),))
+
+        return [x.resource for x in self._items.values()]
+
+
+def ec2_wait(resources, until, kind=None, callback=None, timeout=None):
+    """Wait until all the resources passed as argument reach the condition
+    in until, polling them together (see :class:`Waiter`), and return the
+    updated resources.
+
+    :type resources: list
+    :param resources: a list of instances or volumes (or their ids).
+
+    :type until: str, list or callable
+    :param until: the state, the list of states or a function which
+        returns True when the resource reaches the condition.
+
+    :type kind: str
+    :param kind: "instances" or "volumes", by default it is guessed from
+        the first resource.
+
+    :type callback: callable
+    :param callback: a function called on each change of state, see
+        :meth:`Waiter.add`.
+
+    :type timeout: float
+    :param timeout: the maximum number of seconds to wait.
+    """
+    resources = list(resources)
+    if not resources:
+        return []
+
+    if kind is None:
+        _id = getattr(resources[0], "id", resources[0])
+        kind = "volumes" if _id.startswith("vol-") else "instances"
+
+    waiter = Waiter(kind, timeout=timeout)
+    for resource in resources:
+        waiter.add(resource, until, callback)
+    return waiter.wait()
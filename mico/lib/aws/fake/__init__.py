@@ -0,0 +1,255 @@
+#! /usr/bin/env python
+# -*- encoding: utf-8 -*-
+# vim:fenc=utf-8:
+
+"""The fake package provides an in-memory stand-in for the AWS services
+used by mico (EC2, autoscale, CloudWatch, ELB, Route53 and IAM), to run
+the library, the stacks and the benchmarks without network nor an AWS
+account.
+
+The fake backend is selected setting ``aws_backend`` to "fake" in the
+environment, so every connection returned by the ``*_connect`` helpers is
+a fake one (see :func:`mico.lib.aws.connection.aws_connection`). The
+connect helpers still require the AWS credentials to be set, any value is
+valid, for example::
+
+    AWS_ACCESS_KEY_ID=fake AWS_SECRET_ACCESS_KEY=fake \\
+        mico -e aws_backend=fake -e aws_fake_seed=instances=1000 ec2 ls
+
+Fake connections are real boto connections which serve the requests from
+memory: responses are XML documents parsed by boto as usual, so the cost
+of parsing is accounted, but not the cost of the network. The following
+variables in the environment change the behaviour of the backend:
+
+``aws_fake_seed``
+    resources to create the first time that the backend is used, as the
+    keyword arguments of :func:`aws_fake_seed` in a comma separated list,
+    i.e. ``instances=10000,security_groups=20``.
+
+``aws_fake_latency``
+    seconds to wait on each request, or a dictionary of seconds by
+    operation name, with "*" for the rest of operations.
+
+``aws_fake_throttle``
+    probability (from 0 to 1) to throttle a request.
+
+``aws_fake_delay``
+    seconds that resources take to change from a transitional state to
+    the next one (i.e. pending to running), 0 by default.
+"""
+
+import threading
+
+from mico import env
+from mico.util.dicts import AttrDict
+from mico.lib.aws.region import aws_region
+from mico.lib.aws.fake.base import fake_backend
+from mico.lib.aws.fake.ec2 import ec2_fake_connection
+from mico.lib.aws.fake.ec2 import launch_instance
+from mico.lib.aws.fake.ec2 import new_security_group
+from mico.lib.aws.fake.ec2 import new_volume
+from mico.lib.aws.fake.ec2 import attach_volume
+from mico.lib.aws.fake.autoscale import as_fake_connection
+from mico.lib.aws.fake.autoscale import new_launch_configuration
+from mico.lib.aws.fake.autoscale import new_autoscaling_group
+from mico.lib.aws.fake.autoscale import new_policy
+from mico.lib.aws.fake.cw import cw_fake_connection
+from mico.lib.aws.fake.cw import new_alarm
+from mico.lib.aws.fake.elb import elb_fake_connection
+from mico.lib.aws.fake.r53 import r53_fake_connection
+from mico.lib.aws.fake.r53 import new_hosted_zone
+from mico.lib.aws.fake.r53 import new_record
+from mico.lib.aws.fake.iam import iam_fake_connection
+
+
+# Region used when no region is configured in the environment.
+FAKE_DEFAULT_REGION = "us-east-1"
+
+_factories = {
+    "ec2": ec2_fake_connection,
+    "autoscale": as_fake_connection,
+    "cloudwatch": cw_fake_connection,
+    "elb": elb_fake_connection,
+    "route53": r53_fake_connection,
+    "iam": iam_fake_connection,
+}
+
+_seeded = threading.Event()
+_seed_lock = threading.Lock()
+
+
+def _env_seed():
+    """Create the resources configured in the ``aws_fake_seed`` variable
+    of the environment, only once.
+    """
+    with _seed_lock:
+        if _seeded.is_set():
+            return
+        _seeded.set()
+
+        seed = env.get("aws_fake_seed", None)
+        if not seed:
+            return
+        if not isinstance(seed, dict):
+            seed = dict([x.strip().split("=", 1) for x in seed.split(",")
+                         if "=" in x])
+        kwargs = {}
+        for key, value in seed.items():
+            try:
+                kwargs[key] = int(value)
+            except ValueError:
+                kwargs[key] = value
+        aws_fake_seed(**kwargs)
+
+
+def aws_fake_connection(service, region=None):
+    """Return a new fake connection to the service and region passed as
+    arguments.
+    """
+    if service not in _factories:
+        raise ValueError("The fake backend does not support %s" % service)
+    if not _seeded.is_set():
+        _env_seed()
+    return _factories[service](region or FAKE_DEFAULT_REGION)
+
+
+def aws_fake():
+    """Return the fake backend, which keeps the state of the fake account,
+    see :class:`mico.lib.aws.fake.base.FakeBackend`.
+    """
+    return fake_backend
+
+
+def aws_fake_seed(instances=0, name="host-%05d", region=None,
+                  security_groups=1, volumes=0, autoscaling_groups=0,
+                  autoscaling_size=2, alarms=0, events=0, records=0,
+                  domain="example.com."):
+    """Create resources in the fake backend, without issuing requests, so
+    fleets of any size are created in a few seconds. Return an AttrDict
+    with the ids (or names) of the resources created by kind.
+
+    :type instances: int
+    :param instances: number of running instances, spread over the zones
+        and the security groups, and tagged with the Name in name.
+
+    :type name: str
+    :param name: the pattern of the Name tag of instances, formatted with
+        the number of the instance.
+
+    :type region: str
+    :param region: the region where resources are created, by default the
+        current region.
+
+    :type security_groups: int
+    :param security_groups: number of security groups, named "group-N".
+        Each group allows SSH from anywhere, and all groups but the first
+        one allow TCP traffic from the first one.
+
+    :type volumes: int
+    :param volumes: number of data volumes, named "volume-N", which are
+        attached to the instances in turn (as /dev/sdf) if there are any.
+
+    :type autoscaling_groups: int
+    :param autoscaling_groups: number of autoscaling groups, named "asg-N",
+        with autoscaling_size instances each.
+
+    :type alarms: int
+    :param alarms: number of CPU alarms, named "alarm-N", which trigger a
+        scaling policy of the autoscaling groups in turn if there are any.
+
+    :type events: int
+    :param events: number of instances with a scheduled event.
+
+    :type records: int
+    :param records: number of A records in the hosted zone domain, which
+        point to the instances in turn if there are any.
+    """
+    region = fake_backend.region(region or aws_region() or FAKE_DEFAULT_REGION)
+    zones = region.zones()
+    ret = AttrDict(instances=[], security_groups=[], volumes=[],
+                   autoscaling_groups=[], alarms=[], hosted_zone=None)
+
+    with fake_backend.lock:
+        groups = []
+        for i in range(security_groups):
+            group = new_security_group(region, "group-%03d" % i)
+            group["rules"].append(("tcp", "22", "22", "cidr", "0.0.0.0/0"))
+            if groups:
+                group["rules"].append(("tcp", "0", "65535", "group", groups[0]["id"]))
+            groups.append(group)
+            ret.security_groups.append(group["id"])
+
+        for i in range(instances):
+            record = launch_instance(
+                region,
+                zone=zones[i % len(zones)],
+                groups=[groups[i % len(groups)]["id"]] if groups else [],
+                tags={"Name": name % i})
+            if i < events:
+                record["events"].append({
+                    "code": "system-reboot",
+                    "description": "scheduled reboot",
+                    "not_before": record["launch_time"] + 86400,
+                    "not_after": record["launch_time"] + 90000,
+                })
+            ret.instances.append(record["id"])
+
+        for i in range(volumes):
+            instance = region.instances[ret.instances[i % instances]] \
+                if instances else None
+            volume = new_volume(region, 10,
+                                instance["zone"] if instance else zones[i % len(zones)],
+                                tags={"Name": "volume-%05d" % i})
+            if instance is not None and "/dev/sdf" not in instance["devices"]:
+                attach_volume(region, volume, instance, "/dev/sdf", pending=False)
+            ret.volumes.append(volume["id"])
+
+        for i in range(autoscaling_groups):
+            config = new_launch_configuration(
+                region, "asg-%03d-config" % i,
+                security_groups=[groups[0]["name"]] if groups else [])
+            new_autoscaling_group(
+                region, "asg-%03d" % i, config["name"], zones,
+                min_size=0, max_size=max(autoscaling_size, 1) * 2,
+                desired=autoscaling_size,
+                tags=[{"key": "Name", "value": "asg-%03d" % i,
+                       "propagate": True, "resource": "asg-%03d" % i}])
+            ret.autoscaling_groups.append("asg-%03d" % i)
+        region.settle()
+
+        for i in range(alarms):
+            actions, dimensions = [], []
+            if autoscaling_groups:
+                group = ret.autoscaling_groups[i % autoscaling_groups]
+                policy = new_policy(region, group, "policy-%05d" % i)
+                actions.append(policy["arn"])
+                dimensions.append(("AutoScalingGroupName", group))
+            new_alarm(region, "alarm-%05d" % i, actions=actions,
+                      dimensions=dimensions)
+            ret.alarms.append("alarm-%05d" % i)
+
+        if records:
+            zone = new_hosted_zone(fake_backend.region("global"), domain)
+            for i in range(records):
+                instance = region.instances[ret.instances[i % instances]] \
+                    if instances else None
+                new_record(zone, "%s.%s" % (name % i, zone["name"]), "A",
+                           [instance["ip"] if instance else "10.0.%d.%d" % (
+                            (i >> 8) & 255, i & 255)])
+            ret.hosted_zone = zone["id"]
+
+    return ret
+
+
+def aws_fake_reset():
+    """Drop all the resources of the fake backend, and the connections and
+    inventories which refer to them. The resources in ``aws_fake_seed`` are
+    created again the next time that the backend is used.
+    """
+    from mico.lib.aws.connection import connection_pool
+    from mico.lib.aws.inventory import aws_inventory_reset
+
+    fake_backend.reset()
+    connection_pool.clear()
+    aws_inventory_reset()
+    _seeded.clear()
@@ -0,0 +1,526 @@
+#! /usr/bin/env python
+# -*- encoding: utf-8 -*-
+# vim:fenc=utf-8:
+
+"""The fake autoscale service implements the operations on launch
+configurations, autoscaling groups, scaling policies and activities used
+by mico.
+
+Groups are scaled lazily: operations which change the capacity of a group
+mark it as dirty, and the instances are launched or terminated in the fake
+EC2 service the next time that the region is used.
+"""
+
+import time
+
+from boto.regioninfo import RegionInfo
+from boto.ec2.autoscale import AutoScaleConnection
+
+from mico.lib.aws.fake.base import FAKE_ACCOUNT_ID
+from mico.lib.aws.fake.base import FakeConnection
+from mico.lib.aws.fake.base import FakeError
+from mico.lib.aws.fake.base import FakeRegion
+from mico.lib.aws.fake.base import fake_backend
+from mico.lib.aws.fake.base import node
+from mico.lib.aws.fake.base import nodes
+from mico.lib.aws.fake.base import param_bool
+from mico.lib.aws.fake.base import param_int
+from mico.lib.aws.fake.base import param_list
+from mico.lib.aws.fake.base import param_structs
+from mico.lib.aws.fake.base import paginate
+from mico.lib.aws.fake.base import settled
+from mico.lib.aws.fake.ec2 import EC2_DEAD_STATES
+from mico.lib.aws.fake.ec2 import default_security_group
+from mico.lib.aws.fake.ec2 import launch_instance
+from mico.lib.aws.fake.ec2 import terminate_instance
+
+
+AS_LIFECYCLE_STATES = {
+    "pending": "Pending",
+    "running": "InService",
+    "stopping": "InService",
+    "stopped": "InService",
+    "shutting-down": "Terminating",
+    "terminated": "Terminated",
+}
+
+
+def _timestamp(when):
+    # Activities are parsed with microseconds by boto.
+    return time.strftime("%Y-%m-%dT%H:%M:%S.000000Z", time.gmtime(when))
+
+
+def _arn(region, kind, name):
+    return "arn:aws:autoscaling:%s:%s:%s:%s:%s" % (
+        region.name, FAKE_ACCOUNT_ID, kind, fake_backend.new_id("uuid", 12), name,)
+
+
+def new_launch_configuration(region, name, image_id="ami-00000000",
+                             instance_type="m1.small", key_name=None,
+                             security_groups=None, user_data=None):
+    """Create a new launch configuration record in the region."""
+    record = {
+        "name": name,
+        "arn": _arn(region, "launchConfiguration", "launchConfigurationName/%s" % name),
+        "image_id": image_id,
+        "instance_type": instance_type or "m1.small",
+        "key_name": key_name,
+        "security_groups": list(security_groups or []),
+        "user_data": user_data,
+        "monitoring": True,
+        "created": time.time(),
+    }
+    region.launch_configurations[name] = record
+    return record
+
+
+def new_autoscaling_group(region, name, launch_configuration, zones,
+                          min_size=0, max_size=0, desired=None,
+                          load_balancers=None, tags=None):
+    """Create a new autoscaling group record in the region, which will
+    launch the instances the next time that the region is used.
+    """
+    record = {
+        "name": name,
+        "arn": _arn(region, "autoScalingGroup", "autoScalingGroupName/%s" % name),
+        "launch_configuration": launch_configuration,
+        "zones": list(zones),
+        "min_size": min_size,
+        "max_size": max_size,
+        "desired": min_size if desired is None else desired,
+        "load_balancers": list(load_balancers or []),
+        "tags": list(tags or []),
+        "suspended": [],
+        "instances": [],
+        "cooldown": 300,
+        "created": time.time(),
+    }
+    region.autoscaling_groups[name] = record
+    region.dirty.add(name)
+    return record
+
+
+def new_policy(region, group, name, adjustment_type="ChangeInCapacity",
+               adjustment=1, cooldown=None):
+    """Create (or update) a scaling policy record of the autoscaling group
+    in the region.
+    """
+    key = (group, name)
+    record = region.policies.get(key, None)
+    if record is None:
+        record = region.policies[key] = {
+            "name": name,
+            "group": group,
+            "arn": _arn(region, "scalingPolicy", "autoScalingGroupName/%s:"
+                        "policyName/%s" % (group, name,)),
+        }
+    record["adjustment_type"] = adjustment_type
+    record["adjustment"] = adjustment
+    record["cooldown"] = cooldown
+    return record
+
+
+def _activity(region, group, description):
+    region.activities.append({
+        "id": fake_backend.new_id("activity", 12),
+        "group": group["name"],
+        "time": time.time(),
+        "description": description,
+        "cause": "At %s an instance was required to bring the group to its "
+                 "desired capacity of %d." % (_timestamp(time.time()),
+                                               group["desired"],),
+    })
+
+
+def _launch(region, group):
+    config = region.launch_configurations.get(group["launch_configuration"], None)
+    if config is None:
+        return None
+
+    groups = []
+    for name in config["security_groups"]:
+        for record in region.security_groups.values():
+            if name in (record["id"], record["name"]):
+                groups.append(record["id"])
+                break
+    groups = groups or [default_security_group(region)["id"]]
+
+    tags = dict([(x["key"], x["value"]) for x in group["tags"] if x["propagate"]])
+    tags["aws:autoscaling:groupName"] = group["name"]
+
+    return launch_instance(
+        region,
+        image_id=config["image_id"],
+        instance_type=config["instance_type"],
+        key_name=config["key_name"],
+        zone=group["zones"][len(group["instances"]) % len(group["zones"])],
+        groups=groups,
+        tags=tags,
+        state="pending",
+        user_data=config["user_data"],
+    )
+
+
+def _settle_autoscaling_groups(region):
+    """Launch or terminate the instances of the dirty autoscaling groups of
+    the region until they reach their desired capacity.
+    """
+    now = time.time()
+    for name in list(region.dirty):
+        group = region.autoscaling_groups.get(name, None)
+        region.dirty.discard(name)
+        if group is None:
+            continue
+
+        group["instances"] = [x for x in group["instances"]
+                              if x in region.instances and
+                              settled(region.instances[x], now)["state"]
+                              not in EC2_DEAD_STATES]
+
+        while len(group["instances"]) < group["desired"] and \
+                "Launch" not in group["suspended"]:
+            record = _launch(region, group)
+            if record is None:
+                break
+            group["instances"].append(record["id"])
+            _activity(region, group, "Launching a new EC2 instance: %s" % record["id"])
+
+        while len(group["instances"]) > group["desired"] and \
+                "Terminate" not in group["suspended"]:
+            instance_id = group["instances"].pop()
+            terminate_instance(region, region.instances[instance_id])
+            region.dirty.discard(name)
+            _activity(region, group, "Terminating EC2 instance: %s" % instance_id)
+
+FakeRegion.settlers.append(_settle_autoscaling_groups)
+
+
+class FakeAutoScaleConnection(FakeConnection, AutoScaleConnection):
+    """Models a fake connection to the autoscale service."""
+    fake_xmlns = "http://autoscaling.amazonaws.com/doc/2011-01-01/"
+
+    def _group(self, region, params):
+        name = params.get("AutoScalingGroupName")
+        if name not in region.autoscaling_groups:
+            raise FakeError("ValidationError",
+                            "AutoScalingGroup name not found - %s" % name)
+        return region.autoscaling_groups[name]
+
+    def _check_sizes(self, group):
+        if group["min_size"] > group["max_size"]:
+            raise FakeError("ValidationError", "MinSize must be less than or "
+                            "equal to MaxSize")
+        if not group["min_size"] <= group["desired"] <= group["max_size"]:
+            raise FakeError("ValidationError", "Desired capacity:%d must be "
+                            "between the specified min size:%d and max size:%d" % (
+                            group["desired"], group["min_size"], group["max_size"],))
+
+    # Launch configurations
+
+    def fake_DescribeLaunchConfigurations(self, region, params):
+        names = param_list(params, "LaunchConfigurationNames.member")
+        if names:
+            records = [region.launch_configurations[x] for x in names
+                       if x in region.launch_configurations]
+        else:
+            records = region.launch_configurations.values()
+        page, token = paginate(records, params, 50, "MaxRecords")
+
+        return self.fake_response("DescribeLaunchConfigurations", nodes(
+            "LaunchConfigurations", [nodes("member", [
+                node("LaunchConfigurationName", x["name"]),
+                node("LaunchConfigurationARN", x["arn"]),
+                node("ImageId", x["image_id"]),
+                node("InstanceType", x["instance_type"]),
+                node("KeyName", x["key_name"] or ""),
+                nodes("SecurityGroups", [node("member", y)
+                                         for y in x["security_groups"]]),
+                node("UserData", x["user_data"] or ""),
+                nodes("InstanceMonitoring", [node("Enabled", x["monitoring"])]),
+                nodes("BlockDeviceMappings", []),
+                node("CreatedTime", _timestamp(x["created"])),
+            ]) for x in page]) + (node("NextToken", token) if token else ""))
+
+    def fake_CreateLaunchConfiguration(self, region, params):
+        name = params.get("LaunchConfigurationName")
+        if name in region.launch_configurations:
+            raise FakeError("AlreadyExists", "Launch Configuration by this name "
+                            "already exists - A launch configuration already "
+                            "exists with the name %s" % name)
+        record = new_launch_configuration(
+            region, name,
+            image_id=params.get("ImageId"),
+            instance_type=params.get("InstanceType", None),
+            key_name=params.get("KeyName", None),
+            security_groups=param_list(params, "SecurityGroups.member"),
+            user_data=params.get("UserData", None))
+        record["monitoring"] = param_bool(params, "InstanceMonitoring.Enabled", True)
+        return self.fake_response("CreateLaunchConfiguration", "")
+
+    def fake_DeleteLaunchConfiguration(self, region, params):
+        name = params.get("LaunchConfigurationName")
+        if name not in region.launch_configurations:
+            raise FakeError("ValidationError", "Launch configuration name not "
+                            "found - Launch configuration %s not found" % name)
+        for group in region.autoscaling_groups.values():
+            if group["launch_configuration"] == name:
+                raise FakeError("ResourceInUse", "Cannot delete launch "
+                                "configuration %s because it is attached to "
+                                "AutoScalingGroup %s" % (name, group["name"],))
+        del region.launch_configurations[name]
+        return self.fake_response("DeleteLaunchConfiguration", "")
+
+    # Autoscaling groups
+
+    def _tags(self, params):
+        return [{"key": x["Key"], "value": x.get("Value", ""),
+                 "propagate": unicode(x.get("PropagateAtLaunch", "false")).lower() == "true",
+                 "resource": x.get("ResourceId", None)}
+                for x in param_structs(params, "Tags.member")]
+
+    def _group_xml(self, region, group):
+        now = time.time()
+        return nodes("member", [
+            node("AutoScalingGroupName", group["name"]),
+            node("AutoScalingGroupARN", group["arn"]),
+            node("LaunchConfigurationName", group["launch_configuration"]),
+            node("MinSize", group["min_size"]),
+            node("MaxSize", group["max_size"]),
+            node("DesiredCapacity", group["desired"]),
+            node("DefaultCooldown", group["cooldown"]),
+            nodes("AvailabilityZones", [node("member", x) for x in group["zones"]]),
+            nodes("LoadBalancerNames", [node("member", x)
+                                        for x in group["load_balancers"]]),
+            node("HealthCheckType", "EC2"),
+            node("HealthCheckGracePeriod", 0),
+            nodes("Instances", [nodes("member", [
+                node("InstanceId", x),
+                node("AvailabilityZone", region.instances[x]["zone"]),
+                node("HealthStatus", "Healthy"),
+                node("LifecycleState", AS_LIFECYCLE_STATES[
+                    settled(region.instances[x], now)["state"]]),
+                node("LaunchConfigurationName", group["launch_configuration"]),
+            ]) for x in group["instances"] if x in region.instances]),
+            nodes("SuspendedProcesses", [nodes("member", [
+                node("ProcessName", x),
+                node("SuspensionReason", "User suspended at %s" % _timestamp(group["created"])),
+            ]) for x in group["suspended"]]),
+            nodes("Tags", [nodes("member", [
+                node("ResourceId", group["name"]),
+                node("ResourceType", "auto-scaling-group"),
+                node("Key", x["key"]),
+                node("Value", x["value"]),
+                node("PropagateAtLaunch", x["propagate"]),
+            ]) for x in group["tags"]]),
+            nodes("EnabledMetrics", []),
+            nodes("TerminationPolicies", [node("member", "Default")]),
+            node("CreatedTime", _timestamp(group["created"])),
+        ])
+
+    def fake_DescribeAutoScalingGroups(self, region, params):
+        names = param_list(params, "AutoScalingGroupNames.member")
+        if names:
+            records = [region.autoscaling_groups[x] for x in names
+                       if x in region.autoscaling_groups]
+        else:
+            records = region.autoscaling_groups.values()
+        page, token = paginate(records, params, 100, "MaxRecords")
+        return self.fake_response("DescribeAutoScalingGroups", nodes(
+            "AutoScalingGroups", [self._group_xml(region, x) for x in page]) +
+            (node("NextToken", token) if token else ""))
+
+    def fake_CreateAutoScalingGroup(self, region, params):
+        name = params.get("AutoScalingGroupName")
+        config = params.get("LaunchConfigurationName")
+        zones = param_list(params, "AvailabilityZones.member")
+
+        if name in region.autoscaling_groups:
+            raise FakeError("AlreadyExists", "AutoScalingGroup by this name "
+                            "already exists - A group with the name %s already "
+                            "exists" % name)
+        if config not in region.launch_configurations:
+            raise FakeError("ValidationError", "Launch configuration name not "
+                            "found - Launch configuration %s not found" % config)
+        if not zones:
+            raise FakeError("ValidationError", "At least one Availability Zone "
+                            "or VPC Subnet is required.")
+        for zone in zones:
+            if zone not in region.zones():
+                raise FakeError("ValidationError", "Invalid Availability Zone "
+                                "[%s]" % zone)
+
+        min_size = param_int(params, "MinSize", 0)
+        max_size = param_int(params, "MaxSize", 0)
+        desired = param_int(params, "DesiredCapacity", None)
+        group = {
+            "min_size": min_size,
+            "max_size": max_size,
+            "desired": min_size if desired is None else desired,
+        }
+        self._check_sizes(group)
+
+        new_autoscaling_group(region, name, config, zones, min_size, max_size,
+                              desired,
+                              param_list(params, "LoadBalancerNames.member"),
+                              self._tags(params))
+        return self.fake_response("CreateAutoScalingGroup", "")
+
+    def fake_UpdateAutoScalingGroup(self, region, params):
+        group = self._group(region, params)
+        updated = dict(group)
+        for key, param in (("min_size", "MinSize"), ("max_size", "MaxSize"),
+                           ("desired", "DesiredCapacity"),
+                           ("cooldown", "DefaultCooldown")):
+            updated[key] = param_int(params, param, group[key])
+        if params.get("LaunchConfigurationName"):
+            updated["launch_configuration"] = params["LaunchConfigurationName"]
+        updated["zones"] = param_list(params, "AvailabilityZones.member") or group["zones"]
+        updated["desired"] = max(updated["min_size"],
+                                 min(updated["max_size"], updated["desired"]))
+        self._check_sizes(updated)
+        group.update(updated)
+        region.dirty.add(group["name"])
+        return self.fake_response("UpdateAutoScalingGroup", "")
+
+    def fake_DeleteAutoScalingGroup(self, region, params):
+        group = self._group(region, params)
+        alive = [x for x in group["instances"] if x in region.instances and
+                 region.instances[x]["state"] not in EC2_DEAD_STATES]
+        if alive and not param_bool(params, "ForceDelete"):
+            raise FakeError("ResourceInUse", "You cannot delete an "
+                            "AutoScalingGroup while there are instances or "
+                            "pending Spot instance request(s) still in the group.")
+        for instance_id in alive:
+            terminate_instance(region, region.instances[instance_id])
+        for key, policy in region.policies.items():
+            if policy["group"] == group["name"]:
+                del region.policies[key]
+        del region.autoscaling_groups[group["name"]]
+        region.dirty.discard(group["name"])
+        return self.fake_response("DeleteAutoScalingGroup", "")
+
+    def fake_SetDesiredCapacity(self, region, params):
+        group = self._group(region, params)
+        desired = param_int(params, "DesiredCapacity", group["desired"])
+        if not group["min_size"] <= desired <= group["max_size"]:
+            raise FakeError("ValidationError", "New SetDesiredCapacity value %d "
+                            "is below min value %d or above max value %d for the "
+                            "AutoScalingGroup." % (desired, group["min_size"],
+                                                   group["max_size"],))
+        group["desired"] = desired
+        region.dirty.add(group["name"])
+        return self.fake_response("SetDesiredCapacity", "")
+
+    def fake_SuspendProcesses(self, region, params):
+        group = self._group(region, params)
+        processes = param_list(params, "ScalingProcesses.member") or [
+            "Launch", "Terminate", "HealthCheck", "ReplaceUnhealthy",
+            "AZRebalance", "AlarmNotification", "ScheduledActions",
+            "AddToLoadBalancer"]
+        for process in processes:
+            if process not in group["suspended"]:
+                group["suspended"].append(process)
+        return self.fake_response("SuspendProcesses", "")
+
+    def fake_ResumeProcesses(self, region, params):
+        group = self._group(region, params)
+        processes = param_list(params, "ScalingProcesses.member")
+        group["suspended"] = [x for x in group["suspended"]
+                              if processes and x not in processes]
+        region.dirty.add(group["name"])
+        return self.fake_response("ResumeProcesses", "")
+
+    def fake_CreateOrUpdateTags(self, region, params):
+        tags = self._tags(params)
+        for tag in tags:
+            if tag["resource"] not in region.autoscaling_groups:
+                raise FakeError("ValidationError", "AutoScalingGroup name not "
+                                "found - %s" % tag["resource"])
+        for tag in tags:
+            group = region.autoscaling_groups[tag["resource"]]
+            group["tags"] = [x for x in group["tags"] if x["key"] != tag["key"]]
+            group["tags"].append(tag)
+            if tag["propagate"]:
+                # Instances which are still launching take the tags of the
+                # group when they finish, as in AWS.
+                for instance_id in group["instances"]:
+                    instance = region.instances.get(instance_id, None)
+                    if instance is not None and instance["state"] == "pending":
+                        instance["tags"][tag["key"]] = tag["value"]
+        return self.fake_response("CreateOrUpdateTags", "")
+
+    # Policies
+
+    def fake_PutScalingPolicy(self, region, params):
+        group = self._group(region, params)
+        record = new_policy(region, group["name"], params.get("PolicyName"),
+                            params.get("AdjustmentType"),
+                            param_int(params, "ScalingAdjustment", 0),
+                            param_int(params, "Cooldown", None))
+        return self.fake_response("PutScalingPolicy", node("PolicyARN", record["arn"]))
+
+    def fake_DescribePolicies(self, region, params):
+        group = params.get("AutoScalingGroupName", None)
+        names = param_list(params, "PolicyNames.member")
+        records = [x for x in region.policies.values()
+                   if (group is None or x["group"] == group) and
+                   (not names or x["name"] in names or x["arn"] in names)]
+        page, token = paginate(records, params, 50, "MaxRecords")
+
+        alarms = {}
+        for alarm in region.alarms.values():
+            for action in alarm["actions"]:
+                alarms.setdefault(action, []).append(alarm)
+
+        return self.fake_response("DescribePolicies", nodes(
+            "ScalingPolicies", [nodes("member", [
+                node("PolicyName", x["name"]),
+                node("PolicyARN", x["arn"]),
+                node("AutoScalingGroupName", x["group"]),
+                node("AdjustmentType", x["adjustment_type"]),
+                node("ScalingAdjustment", x["adjustment"]),
+                node("Cooldown", x["cooldown"]) if x["cooldown"] is not None else "",
+                nodes("Alarms", [nodes("member", [
+                    node("AlarmName", y["name"]),
+                    node("AlarmARN", y["arn"]),
+                ]) for y in alarms.get(x["arn"], [])]),
+            ]) for x in page]) + (node("NextToken", token) if token else ""))
+
+    def fake_DeletePolicy(self, region, params):
+        name = params.get("PolicyName")
+        group = params.get("AutoScalingGroupName", None)
+        for key, record in region.policies.items():
+            if name in (record["name"], record["arn"]) and \
+                    (group is None or record["group"] == group):
+                del region.policies[key]
+                return self.fake_response("DeletePolicy", "")
+        raise FakeError("ValidationError", "Policy %s not found" % name)
+
+    # Activities
+
+    def fake_DescribeScalingActivities(self, region, params):
+        group = params.get("AutoScalingGroupName", None)
+        ids = param_list(params, "ActivityIds.member")
+        records = [x for x in reversed(region.activities)
+                   if (group is None or x["group"] == group) and
+                   (not ids or x["id"] in ids)]
+        page, token = paginate(records, params, 100, "MaxRecords")
+        return self.fake_response("DescribeScalingActivities", nodes(
+            "Activities", [nodes("member", [
+                node("ActivityId", x["id"]),
+                node("AutoScalingGroupName", x["group"]),
+                node("Description", x["description"]),
+                node("Cause", x["cause"]),
+                node("StartTime", _timestamp(x["time"])),
+                node("EndTime", _timestamp(x["time"])),
+                node("StatusCode", "Successful"),
+                node("Progress", 100),
+            ]) for x in page]) + (node("NextToken", token) if token else ""))
+
+
+def as_fake_connection(region):
+    return FakeAutoScaleConnection(
+        "fake", "fake",
+        region=RegionInfo(name=region,
+                          endpoint="autoscaling.%s.amazonaws.com" % region)
+    )
@@ -0,0 +1,356 @@
+#! /usr/bin/env python
+# -*- encoding: utf-8 -*-
+# vim:fenc=utf-8:
+
+"""The base module of the fake backend provides the in-memory state of the
+fake AWS account, the response objects returned to boto, and the helpers
+used by the fake services to parse the query parameters sent by boto and
+to build the XML responses.
+"""
+
+import time
+import random
+import threading
+from collections import OrderedDict
+from xml.sax.saxutils import escape
+
+from boto.exception import BotoServerError
+
+from mico import env
+
+
+# Account id used in the ARNs and owner ids of the fake resources.
+FAKE_ACCOUNT_ID = "123456789012"
+
+# Region used by the global services (Route53 and IAM).
+FAKE_GLOBAL_REGION = "global"
+
+
+class FakeError(Exception):
+    """Models an error returned by the fake backend, which is sent to boto
+    as an error response with the code and message passed as arguments.
+    """
+    def __init__(self, code, message, status=400):
+        super(FakeError, self).__init__(message)
+        self.code = code
+        self.message = message
+        self.status = status
+
+
+class FakeResponse(object):
+    """Models a HTTP response of the fake backend, with the minimal
+    interface of the responses that boto reads.
+    """
+    def __init__(self, status, reason, body):
+        self.status = status
+        self.reason = reason
+        self.body = body
+
+    def read(self):
+        return self.body
+
+    def getheader(self, name, default=None):
+        return default
+
+    def getheaders(self):
+        return []
+
+
+def timestamp(when=None):
+    """Return the ISO 8601 representation of the time passed as argument,
+    as used by AWS in the responses.
+    """
+    when = time.time() if when is None else when
+    return time.strftime("%Y-%m-%dT%H:%M:%S.000Z", time.gmtime(when))
+
+
+def node(name, value=None):
+    """Return a XML element with the name and the text passed as arguments,
+    or an empty element if the text is None.
+    """
+    if value is None:
+        return "<%s/>" % name
+    if isinstance(value, bool):
+        value = "true" if value else "false"
+    return "<%s>%s</%s>" % (name, escape(unicode(value)), name)
+
+
+def nodes(name, children):
+    """Return a XML element which contains the XML elements passed as
+    argument.
+    """
+    return "<%s>%s</%s>" % (name, "".join(children), name)
+
+
+def param_list(params, prefix):
+    """Return the list of values of the numbered parameters with the prefix
+    passed as argument (i.e. ``InstanceId.1``, ``InstanceId.2``...), sorted
+    by number.
+    """
+    ret = []
+    _prefix = "%s." % prefix
+    for key, value in params.items():
+        index = key[len(_prefix):]
+        if key.startswith(_prefix) and index.isdigit():
+            ret.append((int(index), value))
+    return [unicode(v) for _, v in sorted(ret)]
+
+
+def param_structs(params, prefix):
+    """Return the list of structures of the numbered parameters with the
+    prefix passed as argument (i.e. ``Filter.1.Name``, ``Filter.1.Value.1``)
+    as dictionaries with the remainder of the key as key, sorted by number.
+    """
+    ret = {}
+    _prefix = "%s." % prefix
+    for key, value in params.items():
+        if not key.startswith(_prefix):
+            continue
+        index, _, rest = key[len(_prefix):].partition(".")
+        if index.isdigit() and rest:
+            ret.setdefault(int(index), {})[rest] = value
+    return [ret[i] for i in sorted(ret)]
+
+
+def param_bool(params, name, default=False):
+    """Return the boolean value of the parameter passed as argument."""
+    value = params.get(name, None)
+    if value is None:
+        return default
+    return unicode(value).lower() == "true"
+
+
+def param_int(params, name, default=None):
+    """Return the integer value of the parameter passed as argument."""
+    value = params.get(name, None)
+    if value is None or value == "":
+        return default
+    try:
+        return int(value)
+    except ValueError:
+        raise FakeError("InvalidParameterValue",
+                        "Value (%s) for parameter %s is invalid" % (value, name))
+
+
+def paginate(items, params, limit, size_name="MaxResults",
+             token_name="NextToken"):
+    """Return a tuple (page, next_token) with the page of items requested
+    by the pagination parameters, where the token is the offset of the next
+    page as string, or None for the last page.
+    """
+    size = min(param_int(params, size_name, limit) or limit, limit)
+    offset = param_int(params, token_name, 0) or 0
+    page = items[offset:offset + size]
+    if offset + size < len(items):
+        return page, str(offset + size)
+    return page, None
+
+
+class FakeRegion(object):
+    """Models the state of the resources of the fake account in one region.
+    Resources are stored as dictionaries in ordered dictionaries indexed by
+    id (or name), so listings are stable between pages.
+
+    Some changes are applied lazily, the next time the region is used,
+    like the state transitions of instances and volumes, or the instances
+    launched by autoscaling groups, see :meth:`settle`.
+    """
+    settlers = []
+
+    def __init__(self, name):
+        self.name = name
+        self.instances = OrderedDict()
+        self.volumes = OrderedDict()
+        self.security_groups = OrderedDict()
+        self.addresses = OrderedDict()
+        self.launch_configurations = OrderedDict()
+        self.autoscaling_groups = OrderedDict()
+        self.policies = OrderedDict()
+        self.activities = []
+        self.alarms = OrderedDict()
+        self.load_balancers = OrderedDict()
+        self.hosted_zones = OrderedDict()
+        self.server_certificates = OrderedDict()
+        self.dirty = set()
+
+    def zones(self):
+        """Return the names of the availability zones of the region."""
+        return ["%s%s" % (self.name, x) for x in "abc"]
+
+    def settle(self):
+        """Apply the pending changes of the resources in the region."""
+        for settler in self.settlers:
+            settler(self)
+
+
+def transition(record, state, target, now=None):
+    """Set the state of the record passed as argument, which becomes the
+    target state after the number of seconds set in the ``aws_fake_delay``
+    environment variable (0 by default, that is, the next time that the
+    record is read).
+    """
+    now = time.time() if now is None else now
+    record["state"] = state
+    record["target"] = target
+    record["until"] = now + _env_float("aws_fake_delay", 0.0)
+
+
+def settled(record, now):
+    """Apply the pending transition of the record if its time is over, and
+    return the record.
+    """
+    if record.get("target") is not None and now >= record["until"]:
+        record["state"] = record["target"]
+        record["target"] = None
+    return record
+
+
+def _env_float(name, default):
+    try:
+        return float(env.get(name, default) or default)
+    except (TypeError, ValueError):
+        return default
+
+
+def _latency(operation):
+    """Return the latency to inject in the operation passed as argument,
+    according to the ``aws_fake_latency`` environment variable, which can
+    be a number of seconds for all the operations, or a dictionary of
+    seconds by operation name, with the key "*" as default.
+    """
+    latency = env.get("aws_fake_latency", None)
+    if isinstance(latency, dict):
+        latency = latency.get(operation, latency.get("*", 0))
+    try:
+        return float(latency or 0)
+    except (TypeError, ValueError):
+        return 0.0
+
+
+class FakeBackend(object):
+    """Models the fake AWS account, which keeps the state of each region and
+    serves the requests of the fake connections. Requests are served one
+    at a time, but the injected latency is waited outside the lock, so
+    concurrent requests overlap as they do against AWS.
+    """
+    def __init__(self):
+        self.lock = threading.RLock()
+        self._regions = {}
+        self._ids = 0
+
+    def region(self, name):
+        """Return the state of the region passed as argument."""
+        with self.lock:
+            if name not in self._regions:
+                self._regions[name] = FakeRegion(name)
+            return self._regions[name]
+
+    def regions(self):
+        with self.lock:
+            return self._regions.keys()
+
+    def new_id(self, prefix, width=8):
+        """Return a new unique resource id with the prefix passed as argument,
+        i.e. ``i-0000002a``.
+        """
+        with self.lock:
+            self._ids += 1
+            return "%s-%0*x" % (prefix, width, self._ids)
+
+    def reset(self):
+        """Drop all the resources in all the regions."""
+        with self.lock:
+            self._regions.clear()
+            self._ids = 0
+
+    def call(self, connection, operation, params):
+        """Serve the operation passed as argument for the connection, and
+        return a :class:`FakeResponse`.
+        """
+        latency = _latency(operation)
+        if latency:
+            time.sleep(latency)
+
+        throttle = _env_float("aws_fake_throttle", 0.0)
+        if throttle and random.random() < throttle:
+            return connection.fake_error(FakeError(connection.fake_throttle_code,
+                                                   "Rate exceeded",
+                                                   connection.fake_throttle_status))
+
+        handler = getattr(connection, "fake_%s" % operation, None)
+        if handler is None:
+            return connection.fake_error(FakeError("InvalidAction",
+                "The action %s is not valid for this web service." % operation))
+
+        try:
+            with self.lock:
+                region = self.region(connection.fake_region)
+                region.settle()
+                return FakeResponse(200, "OK", handler(region, params))
+        except FakeError as e:
+            return connection.fake_error(e)
+
+
+fake_backend = FakeBackend()
+
+
+class FakeConnection(object):
+    """Mixin for the fake connections, which must be the first base class,
+    before the boto connection class. Requests are served by the methods
+    named ``fake_<Operation>`` of the connection, which receive the state
+    of the region and the parameters, and return the body of the response.
+    """
+    fake_throttle_code = "Throttling"
+    fake_throttle_status = 400
+    fake_xmlns = None
+
+    @property
+    def fake_region(self):
+        region = getattr(self, "region", None)
+        return getattr(region, "name", None) or FAKE_GLOBAL_REGION
+
+    def fake_operation(self, *args, **kwargs):
+        """Return a tuple (operation, params) for the arguments of a call to
+        make_request.
+        """
+        action = args[0] if args else kwargs.get("action")
+        params = args[1] if len(args) > 1 else kwargs.get("params", None)
+        return action, dict(params or {})
+
+    def make_request(self, *args, **kwargs):
+        operation, params = self.fake_operation(*args, **kwargs)
+        response = fake_backend.call(self, operation, params)
+        if response.status in (500, 502, 503, 504):
+            # boto retries 5xx responses by itself, and then raises them
+            # out of make_request.
+            raise BotoServerError(response.status, response.reason,
+                                  response.read())
+        return response
+
+    def fake_response(self, operation, result):
+        """Return the body of a successful response of the query APIs."""
+        return '<%sResponse xmlns="%s"><%sResult>%s</%sResult>' \
+               '<ResponseMetadata><RequestId>%s</RequestId></ResponseMetadata>' \
+               '</%sResponse>' % (operation, self.fake_xmlns, operation, result,
+                                  operation, fake_request_id(), operation,)
+
+    def fake_error(self, error):
+        body = '<ErrorResponse xmlns="%s"><Error><Type>Sender</Type>' \
+               '%s%s</Error><RequestId>%s</RequestId></ErrorResponse>' % (
+                   self.fake_xmlns, node("Code", error.code),
+                   node("Message", error.message), fake_request_id(),)
+        return FakeResponse(error.status, "Service Unavailable"
+                            if error.status == 503 else "Bad Request", body)
+
+
+def fake_request_id():
+    return "%08x-0000-0000-0000-000000000000" % random.getrandbits(32)
+
+
+def fake_ip(prefix, number):
+    """Return an IP address in the /8 network passed as argument for the
+    number passed as argument.
+    """
+    return "%d.%d.%d.%d" % (prefix, (number >> 16) & 255,
+                            (number >> 8) & 255, number & 255,)
+
@@ -0,0 +1,132 @@
+#! /usr/bin/env python
+# -*- encoding: utf-8 -*-
+# vim:fenc=utf-8:
+
+"""The fake CloudWatch service implements the operations on metric alarms
+used by mico.
+"""
+
+from boto.regioninfo import RegionInfo
+from boto.ec2.cloudwatch import CloudWatchConnection
+
+from mico.lib.aws.fake.base import FAKE_ACCOUNT_ID
+from mico.lib.aws.fake.base import FakeConnection
+from mico.lib.aws.fake.base import FakeError
+from mico.lib.aws.fake.base import node
+from mico.lib.aws.fake.base import nodes
+from mico.lib.aws.fake.base import param_bool
+from mico.lib.aws.fake.base import param_list
+from mico.lib.aws.fake.base import param_structs
+from mico.lib.aws.fake.base import paginate
+
+
+def new_alarm(region, name, metric="CPUUtilization", namespace="AWS/EC2",
+              statistic="Average", comparison="GreaterThanOrEqualToThreshold",
+              threshold=80.0, period=60, evaluation_periods=2, actions=None,
+              dimensions=None, unit=None, description=None):
+    """Create (or update) a metric alarm record in the region."""
+    previous = region.alarms.get(name, {})
+    record = region.alarms[name] = {
+        "name": name,
+        "arn": previous.get("arn", "arn:aws:cloudwatch:%s:%s:alarm:%s" % (
+            region.name, FAKE_ACCOUNT_ID, name,)),
+        "description": description,
+        "actions_enabled": True,
+        "actions": list(actions or []),
+        "metric": metric,
+        "namespace": namespace,
+        "statistic": statistic,
+        "dimensions": list(dimensions or []),
+        "period": period,
+        "evaluation_periods": evaluation_periods,
+        "threshold": float(threshold),
+        "comparison": comparison,
+        "unit": unit,
+        "state": previous.get("state", "INSUFFICIENT_DATA"),
+    }
+    return record
+
+
+class FakeCloudWatchConnection(FakeConnection, CloudWatchConnection):
+    """Models a fake connection to CloudWatch."""
+    fake_xmlns = "http://monitoring.amazonaws.com/doc/2010-08-01/"
+
+    def fake_DescribeAlarms(self, region, params):
+        names = param_list(params, "AlarmNames.member")
+        prefix = params.get("AlarmNamePrefix", None)
+        state = params.get("StateValue", None)
+        if names:
+            records = [region.alarms[x] for x in names if x in region.alarms]
+        else:
+            records = region.alarms.values()
+        records = [x for x in records
+                   if (prefix is None or x["name"].startswith(prefix)) and
+                   (state is None or x["state"] == state)]
+        page, token = paginate(records, params, 100, "MaxRecords")
+
+        return self.fake_response("DescribeAlarms", nodes(
+            "MetricAlarms", [nodes("member", [
+                node("AlarmName", x["name"]),
+                node("AlarmArn", x["arn"]),
+                node("AlarmDescription", x["description"] or ""),
+                node("ActionsEnabled", x["actions_enabled"]),
+                nodes("AlarmActions", [node("member", y) for y in x["actions"]]),
+                nodes("OKActions", []),
+                nodes("InsufficientDataActions", []),
+                node("MetricName", x["metric"]),
+                node("Namespace", x["namespace"]),
+                node("Statistic", x["statistic"]),
+                nodes("Dimensions", [nodes("member", [node("Name", k), node("Value", v)])
+                                     for k, v in x["dimensions"]]),
+                node("Period", x["period"]),
+                node("EvaluationPeriods", x["evaluation_periods"]),
+                node("Threshold", x["threshold"]),
+                node("ComparisonOperator", x["comparison"]),
+                node("Unit", x["unit"]) if x["unit"] else "",
+                node("StateValue", x["state"]),
+                node("StateReason", "Unchecked: Initial alarm creation"),
+            ]) for x in page]) + (node("NextToken", token) if token else ""))
+
+    def fake_PutMetricAlarm(self, region, params):
+        name = params.get("AlarmName")
+        for required in ("AlarmName", "MetricName", "Namespace", "Statistic",
+                         "ComparisonOperator", "Threshold",
+                         "EvaluationPeriods", "Period"):
+            if params.get(required, None) in (None, ""):
+                raise FakeError("ValidationError", "The parameter %s is "
+                                "required." % required)
+
+        record = new_alarm(
+            region, name,
+            metric=params["MetricName"],
+            namespace=params["Namespace"],
+            statistic=params["Statistic"],
+            comparison=params["ComparisonOperator"],
+            threshold=params["Threshold"],
+            period=params["Period"],
+            evaluation_periods=params["EvaluationPeriods"],
+            actions=param_list(params, "AlarmActions.member"),
+            dimensions=[(x["Name"], x.get("Value", ""))
+                        for x in param_structs(params, "Dimensions.member")],
+            unit=params.get("Unit", None),
+            description=params.get("AlarmDescription", None))
+        record["actions_enabled"] = param_bool(params, "ActionsEnabled", True)
+        return self.fake_response("PutMetricAlarm", "")
+
+    def fake_DeleteAlarms(self, region, params):
+        names = param_list(params, "AlarmNames.member")
+        for name in names:
+            if name not in region.alarms:
+                raise FakeError("ResourceNotFound", "alarm %s does not exist" % name,
+                                status=404)
+        for name in names:
+            del region.alarms[name]
+        return self.fake_response("DeleteAlarms", "")
+
+
+def cw_fake_connection(region):
+    return FakeCloudWatchConnection(
+        "fake", "fake",
+        region=RegionInfo(name=region,
+                          endpoint="monitoring.%s.amazonaws.com" % region)
+    )
@@ -0,0 +1,1079 @@
+#! /usr/bin/env python
+# -*- encoding: utf-8 -*-
+# vim:fenc=utf-8:
+
+"""The fake EC2 service implements the operations on instances, volumes,
+security groups, addresses and availability zones used by mico.
+
+Network interfaces are not modelled apart: each instance which is not
+terminated has one network interface, with the security groups of the
+instance, and the same id number than the instance, unless the instance
+is marked as "classic" (an instance in EC2-Classic).
+"""
+
+import time
+
+from boto.regioninfo import RegionInfo
+from boto.ec2.connection import EC2Connection
+
+from mico.util.matcher import GlobMatcher
+from mico.lib.aws.fake.base import FAKE_ACCOUNT_ID
+from mico.lib.aws.fake.base import FakeConnection
+from mico.lib.aws.fake.base import FakeError
+from mico.lib.aws.fake.base import FakeResponse
+from mico.lib.aws.fake.base import fake_backend
+from mico.lib.aws.fake.base import fake_ip
+from mico.lib.aws.fake.base import fake_request_id
+from mico.lib.aws.fake.base import node
+from mico.lib.aws.fake.base import nodes
+from mico.lib.aws.fake.base import param_bool
+from mico.lib.aws.fake.base import param_int
+from mico.lib.aws.fake.base import param_list
+from mico.lib.aws.fake.base import param_structs
+from mico.lib.aws.fake.base import paginate
+from mico.lib.aws.fake.base import settled
+from mico.lib.aws.fake.base import timestamp
+from mico.lib.aws.fake.base import transition
+
+
+EC2_STATE_CODES = {
+    "pending": 0,
+    "running": 16,
+    "shutting-down": 32,
+    "terminated": 48,
+    "stopping": 64,
+    "stopped": 80,
+}
+
+EC2_DEAD_STATES = ("shutting-down", "terminated")
+
+
+def _number(resource_id):
+    return int(resource_id.split("-")[-1], 16)
+
+
+def new_security_group(region, name, description=None, vpc_id=None):
+    """Create a new security group record in the region."""
+    record = {
+        "id": fake_backend.new_id("sg"),
+        "name": name,
+        "description": description or name,
+        "vpc_id": vpc_id,
+        "rules": [],
+        "tags": {},
+    }
+    region.security_groups[record["id"]] = record
+    return record
+
+
+def default_security_group(region):
+    """Return the default security group of the region, which is created
+    the first time that it is used.
+    """
+    for record in region.security_groups.values():
+        if record["name"] == "default":
+            return record
+    return new_security_group(region, "default")
+
+
+def new_instance(region, image_id="ami-00000000", instance_type="m1.small",
+                 zone=None, groups=None, key_name=None, tags=None,
+                 reservation=None, state="running", user_data=None,
+                 termination_protection=False):
+    """Create a new instance record in the region. If state is "pending"
+    the instance will be running the next time that it is described.
+    """
+    instance_id = fake_backend.new_id("i")
+    record = {
+        "id": instance_id,
+        "reservation": reservation or fake_backend.new_id("r"),
+        "image_id": image_id,
+        "instance_type": instance_type or "m1.small",
+        "key_name": key_name,
+        "zone": zone or region.zones()[0],
+        "groups": list(groups or []),
+        "tags": dict(tags or {}),
+        "launch_time": time.time(),
+        "private_ip": fake_ip(10, _number(instance_id)),
+        "ip": fake_ip(54, _number(instance_id)),
+        "eip": None,
+        "devices": {},
+        "events": [],
+        "user_data": user_data,
+        "termination_protection": termination_protection,
+        "classic": False,
+        "state": state,
+        "target": None,
+    }
+    if state == "pending":
+        transition(record, "pending", "running")
+    region.instances[instance_id] = record
+    return record
+
+
+def launch_instance(region, root_size=8, **kwargs):
+    """Create a new instance record in the region as RunInstances does,
+    with a root volume attached as /dev/sda1 and deleted on termination.
+    """
+    record = new_instance(region, **kwargs)
+    root = new_volume(region, root_size, record["zone"])
+    attach_volume(region, root, record, "/dev/sda1",
+                  delete_on_termination=True, pending=False)
+    return record
+
+
+def new_volume(region, size, zone, snapshot_id=None, volume_type="standard",
+               iops=None, encrypted=False, state="available", tags=None):
+    """Create a new volume record in the region. If state is "creating" the
+    volume will be available the next time that it is described.
+    """
+    record = {
+        "id": fake_backend.new_id("vol"),
+        "size": size,
+        "zone": zone,
+        "snapshot_id": snapshot_id,
+        "type": volume_type or "standard",
+        "iops": iops,
+        "encrypted": encrypted,
+        "create_time": time.time(),
+        "attachment": None,
+        "tags": dict(tags or {}),
+        "state": state,
+        "target": None,
+    }
+    if state == "creating":
+        transition(record, "creating", "available")
+    region.volumes[record["id"]] = record
+    return record
+
+
+def attach_volume(region, volume, instance, device, delete_on_termination=False,
+                  pending=True):
+    """Attach the volume record to the instance record as device."""
+    volume["attachment"] = {
+        "instance": instance["id"],
+        "device": device,
+        "time": time.time(),
+        "delete_on_termination": delete_on_termination,
+        "state": "attached",
+        "target": None,
+    }
+    if pending:
+        transition(volume["attachment"], "attaching", "attached")
+    volume["state"] = "in-use"
+    volume["target"] = None
+    instance["devices"][device] = volume["id"]
+
+
+def detach_volume(region, volume):
+    """Detach the volume record from its instance."""
+    attachment = volume["attachment"]
+    instance = region.instances.get(attachment["instance"], None)
+    if instance is not None:
+        instance["devices"].pop(attachment["device"], None)
+    volume["attachment"] = None
+    volume["state"] = "available"
+
+
+def _get(records, ids, code, message):
+    """Return the records with the ids passed as arguments, or raise a
+    FakeError if some of them does not exist.
+    """
+    ret = []
+    for record_id in ids:
+        if record_id not in records:
+            raise FakeError(code, message % record_id)
+        ret.append(records[record_id])
+    return ret
+
+
+def _filter(records, params, values):
+    """Filter the records according to the ``Filter.N`` parameters, using
+    the function values, which receive a record and a filter name and
+    returns the list of values of the record for the filter.
+    """
+    filters = [(x["Name"], GlobMatcher(param_list(x, "Value")))
+               for x in param_structs(params, "Filter")]
+    if not filters:
+        return records
+    return [r for r in records
+            if all([any([matcher.match(v) for v in values(r, name)])
+                    for name, matcher in filters])]
+
+
+def _tag_values(tags, name):
+    if name.startswith("tag:"):
+        value = tags.get(name[4:], None)
+        return [value] if value is not None else []
+    elif name == "tag-key":
+        return tags.keys()
+    elif name == "tag-value":
+        return tags.values()
+    return None
+
+
+def _invalid_filter(name):
+    return FakeError("InvalidParameterValue",
+                     "The filter '%s' is invalid" % name)
+
+
+def _tags_xml(tags):
+    return nodes("tagSet", [nodes("item", [node("key", k), node("value", v)])
+                            for k, v in sorted(tags.items())])
+
+
+class FakeEC2Connection(FakeConnection, EC2Connection):
+    """Models a fake connection to EC2."""
+    fake_throttle_code = "RequestLimitExceeded"
+    fake_throttle_status = 503
+    fake_xmlns = "http://ec2.amazonaws.com/doc/2014-10-01/"
+
+    def fake_response(self, operation, result):
+        return '<%sResponse xmlns="%s"><requestId>%s</requestId>%s' \
+               '</%sResponse>' % (operation, self.fake_xmlns, fake_request_id(),
+                                  result, operation,)
+
+    def fake_status(self, operation):
+        return self.fake_response(operation, node("return", True))
+
+    def fake_error(self, error):
+        body = '<Response><Errors><Error>%s%s</Error></Errors>' \
+               '<RequestID>%s</RequestID></Response>' % (
+                   node("Code", error.code), node("Message", error.message),
+                   fake_request_id(),)
+        return FakeResponse(error.status, "Bad Request", body)
+
+    # Instances
+
+    def _instances(self, region, params, code="InvalidInstanceID.NotFound"):
+        ids = param_list(params, "InstanceId")
+        if ids:
+            records = _get(region.instances, ids, code,
+                           "The instance ID '%s' does not exist")
+        else:
+            records = region.instances.values()
+        now = time.time()
+        return [settled(r, now) for r in records]
+
+    def _instance_values(self, region, record, name):
+        values = _tag_values(record["tags"], name)
+        if values is not None:
+            return values
+        elif name == "instance-id":
+            return [record["id"]]
+        elif name == "instance-state-name":
+            return [record["state"]]
+        elif name == "instance-state-code":
+            return [str(EC2_STATE_CODES[record["state"]])]
+        elif name in ("ip-address", "network-interface.addresses.association.public-ip"):
+            return [record["ip"]] if record["ip"] else []
+        elif name in ("private-ip-address", "network-interface.addresses.private-ip-address"):
+            return [record["private_ip"]]
+        elif name == "availability-zone":
+            return [record["zone"]]
+        elif name == "image-id":
+            return [record["image_id"]]
+        elif name == "instance-type":
+            return [record["instance_type"]]
+        elif name == "key-name":
+            return [record["key_name"]] if record["key_name"] else []
+        elif name == "reservation-id":
+            return [record["reservation"]]
+        elif name in ("instance.group-id", "group-id"):
+            return record["groups"]
+        elif name in ("instance.group-name", "group-name"):
+            return [region.security_groups[x]["name"] for x in record["groups"]
+                    if x in region.security_groups]
+        elif name == "block-device-mapping.volume-id":
+            return record["devices"].values()
+        elif name == "block-device-mapping.device-name":
+            return record["devices"].keys()
+        raise _invalid_filter(name)
+
+    def _block_device_mapping_xml(self, region, record, name="blockDeviceMapping"):
+        items = []
+        for device, volume_id in sorted(record["devices"].items()):
+            volume = region.volumes.get(volume_id, None)
+            if volume is None or volume["attachment"] is None:
+                continue
+            attachment = settled(volume["attachment"], time.time())
+            items.append(nodes("item", [
+                node("deviceName", device),
+                nodes("ebs", [
+                    node("volumeId", volume_id),
+                    node("status", attachment["state"]),
+                    node("attachTime", timestamp(attachment["time"])),
+                    node("deleteOnTermination", attachment["delete_on_termination"]),
+                ]),
+            ]))
+        return nodes(name, items)
+
+    def _groups_xml(self, region, group_ids):
+        items = []
+        for group_id in group_ids:
+            group = region.security_groups.get(group_id, None)
+            if group is not None:
+                items.append(nodes("item", [node("groupId", group["id"]),
+                                            node("groupName", group["name"])]))
+        return nodes("groupSet", items)
+
+    def _instance_xml(self, region, record):
+        state = record["state"]
+        return nodes("item", [
+            node("instanceId", record["id"]),
+            node("imageId", record["image_id"]),
+            nodes("instanceState", [node("code", EC2_STATE_CODES[state]),
+                                    node("name", state)]),
+            node("privateDnsName", "ip-%s.ec2.internal" % record["private_ip"].replace(".", "-")),
+            node("dnsName", "ec2-%s.compute-1.amazonaws.com" % record["ip"].replace(".", "-")
+                            if record["ip"] else None),
+            node("keyName", record["key_name"]),
+            node("amiLaunchIndex", 0),
+            node("instanceType", record["instance_type"]),
+            node("launchTime", timestamp(record["launch_time"])),
+            nodes("placement", [node("availabilityZone", record["zone"]),
+                                node("tenancy", "default")]),
+            nodes("monitoring", [node("state", "disabled")]),
+            node("privateIpAddress", record["private_ip"]),
+            node("ipAddress", record["ip"]) if record["ip"] else "",
+            self._groups_xml(region, record["groups"]),
+            node("architecture", "x86_64"),
+            node("rootDeviceType", "ebs"),
+            node("rootDeviceName", "/dev/sda1"),
+            self._block_device_mapping_xml(region, record),
+            node("virtualizationType", "paravirtual"),
+            _tags_xml(record["tags"]),
+            node("hypervisor", "xen"),
+        ])
+
+    def _reservations_xml(self, region, records):
+        reservations = []
+        instances = {}
+        for record in records:
+            if record["reservation"] not in instances:
+                reservations.append(record["reservation"])
+                instances[record["reservation"]] = []
+            instances[record["reservation"]].append(record)
+
+        return nodes("reservationSet", [nodes("item", [
+            node("reservationId", reservation),
+            node("ownerId", FAKE_ACCOUNT_ID),
+            nodes("groupSet", []),
+            nodes("instancesSet", [self._instance_xml(region, x)
+                                   for x in instances[reservation]]),
+        ]) for reservation in reservations])
+
+    def _state_changes_xml(self, changes):
+        return nodes("instancesSet", [nodes("item", [
+            node("instanceId", record["id"]),
+            nodes("currentState", [node("code", EC2_STATE_CODES[record["state"]]),
+                                   node("name", record["state"])]),
+            nodes("previousState", [node("code", EC2_STATE_CODES[previous]),
+                                    node("name", previous)]),
+        ]) for record, previous in changes])
+
+    def fake_DescribeInstances(self, region, params):
+        records = self._instances(region, params)
+        records = _filter(records, params,
+                          lambda r, f: self._instance_values(region, r, f))
+        page, token = paginate(records, params, 1000)
+        return self.fake_response("DescribeInstances",
+                                  self._reservations_xml(region, page) +
+                                  (node("nextToken", token) if token else ""))
+
+    def _group_ids(self, region, params):
+        ids = param_list(params, "SecurityGroupId")
+        for name in param_list(params, "SecurityGroup"):
+            groups = [x for x in region.security_groups.values()
+                      if x["name"] == name]
+            if not groups:
+                raise FakeError("InvalidGroup.NotFound",
+                                "The security group '%s' does not exist" % name)
+            ids.append(groups[0]["id"])
+        for group_id in ids:
+            if group_id not in region.security_groups:
+                raise FakeError("InvalidGroup.NotFound",
+                                "The security group '%s' does not exist" % group_id)
+        if not ids:
+            ids.append(default_security_group(region)["id"])
+        return ids
+
+    def fake_RunInstances(self, region, params):
+        zone = params.get("Placement.AvailabilityZone", None) or region.zones()[0]
+        if zone not in region.zones():
+            raise FakeError("InvalidParameterValue",
+                            "Invalid availability zone: [%s]" % zone)
+        count = param_int(params, "MaxCount", 1)
+        groups = self._group_ids(region, params)
+        reservation = fake_backend.new_id("r")
+
+        records = []
+        for _ in range(count):
+            records.append(launch_instance(
+                region,
+                image_id=params.get("ImageId"),
+                instance_type=params.get("InstanceType", None),
+                zone=zone,
+                groups=groups,
+                key_name=params.get("KeyName", None),
+                reservation=reservation,
+                state="pending",
+                user_data=params.get("UserData", None),
+                termination_protection=param_bool(params, "DisableApiTermination")))
+
+        return self.fake_response("RunInstances", "".join([
+            node("reservationId", reservation),
+            node("ownerId", FAKE_ACCOUNT_ID),
+            self._groups_xml(region, groups),
+            nodes("instancesSet", [self._instance_xml(region, x) for x in records]),
+        ]))
+
+    def _check_state(self, records, states, action):
+        for record in records:
+            if record["state"] in states:
+                raise FakeError("IncorrectInstanceState",
+                                "The instance '%s' is not in a state from which it can be %s." % (
+                                record["id"], action,))
+
+    def fake_StopInstances(self, region, params):
+        records = self._instances(region, params)
+        self._check_state(records, EC2_DEAD_STATES, "stopped")
+        changes = []
+        for record in records:
+            changes.append((record, record["state"]))
+            if record["state"] in ("pending", "running"):
+                transition(record, "stopping", "stopped")
+                record["ip"] = record["eip"]
+        return self.fake_response("StopInstances", self._state_changes_xml(changes))
+
+    def fake_StartInstances(self, region, params):
+        records = self._instances(region, params)
+        self._check_state(records, EC2_DEAD_STATES + ("stopping",), "started")
+        changes = []
+        for record in records:
+            changes.append((record, record["state"]))
+            if record["state"] == "stopped":
+                transition(record, "pending", "running")
+                record["ip"] = record["eip"] or fake_ip(54, _number(fake_backend.new_id("ip")))
+        return self.fake_response("StartInstances", self._state_changes_xml(changes))
+
+    def fake_TerminateInstances(self, region, params):
+        records = self._instances(region, params)
+        for record in records:
+            if record["termination_protection"]:
+                raise FakeError("OperationNotPermitted",
+                                "The instance '%s' may not be terminated. Modify its "
+                                "'disableApiTermination' instance attribute and try "
+                                "again." % record["id"])
+        changes = []
+        for record in records:
+            changes.append((record, record["state"]))
+            if record["state"] != "terminated":
+                terminate_instance(region, record)
+        return self.fake_response("TerminateInstances", self._state_changes_xml(changes))
+
+    def fake_RebootInstances(self, region, params):
+        self._check_state(self._instances(region, params), EC2_DEAD_STATES, "rebooted")
+        return self.fake_status("RebootInstances")
+
+    def fake_ModifyInstanceAttribute(self, region, params):
+        record = self._instances(region, {"InstanceId.1": params.get("InstanceId")})[0]
+        for key, value in params.items():
+            if key in ("DisableApiTermination.Value", "Value") and \
+                    params.get("Attribute", "disableApiTermination") == "disableApiTermination":
+                record["termination_protection"] = unicode(value).lower() == "true"
+            elif key == "InstanceType.Value":
+                record["instance_type"] = value
+            elif key.startswith("GroupId."):
+                record["groups"] = param_list(params, "GroupId")
+        return self.fake_status("ModifyInstanceAttribute")
+
+    def fake_DescribeInstanceAttribute(self, region, params):
+        record = self._instances(region, {"InstanceId.1": params.get("InstanceId")})[0]
+        attribute = params.get("Attribute")
+        if attribute == "blockDeviceMapping":
+            value = self._block_device_mapping_xml(region, record)
+        elif attribute == "groupSet":
+            value = self._groups_xml(region, record["groups"])
+        elif attribute == "disableApiTermination":
+            value = nodes(attribute, [node("value", record["termination_protection"])])
+        elif attribute == "instanceType":
+            value = nodes(attribute, [node("value", record["instance_type"])])
+        elif attribute == "userData":
+            value = nodes(attribute, [node("value", record["user_data"])])
+        else:
+            raise FakeError("InvalidParameterValue",
+                            "Value (%s) for parameter attribute is invalid." % attribute)
+        return self.fake_response("DescribeInstanceAttribute",
+                                  node("instanceId", record["id"]) + value)
+
+    def fake_DescribeInstanceStatus(self, region, params):
+        records = self._instances(region, params)
+        if not param_bool(params, "IncludeAllInstances"):
+            records = [x for x in records if x["state"] == "running"]
+        records = _filter(records, params, lambda r, f: self._status_values(r, f))
+        page, token = paginate(records, params, 1000)
+
+        items = []
+        for record in page:
+            status = "ok" if record["state"] == "running" else "not-applicable"
+            items.append(nodes("item", [
+                node("instanceId", record["id"]),
+                node("availabilityZone", record["zone"]),
+                nodes("eventsSet", [nodes("item", [
+                    node("code", x["code"]),
+                    node("description", x["description"]),
+                    node("notBefore", timestamp(x["not_before"])),
+                    node("notAfter", timestamp(x["not_after"])),
+                ]) for x in record["events"]]) if record["events"] else "",
+                nodes("instanceState", [node("code", EC2_STATE_CODES[record["state"]]),
+                                        node("name", record["state"])]),
+                nodes("systemStatus", [node("status", status)]),
+                nodes("instanceStatus", [node("status", status)]),
+            ]))
+        return self.fake_response("DescribeInstanceStatus",
+                                  nodes("instanceStatusSet", items) +
+                                  (node("nextToken", token) if token else ""))
+
+    def _status_values(self, record, name):
+        if name == "availability-zone":
+            return [record["zone"]]
+        elif name == "instance-state-name":
+            return [record["state"]]
+        elif name == "event.code":
+            return [x["code"] for x in record["events"]]
+        raise _invalid_filter(name)
+
+    # Tags
+
+    def _tagged(self, region, resource_id):
+        for prefix, records, code in (("i-", region.instances, "InvalidInstanceID.NotFound"),
+                                      ("vol-", region.volumes, "InvalidVolume.NotFound"),
+                                      ("sg-", region.security_groups, "InvalidGroup.NotFound")):
+            if resource_id.startswith(prefix):
+                if resource_id not in records:
+                    raise FakeError(code, "The ID '%s' does not exist" % resource_id)
+                return records[resource_id]
+        raise FakeError("InvalidID", "The ID '%s' is not valid" % resource_id)
+
+    def fake_CreateTags(self, region, params):
+        records = [self._tagged(region, x) for x in param_list(params, "ResourceId")]
+        tags = param_structs(params, "Tag")
+        for record in records:
+            for tag in tags:
+                record["tags"][tag["Key"]] = tag.get("Value", "")
+        return self.fake_status("CreateTags")
+
+    def fake_DeleteTags(self, region, params):
+        records = [self._tagged(region, x) for x in param_list(params, "ResourceId")]
+        tags = param_structs(params, "Tag")
+        for record in records:
+            for tag in tags:
+                if "Value" not in tag or record["tags"].get(tag["Key"]) == tag["Value"]:
+                    record["tags"].pop(tag["Key"], None)
+        return self.fake_status("DeleteTags")
+
+    # Volumes
+
+    def _volumes(self, region, params):
+        ids = param_list(params, "VolumeId")
+        if ids:
+            records = _get(region.volumes, ids, "InvalidVolume.NotFound",
+                           "The volume '%s' does not exist.")
+        else:
+            records = region.volumes.values()
+        now = time.time()
+        for record in records:
+            settled(record, now)
+            if record["attachment"] is not None:
+                settled(record["attachment"], now)
+        return records
+
+    def _volume_values(self, record, name):
+        values = _tag_values(record["tags"], name)
+        attachment = record["attachment"] or {}
+        if values is not None:
+            return values
+        elif name == "volume-id":
+            return [record["id"]]
+        elif name == "status":
+            return [record["state"]]
+        elif name == "availability-zone":
+            return [record["zone"]]
+        elif name == "size":
+            return [str(record["size"])]
+        elif name == "volume-type":
+            return [record["type"]]
+        elif name == "snapshot-id":
+            return [record["snapshot_id"]] if record["snapshot_id"] else []
+        elif name == "attachment.instance-id":
+            return [attachment["instance"]] if attachment else []
+        elif name == "attachment.device":
+            return [attachment["device"]] if attachment else []
+        elif name == "attachment.status":
+            return [attachment["state"]] if attachment else []
+        raise _invalid_filter(name)
+
+    def _volume_xml(self, record):
+        attachment = record["attachment"]
+        return nodes("item", [
+            node("volumeId", record["id"]),
+            node("size", record["size"]),
+            node("snapshotId", record["snapshot_id"]),
+            node("availabilityZone", record["zone"]),
+            node("status", record["state"]),
+            node("createTime", timestamp(record["create_time"])),
+            nodes("attachmentSet", [nodes("item", [
+                node("volumeId", record["id"]),
+                node("instanceId", attachment["instance"]),
+                node("device", attachment["device"]),
+                node("status", attachment["state"]),
+                node("attachTime", timestamp(attachment["time"])),
+                node("deleteOnTermination", attachment["delete_on_termination"]),
+            ])] if attachment else []),
+            _tags_xml(record["tags"]),
+            node("volumeType", record["type"]),
+            node("iops", record["iops"]) if record["iops"] else "",
+            node("encrypted", record["encrypted"]),
+        ])
+
+    def fake_DescribeVolumes(self, region, params):
+        records = _filter(self._volumes(region, params), params, self._volume_values)
+        page, token = paginate(records, params, 1000)
+        return self.fake_response("DescribeVolumes",
+                                  nodes("volumeSet", [self._volume_xml(x) for x in page]) +
+                                  (node("nextToken", token) if token else ""))
+
+    def fake_CreateVolume(self, region, params):
+        zone = params.get("AvailabilityZone")
+        if zone not in region.zones():
+            raise FakeError("InvalidParameterValue",
+                            "Invalid availability zone: [%s]" % zone)
+        size = param_int(params, "Size", None)
+        if size is None and not params.get("SnapshotId"):
+            raise FakeError("MissingParameter",
+                            "The request must contain the parameter size or snapshotId")
+        record = new_volume(region, size or 8, zone,
+                            snapshot_id=params.get("SnapshotId", None),
+                            volume_type=params.get("VolumeType", None),
+                            iops=param_int(params, "Iops", None),
+                            encrypted=param_bool(params, "Encrypted"),
+                            state="creating")
+        return self.fake_response("CreateVolume", "".join([
+            node("volumeId", record["id"]),
+            node("size", record["size"]),
+            node("snapshotId", record["snapshot_id"]),
+            node("availabilityZone", record["zone"]),
+            node("status", record["state"]),
+            node("createTime", timestamp(record["create_time"])),
+            node("volumeType", record["type"]),
+            node("encrypted", record["encrypted"]),
+        ]))
+
+    def _attachment_xml(self, operation, record, device, state):
+        return self.fake_response(operation, "".join([
+            node("volumeId", record["id"]),
+            node("instanceId", record["attachment"]["instance"]),
+            node("device", device),
+            node("status", state),
+            node("attachTime", timestamp(record["attachment"]["time"])),
+        ]))
+
+    def fake_AttachVolume(self, region, params):
+        volume = self._volumes(region, {"VolumeId.1": params.get("VolumeId")})[0]
+        instance = self._instances(region, {"InstanceId.1": params.get("InstanceId")})[0]
+        device = params.get("Device")
+
+        if volume["state"] != "available":
+            raise FakeError("IncorrectState", "%s is not 'available'." % volume["id"])
+        if instance["state"] in EC2_DEAD_STATES:
+            raise FakeError("IncorrectInstanceState",
+                            "Instance '%s' is not 'running'." % instance["id"])
+        if volume["zone"] != instance["zone"]:
+            raise FakeError("InvalidVolume.ZoneMismatch",
+                            "The volume '%s' is not in the same availability zone "
+                            "as instance '%s'" % (volume["id"], instance["id"],))
+        if device in instance["devices"]:
+            raise FakeError("InvalidParameterValue",
+                            "Attachment point %s is already in use" % device)
+
+        attach_volume(region, volume, instance, device)
+        return self._attachment_xml("AttachVolume", volume, device, "attaching")
+
+    def fake_DetachVolume(self, region, params):
+        volume = self._volumes(region, {"VolumeId.1": params.get("VolumeId")})[0]
+        if volume["attachment"] is None:
+            raise FakeError("IncorrectState", "Volume '%s' is in the 'available' "
+                            "state." % volume["id"])
+        device = volume["attachment"]["device"]
+        body = self._attachment_xml("DetachVolume", volume, device, "detaching")
+        detach_volume(region, volume)
+        return body
+
+    def fake_DeleteVolume(self, region, params):
+        volume = self._volumes(region, {"VolumeId.1": params.get("VolumeId")})[0]
+        if volume["attachment"] is not None or volume["state"] != "available":
+            raise FakeError("VolumeInUse", "Volume %s is currently attached to %s" % (
+                            volume["id"], (volume["attachment"] or {}).get("instance"),))
+        del region.volumes[volume["id"]]
+        return self.fake_status("DeleteVolume")
+
+    # Security groups
+
+    def _security_groups(self, region, params):
+        records = []
+        ids = param_list(params, "GroupId")
+        names = param_list(params, "GroupName")
+        if ids:
+            records.extend(_get(region.security_groups, ids, "InvalidGroup.NotFound",
+                                "The security group '%s' does not exist"))
+        for name in names:
+            groups = [x for x in region.security_groups.values() if x["name"] == name]
+            if not groups:
+                raise FakeError("InvalidGroup.NotFound",
+                                "The security group '%s' does not exist" % name)
+            records.extend(groups)
+        if not ids and not names:
+            records = region.security_groups.values()
+        return records
+
+    def _security_group(self, region, params):
+        if params.get("GroupId"):
+            return self._security_groups(region, {"GroupId.1": params["GroupId"]})[0]
+        return self._security_groups(region, {"GroupName.1": params.get("GroupName")})[0]
+
+    def _security_group_values(self, region, record, name):
+        values = _tag_values(record["tags"], name)
+        if values is not None:
+            return values
+        elif name == "group-id":
+            return [record["id"]]
+        elif name == "group-name":
+            return [record["name"]]
+        elif name == "description":
+            return [record["description"]]
+        elif name == "vpc-id":
+            return [record["vpc_id"]] if record["vpc_id"] else []
+        elif name == "owner-id":
+            return [FAKE_ACCOUNT_ID]
+        elif name == "ip-permission.protocol":
+            return [x[0] for x in record["rules"]]
+        elif name == "ip-permission.from-port":
+            return [x[1] for x in record["rules"] if x[1] is not None]
+        elif name == "ip-permission.to-port":
+            return [x[2] for x in record["rules"] if x[2] is not None]
+        elif name == "ip-permission.cidr":
+            return [x[4] for x in record["rules"] if x[3] == "cidr"]
+        elif name == "ip-permission.group-id":
+            return [x[4] for x in record["rules"] if x[3] == "group"]
+        elif name == "ip-permission.group-name":
+            return [region.security_groups[x[4]]["name"] for x in record["rules"]
+                    if x[3] == "group" and x[4] in region.security_groups]
+        raise _invalid_filter(name)
+
+    def _security_group_xml(self, region, record):
+        permissions = []
+        grants = {}
+        for protocol, from_port, to_port, kind, value in record["rules"]:
+            key = (protocol, from_port, to_port,)
+            if key not in grants:
+                permissions.append(key)
+                grants[key] = ([], [])
+            if kind == "group":
+                source = region.security_groups.get(value, {"name": None})
+                grants[key][0].append(nodes("item", [
+                    node("userId", FAKE_ACCOUNT_ID),
+                    node("groupId", value),
+                    node("groupName", source["name"]),
+                ]))
+            else:
+                grants[key][1].append(nodes("item", [node("cidrIp", value)]))
+
+        return nodes("item", [
+            node("ownerId", FAKE_ACCOUNT_ID),
+            node("groupId", record["id"]),
+            node("groupName", record["name"]),
+            node("groupDescription", record["description"]),
+            node("vpcId", record["vpc_id"]) if record["vpc_id"] else "",
+            nodes("ipPermissions", [nodes("item", [
+                node("ipProtocol", protocol),
+                node("fromPort", from_port) if from_port is not None else "",
+                node("toPort", to_port) if to_port is not None else "",
+                nodes("groups", grants[(protocol, from_port, to_port)][0]),
+                nodes("ipRanges", grants[(protocol, from_port, to_port)][1]),
+            ]) for protocol, from_port, to_port in permissions]),
+            nodes("ipPermissionsEgress", []),
+            _tags_xml(record["tags"]),
+        ])
+
+    def fake_DescribeSecurityGroups(self, region, params):
+        records = _filter(self._security_groups(region, params), params,
+                          lambda r, f: self._security_group_values(region, r, f))
+        return self.fake_response("DescribeSecurityGroups", nodes("securityGroupInfo", [
+            self._security_group_xml(region, x) for x in records]))
+
+    def fake_CreateSecurityGroup(self, region, params):
+        name = params.get("GroupName")
+        vpc_id = params.get("VpcId", None)
+        if not name:
+            raise FakeError("MissingParameter",
+                            "The request must contain the parameter GroupName")
+        for record in region.security_groups.values():
+            if record["name"] == name and record["vpc_id"] == vpc_id:
+                raise FakeError("InvalidGroup.Duplicate",
+                                "The security group '%s' already exists" % name)
+        record = new_security_group(region, name, params.get("GroupDescription"), vpc_id)
+        return self.fake_response("CreateSecurityGroup", node("return", True) +
+                                  node("groupId", record["id"]))
+
+    def fake_DeleteSecurityGroup(self, region, params):
+        record = self._security_group(region, params)
+        if record["name"] == "default":
+            raise FakeError("CannotDelete", "the specified group: \"%s\" name: "
+                            "\"default\" cannot be deleted by a user" % record["id"])
+        for instance in region.instances.values():
+            if record["id"] in instance["groups"] and \
+                    instance["state"] != "terminated":
+                raise FakeError("InvalidGroup.InUse", "There are active instances "
+                                "using security group '%s'" % record["name"])
+        for group in region.security_groups.values():
+            if group["id"] != record["id"] and \
+                    any([x[3] == "group" and x[4] == record["id"] for x in group["rules"]]):
+                raise FakeError("DependencyViolation", "resource %s has a dependent "
+                                "object" % record["id"])
+        del region.security_groups[record["id"]]
+        return self.fake_status("DeleteSecurityGroup")
+
+    def _rules(self, region, params):
+        """Return the list of rules as tuples (protocol, from_port, to_port,
+        kind, value), where kind is "cidr" or "group".
+        """
+        rules = []
+        permissions = param_structs(params, "IpPermissions")
+
+        if not permissions and params.get("SourceSecurityGroupName"):
+            # EC2-Classic way to grant everything to a group.
+            permissions = [{"IpProtocol": x, "FromPort": f, "ToPort": t,
+                            "Groups.1.GroupName": params["SourceSecurityGroupName"]}
+                           for x, f, t in (("tcp", 0, 65535), ("udp", 0, 65535),
+                                           ("icmp", -1, -1))]
+
+        for permission in permissions:
+            protocol = unicode(permission.get("IpProtocol", "-1")).lower()
+            from_port = permission.get("FromPort", None)
+            to_port = permission.get("ToPort", None)
+            if protocol != "-1":
+                if from_port is None or to_port is None:
+                    raise FakeError("InvalidParameterValue",
+                                    "Invalid value for portRange. Must specify both "
+                                    "from and to ports with TCP/UDP.")
+                from_port, to_port = unicode(int(from_port)), unicode(int(to_port))
+            else:
+                from_port = to_port = None
+            for group in param_structs(permission, "Groups"):
+                if group.get("GroupId"):
+                    group_id = group["GroupId"]
+                    if group_id not in region.security_groups:
+                        raise FakeError("InvalidGroup.NotFound",
+                                        "The security group '%s' does not exist" % group_id)
+                else:
+                    group_id = self._security_group(region, {
+                        "GroupName": group.get("GroupName")})["id"]
+                rules.append((protocol, from_port, to_port, "group", group_id))
+            for cidr in param_structs(permission, "IpRanges"):
+                rules.append((protocol, from_port, to_port, "cidr", cidr["CidrIp"]))
+        return rules
+
+    def fake_AuthorizeSecurityGroupIngress(self, region, params):
+        record = self._security_group(region, params)
+        rules = self._rules(region, params)
+        for rule in rules:
+            if rule in record["rules"]:
+                raise FakeError("InvalidPermission.Duplicate",
+                                "the specified rule \"peer: %s, %s, from port: %s, "
+                                "to port: %s, ALLOW\" already exists" % (
+                                rule[4], rule[0].upper(), rule[1], rule[2],))
+        for rule in rules:
+            if rule not in record["rules"]:
+                record["rules"].append(rule)
+        return self.fake_status("AuthorizeSecurityGroupIngress")
+
+    def fake_RevokeSecurityGroupIngress(self, region, params):
+        record = self._security_group(region, params)
+        rules = self._rules(region, params)
+        for rule in rules:
+            if rule not in record["rules"]:
+                raise FakeError("InvalidPermission.NotFound",
+                                "The specified rule does not exist in this "
+                                "security group.")
+        record["rules"] = [x for x in record["rules"] if x not in rules]
+        return self.fake_status("RevokeSecurityGroupIngress")
+
+    # Addresses
+
+    def _addresses(self, region, params):
+        ips = param_list(params, "PublicIp")
+        if ips:
+            return _get(region.addresses, ips, "InvalidAddress.NotFound",
+                        "Address '%s' not found.")
+        return region.addresses.values()
+
+    def _address_values(self, record, name):
+        if name == "public-ip":
+            return [record["ip"]]
+        elif name == "instance-id":
+            return [record["instance"]] if record["instance"] else []
+        elif name == "domain":
+            return ["standard"]
+        raise _invalid_filter(name)
+
+    def fake_DescribeAddresses(self, region, params):
+        records = _filter(self._addresses(region, params), params, self._address_values)
+        return self.fake_response("DescribeAddresses", nodes("addressesSet", [
+            nodes("item", [
+                node("publicIp", x["ip"]),
+                node("domain", "standard"),
+                node("instanceId", x["instance"]),
+            ]) for x in records]))
+
+    def fake_AllocateAddress(self, region, params):
+        record = {
+            "ip": fake_ip(54, _number(fake_backend.new_id("eip"))),
+            "instance": None,
+        }
+        region.addresses[record["ip"]] = record
+        return self.fake_response("AllocateAddress", node("publicIp", record["ip"]) +
+                                  node("domain", "standard"))
+
+    def _disassociate(self, region, address):
+        instance = region.instances.get(address["instance"], None)
+        if instance is not None and instance["eip"] == address["ip"]:
+            instance["eip"] = None
+            if instance["state"] in ("pending", "running"):
+                instance["ip"] = fake_ip(54, _number(fake_backend.new_id("ip")))
+            else:
+                instance["ip"] = None
+        address["instance"] = None
+
+    def fake_AssociateAddress(self, region, params):
+        address = self._addresses(region, {"PublicIp.1": params.get("PublicIp")})[0]
+        instance = self._instances(region, {"InstanceId.1": params.get("InstanceId")})[0]
+        if instance["state"] in EC2_DEAD_STATES:
+            raise FakeError("InvalidInstanceID", "The instance '%s' is not in a valid "
+                            "state for this operation." % instance["id"])
+        if address["instance"]:
+            self._disassociate(region, address)
+        if instance["eip"] and instance["eip"] in region.addresses:
+            region.addresses[instance["eip"]]["instance"] = None
+        address["instance"] = instance["id"]
+        instance["eip"] = instance["ip"] = address["ip"]
+        return self.fake_status("AssociateAddress")
+
+    def fake_DisassociateAddress(self, region, params):
+        address = self._addresses(region, {"PublicIp.1": params.get("PublicIp")})[0]
+        self._disassociate(region, address)
+        return self.fake_status("DisassociateAddress")
+
+    def fake_ReleaseAddress(self, region, params):
+        address = self._addresses(region, {"PublicIp.1": params.get("PublicIp")})[0]
+        self._disassociate(region, address)
+        del region.addresses[address["ip"]]
+        return self.fake_status("ReleaseAddress")
+
+    # Network interfaces
+
+    def _network_interfaces(self, region, params):
+        ids = param_list(params, "NetworkInterfaceId")
+        records = [x for x in region.instances.values()
+                   if settled(x, time.time())["state"] != "terminated" and
+                   not x["classic"]]
+        if ids:
+            records = [x for x in records if "eni-%s" % x["id"][2:] in ids]
+            if len(records) != len(ids):
+                raise FakeError("InvalidNetworkInterfaceID.NotFound",
+                                "The networkInterface ID '%s' does not exist" % ",".join(ids))
+        return records
+
+    def _network_interface_values(self, region, record, name):
+        if name == "network-interface-id":
+            return ["eni-%s" % record["id"][2:]]
+        elif name == "attachment.instance-id":
+            return [record["id"]]
+        elif name in ("group-id", "group.group-id"):
+            return record["groups"]
+        elif name in ("group-name", "group.group-name"):
+            return [region.security_groups[x]["name"] for x in record["groups"]
+                    if x in region.security_groups]
+        elif name == "availability-zone":
+            return [record["zone"]]
+        elif name == "status":
+            return ["in-use"]
+        raise _invalid_filter(name)
+
+    def fake_DescribeNetworkInterfaces(self, region, params):
+        records = _filter(self._network_interfaces(region, params), params,
+                          lambda r, f: self._network_interface_values(region, r, f))
+        return self.fake_response("DescribeNetworkInterfaces", nodes(
+            "networkInterfaceSet", [nodes("item", [
+                node("networkInterfaceId", "eni-%s" % x["id"][2:]),
+                node("availabilityZone", x["zone"]),
+                node("description", ""),
+                node("ownerId", FAKE_ACCOUNT_ID),
+                node("requesterManaged", False),
+                node("status", "in-use"),
+                node("privateIpAddress", x["private_ip"]),
+                node("sourceDestCheck", True),
+                self._groups_xml(region, x["groups"]),
+                nodes("attachment", [
+                    node("attachmentId", "eni-attach-%s" % x["id"][2:]),
+                    node("instanceId", x["id"]),
+                    node("instanceOwnerId", FAKE_ACCOUNT_ID),
+                    node("deviceIndex", 0),
+                    node("status", "attached"),
+                    node("attachTime", timestamp(x["launch_time"])),
+                    node("deleteOnTermination", True),
+                ]),
+                nodes("privateIpAddressesSet", []),
+            ]) for x in records]))
+
+    # Zones
+
+    def fake_DescribeAvailabilityZones(self, region, params):
+        names = param_list(params, "ZoneName") or region.zones()
+        return self.fake_response("DescribeAvailabilityZones", nodes(
+            "availabilityZoneInfo", [nodes("item", [
+                node("zoneName", x),
+                node("zoneState", "available"),
+                node("regionName", region.name),
+                nodes("messageSet", []),
+            ]) for x in names if x in region.zones()]))
+
+
+def terminate_instance(region, record):
+    """Terminate the instance record, deleting the volumes which are
+    deleted on termination and detaching the rest of them.
+    """
+    transition(record, "shutting-down", "terminated")
+    record["ip"] = None
+    group = record["tags"].get("aws:autoscaling:groupName", None)
+    if group is not None:
+        # The autoscaling group replaces the instance, see autoscale.py
+        region.dirty.add(group)
+    for device, volume_id in record["devices"].items():
+        volume = region.volumes.get(volume_id, None)
+        if volume is None:
+            continue
+        delete = volume["attachment"]["delete_on_termination"]
+        detach_volume(region, volume)
+        if delete:
+            del region.volumes[volume_id]
+    if record["eip"] and record["eip"] in region.addresses:
+        region.addresses[record["eip"]]["instance"] = None
+        record["eip"] = None
+
+
+def ec2_fake_connection(region):
+    return FakeEC2Connection(
+        "fake", "fake",
+        region=RegionInfo(name=region, endpoint="ec2.%s.amazonaws.com" % region)
+    )
@@ -0,0 +1,170 @@
+#! /usr/bin/env python
+# -*- encoding: utf-8 -*-
+# vim:fenc=utf-8:
+
+"""The fake ELB service implements the operations on load balancers used
+by mico. The instances of a load balancer are the registered ones plus the
+instances of the autoscaling groups attached to it.
+"""
+
+import time
+
+from boto.regioninfo import RegionInfo
+from boto.ec2.elb import ELBConnection
+
+from mico.lib.aws.fake.base import FakeConnection
+from mico.lib.aws.fake.base import FakeError
+from mico.lib.aws.fake.base import node
+from mico.lib.aws.fake.base import nodes
+from mico.lib.aws.fake.base import param_list
+from mico.lib.aws.fake.base import param_structs
+from mico.lib.aws.fake.base import paginate
+from mico.lib.aws.fake.base import timestamp
+from mico.lib.aws.fake.ec2 import EC2_DEAD_STATES
+
+
+class FakeELBConnection(FakeConnection, ELBConnection):
+    """Models a fake connection to ELB."""
+    fake_xmlns = "http://elasticloadbalancing.amazonaws.com/doc/2012-06-01/"
+
+    def _load_balancer(self, region, params):
+        name = params.get("LoadBalancerName")
+        if name not in region.load_balancers:
+            raise FakeError("LoadBalancerNotFound", "There is no ACTIVE Load "
+                            "Balancer named '%s'" % name)
+        return region.load_balancers[name]
+
+    def _instances(self, region, record):
+        ret = list(record["instances"])
+        for group in region.autoscaling_groups.values():
+            if record["name"] in group["load_balancers"]:
+                ret.extend([x for x in group["instances"] if x not in ret])
+        return [x for x in ret if x in region.instances and
+                region.instances[x]["state"] not in EC2_DEAD_STATES]
+
+    def _instances_xml(self, region, record):
+        return nodes("Instances", [nodes("member", [node("InstanceId", x)])
+                                   for x in self._instances(region, record)])
+
+    def _health_check_xml(self, check):
+        return "".join([
+            node("Target", check["target"]),
+            node("Interval", check["interval"]),
+            node("Timeout", check["timeout"]),
+            node("UnhealthyThreshold", check["unhealthy_threshold"]),
+            node("HealthyThreshold", check["healthy_threshold"]),
+        ])
+
+    def fake_DescribeLoadBalancers(self, region, params):
+        names = param_list(params, "LoadBalancerNames.member")
+        for name in names:
+            if name not in region.load_balancers:
+                raise FakeError("LoadBalancerNotFound", "Cannot find Load "
+                                "Balancer %s" % name)
+        records = [region.load_balancers[x] for x in names] or \
+            region.load_balancers.values()
+        page, token = paginate(records, params, 400, "PageSize", "Marker")
+
+        return self.fake_response("DescribeLoadBalancers", nodes(
+            "LoadBalancerDescriptions", [nodes("member", [
+                node("LoadBalancerName", x["name"]),
+                node("DNSName", x["dns_name"]),
+                node("CreatedTime", timestamp(x["created"])),
+                node("Scheme", x["scheme"]),
+                nodes("HealthCheck", [self._health_check_xml(x["health_check"])]),
+                nodes("ListenerDescriptions", [nodes("member", [
+                    nodes("Listener", [
+                        node("LoadBalancerPort", y["port"]),
+                        node("InstancePort", y["instance_port"]),
+                        node("Protocol", y["protocol"]),
+                        node("InstanceProtocol", y["instance_protocol"]),
+                        node("SSLCertificateId", y["certificate"])
+                        if y["certificate"] else "",
+                    ]),
+                    nodes("PolicyNames", []),
+                ]) for y in x["listeners"]]),
+                self._instances_xml(region, x),
+                nodes("AvailabilityZones", [node("member", y) for y in x["zones"]]),
+                nodes("Subnets", []),
+                nodes("SecurityGroups", []),
+            ]) for x in page]) + (node("NextMarker", token) if token else ""))
+
+    def fake_CreateLoadBalancer(self, region, params):
+        name = params.get("LoadBalancerName")
+        zones = param_list(params, "AvailabilityZones.member")
+        listeners = param_structs(params, "Listeners.member")
+
+        for zone in zones:
+            if zone not in region.zones():
+                raise FakeError("ValidationError", "Invalid Availability Zone "
+                                "[%s]" % zone)
+        if not listeners:
+            raise FakeError("ValidationError", "At least one listener is required.")
+
+        record = region.load_balancers.get(name, None)
+        if record is None:
+            record = region.load_balancers[name] = {
+                "name": name,
+                "dns_name": "%s-%d.%s.elb.amazonaws.com" % (
+                    name, len(region.load_balancers), region.name,),
+                "created": time.time(),
+                "scheme": params.get("Scheme", "internet-facing"),
+                "zones": zones,
+                "instances": [],
+                "listeners": [{
+                    "port": x["LoadBalancerPort"],
+                    "instance_port": x["InstancePort"],
+                    "protocol": x["Protocol"],
+                    "instance_protocol": x.get("InstanceProtocol", x["Protocol"]),
+                    "certificate": x.get("SSLCertificateId", None),
+                } for x in listeners],
+                "health_check": {
+                    "target": "TCP:%s" % listeners[0]["InstancePort"],
+                    "interval": 30,
+                    "timeout": 5,
+                    "unhealthy_threshold": 2,
+                    "healthy_threshold": 10,
+                },
+            }
+        return self.fake_response("CreateLoadBalancer", node("DNSName", record["dns_name"]))
+
+    def fake_DeleteLoadBalancer(self, region, params):
+        region.load_balancers.pop(params.get("LoadBalancerName"), None)
+        return self.fake_response("DeleteLoadBalancer", "")
+
+    def fake_ConfigureHealthCheck(self, region, params):
+        record = self._load_balancer(region, params)
+        for key, param in (("target", "Target"), ("interval", "Interval"),
+                           ("timeout", "Timeout"),
+                           ("unhealthy_threshold", "UnhealthyThreshold"),
+                           ("healthy_threshold", "HealthyThreshold")):
+            record["health_check"][key] = params.get("HealthCheck.%s" % param,
+                                                     record["health_check"][key])
+        return self.fake_response("ConfigureHealthCheck", nodes(
+            "HealthCheck", [self._health_check_xml(record["health_check"])]))
+
+    def fake_RegisterInstancesWithLoadBalancer(self, region, params):
+        record = self._load_balancer(region, params)
+        for instance in param_structs(params, "Instances.member"):
+            if instance["InstanceId"] not in region.instances:
+                raise FakeError("InvalidInstance", "The requested instance is "
+                                "not valid: %s" % instance["InstanceId"])
+            if instance["InstanceId"] not in record["instances"]:
+                record["instances"].append(instance["InstanceId"])
+        return self.fake_response("RegisterInstancesWithLoadBalancer",
+                                  self._instances_xml(region, record))
+
+    def fake_DeregisterInstancesFromLoadBalancer(self, region, params):
+        record = self._load_balancer(region, params)
+        ids = [x["InstanceId"] for x in param_structs(params, "Instances.member")]
+        record["instances"] = [x for x in record["instances"] if x not in ids]
+        return self.fake_response("DeregisterInstancesFromLoadBalancer",
+                                  self._instances_xml(region, record))
+
+
+def elb_fake_connection(region):
+    return FakeELBConnection(
+        "fake", "fake",
+        region=RegionInfo(name=region,
+                          endpoint="elasticloadbalancing.%s.amazonaws.com" % region)
+    )
@@ -0,0 +1,69 @@
+#! /usr/bin/env python
+# -*- encoding: utf-8 -*-
+# vim:fenc=utf-8:
+
+"""The fake IAM service implements the operations on server certificates
+used by mico.
+"""
+
+import time
+
+from boto.iam.connection import IAMConnection
+
+from mico.lib.aws.fake.base import FAKE_ACCOUNT_ID
+from mico.lib.aws.fake.base import FakeConnection
+from mico.lib.aws.fake.base import FakeError
+from mico.lib.aws.fake.base import fake_backend
+from mico.lib.aws.fake.base import node
+from mico.lib.aws.fake.base import nodes
+from mico.lib.aws.fake.base import paginate
+from mico.lib.aws.fake.base import timestamp
+
+
+class FakeIAMConnection(FakeConnection, IAMConnection):
+    """Models a fake connection to IAM."""
+    fake_xmlns = "https://iam.amazonaws.com/doc/2010-05-08/"
+
+    def _metadata_xml(self, record):
+        return "".join([
+            node("ServerCertificateName", record["name"]),
+            node("Path", record["path"]),
+            node("Arn", record["arn"]),
+            node("UploadDate", timestamp(record["uploaded"])),
+            node("ServerCertificateId", record["id"]),
+        ])
+
+    def fake_ListServerCertificates(self, region, params):
+        prefix = params.get("PathPrefix", "/")
+        records = [x for x in region.server_certificates.values()
+                   if x["path"].startswith(prefix)]
+        page, token = paginate(records, params, 1000, "MaxItems", "Marker")
+        return self.fake_response("ListServerCertificates", "".join([
+            nodes("ServerCertificateMetadataList", [
+                nodes("member", [self._metadata_xml(x)]) for x in page]),
+            node("IsTruncated", token is not None),
+            node("Marker", token) if token else "",
+        ]))
+
+    def fake_UploadServerCertificate(self, region, params):
+        name = params.get("ServerCertificateName")
+        if name in region.server_certificates:
+            raise FakeError("EntityAlreadyExists", "The Server Certificate with "
+                            "name %s already exists." % name, status=409)
+        path = params.get("Path", None) or "/"
+        record = region.server_certificates[name] = {
+            "name": name,
+            "id": fake_backend.new_id("ASCA", 16).replace("-", "").upper(),
+            "path": path,
+            "arn": "arn:aws:iam::%s:server-certificate%s%s" % (
+                FAKE_ACCOUNT_ID, path, name,),
+            "body": params.get("CertificateBody"),
+            "chain": params.get("CertificateChain", None),
+            "uploaded": time.time(),
+        }
+        return self.fake_response("UploadServerCertificate", nodes(
+            "ServerCertificateMetadata", [self._metadata_xml(record)]))
+
+
+def iam_fake_connection(region=None):
+    return FakeIAMConnection("fake", "fake")
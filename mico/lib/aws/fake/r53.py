@@ -0,0 +1,146 @@
+#! /usr/bin/env python
+# -*- encoding: utf-8 -*-
+# vim:fenc=utf-8:
+
+"""The fake Route53 service implements the read operations on hosted
+zones and resource record sets used by mico. Route53 is a REST API, so the
+operations are resolved from the method and the path of the request.
+"""
+
+from boto.route53.connection import Route53Connection
+
+from mico.lib.aws.fake.base import FakeConnection
+from mico.lib.aws.fake.base import FakeError
+from mico.lib.aws.fake.base import fake_backend
+from mico.lib.aws.fake.base import node
+from mico.lib.aws.fake.base import nodes
+from mico.lib.aws.fake.base import param_int
+
+
+def new_hosted_zone(region, name):
+    """Create a new hosted zone record with the fully qualified name passed
+    as argument in the region.
+    """
+    if not name.endswith("."):
+        name = "%s." % name
+    record = {
+        "id": fake_backend.new_id("Z", 12).replace("-", "").upper(),
+        "name": name,
+        "records": [],
+    }
+    record["records"].append({"name": name, "type": "NS", "ttl": 172800,
+                              "values": ["ns-%d.awsdns-fake.com." % x
+                                         for x in range(4)]})
+    region.hosted_zones[record["id"]] = record
+    return record
+
+
+def new_record(zone, name, type, values, ttl=300):
+    """Add a new resource record set to the hosted zone record."""
+    record = {"name": name, "type": type, "ttl": ttl, "values": list(values)}
+    zone["records"].append(record)
+    zone.pop("sorted", None)
+    return record
+
+
+class FakeRoute53Connection(FakeConnection, Route53Connection):
+    """Models a fake connection to Route53."""
+    fake_xmlns = "https://route53.amazonaws.com/doc/2013-04-01/"
+
+    def fake_operation(self, method, path, headers=None, data="", params=None,
+                       *args, **kwargs):
+        parts = path.strip("/").split("/")[1:]
+        params = dict([(k, v) for k, v in (params or {}).items() if v is not None])
+        if method == "GET" and parts == ["hostedzone"]:
+            return "ListHostedZones", params
+        elif method == "GET" and len(parts) == 2 and parts[0] == "hostedzone":
+            params["Id"] = parts[1]
+            return "GetHostedZone", params
+        elif method == "GET" and len(parts) == 3 and parts[2] == "rrset":
+            params["Id"] = parts[1]
+            return "ListResourceRecordSets", params
+        return "%s:%s" % (method, "/".join(parts)), params
+
+    def fake_error(self, error):
+        if error.code == "InvalidAction":
+            error.status = 404
+        return super(FakeRoute53Connection, self).fake_error(error)
+
+    def _zone(self, region, params):
+        zone_id = params.get("Id")
+        if zone_id not in region.hosted_zones:
+            raise FakeError("NoSuchHostedZone", "No hosted zone found with ID: "
+                            "%s" % zone_id, status=404)
+        return region.hosted_zones[zone_id]
+
+    def _zone_xml(self, zone):
+        return nodes("HostedZone", [
+            node("Id", "/hostedzone/%s" % zone["id"]),
+            node("Name", zone["name"]),
+            node("CallerReference", zone["id"]),
+            nodes("Config", [node("PrivateZone", False)]),
+            node("ResourceRecordSetCount", len(zone["records"])),
+        ])
+
+    def _response(self, operation, body):
+        return '<%sResponse xmlns="%s">%s</%sResponse>' % (
+            operation, self.fake_xmlns, body, operation,)
+
+    def fake_ListHostedZones(self, region, params):
+        zones = region.hosted_zones.values()
+        size = min(param_int(params, "maxitems", 100) or 100, 100)
+        start = 0
+        if params.get("marker"):
+            start = [x["id"] for x in zones].index(params["marker"]) \
+                if params["marker"] in region.hosted_zones else len(zones)
+        page = zones[start:start + size]
+        following = zones[start + size:start + size + 1]
+        return self._response("ListHostedZones", "".join([
+            nodes("HostedZones", [self._zone_xml(x) for x in page]),
+            node("IsTruncated", bool(following)),
+            node("NextMarker", following[0]["id"]) if following else "",
+            node("MaxItems", size),
+        ]))
+
+    def fake_GetHostedZone(self, region, params):
+        zone = self._zone(region, params)
+        return self._response("GetHostedZone", "".join([
+            self._zone_xml(zone),
+            nodes("DelegationSet", [nodes("NameServers", [
+                node("NameServer", x) for x in zone["records"][0]["values"]])]),
+        ]))
+
+    def fake_ListResourceRecordSets(self, region, params):
+        zone = self._zone(region, params)
+        if not zone.get("sorted"):
+            zone["records"].sort(key=lambda x: (x["name"], x["type"]))
+            zone["sorted"] = True
+
+        records = zone["records"]
+        size = min(param_int(params, "maxitems", 100) or 100, 100)
+        start = 0
+        if params.get("name"):
+            key = (params["name"], params.get("type", ""))
+            while start < len(records) and \
+                    (records[start]["name"], records[start]["type"]) < key:
+                start += 1
+        page = records[start:start + size]
+        following = records[start + size:start + size + 1]
+
+        return self._response("ListResourceRecordSets", "".join([
+            nodes("ResourceRecordSets", [nodes("ResourceRecordSet", [
+                node("Name", x["name"]),
+                node("Type", x["type"]),
+                node("TTL", x["ttl"]),
+                nodes("ResourceRecords", [nodes("ResourceRecord", [node("Value", y)])
+                                          for y in x["values"]]),
+            ]) for x in page]),
+            node("IsTruncated", bool(following)),
+            node("NextRecordName", following[0]["name"]) if following else "",
+            node("NextRecordType", following[0]["type"]) if following else "",
+            node("MaxItems", size),
+        ]))
+
+
+def r53_fake_connection(region=None):
+    return FakeRoute53Connection("fake", "fake")
@@ -11,12 +11,21 @@ from fnmatch import fnmatch
 from boto.iam.connection import IAMConnection
 
 import mico.output
+from mico.lib.aws.connection import aws_connection
 
 
 class IAMLibraryError(Exception):
     """Models an IAM library error."""
 
 
+def _iam_new_connection(region, *args, **kwargs):
+    return IAMConnection(
+            os_environ.get("AWS_ACCESS_KEY_ID"),
+            os_environ.get("AWS_SECRET_ACCESS_KEY"),
+            *args, **kwargs
+    )
+
+
 def iam_connect(region=None, *args, **kwargs):
     """Helper to connect to Amazon Web Services IAM, using identify provided
     by environment, as also optional region in arguments.
@@ -30,13 +39,7 @@ def iam_connect(region=None, *args, **kwargs):
     if not os_environ.get("AWS_SECRET_ACCESS_KEY", None):
         raise IAMLibraryError("Environment variable AWS_SECRET_ACCESS_KEY is not set.")
 
-    connection = IAMConnection(
-            os_environ.get("AWS_ACCESS_KEY_ID"),
-            os_environ.get("AWS_SECRET_ACCESS_KEY"),
-            *args, **kwargs
-    )
-
-    return connection
+    return aws_connection("iam", None, _iam_new_connection, *args, **kwargs)
 
 
 def iam_cert_exists(filter_expr='*'):
@@ -0,0 +1,272 @@
+#! /usr/bin/env python
+# -*- encoding: utf-8 -*-
+# vim:fenc=utf-8:
+
+"""The inventory module keeps an in-memory inventory of the AWS resources
+of each region, shared by all library calls in the same run (or in the
+same command, when using the mico command line). Resources are downloaded
+lazily, the first time that all of them are required, and indexed by the
+most common lookup keys, so functions which need to join resources (i.e.
+volumes with the instances which they are attached to) do not need to
+describe the resources again and again. Lookups of single resources can be
+remembered in the inventory too, see :meth:`Inventory.remember`.
+
+Functions which only need a few resources should check if their kind is
+:meth:`Inventory.loaded` before, and send a filtered request otherwise.
+
+Functions which modify resources must invalidate the affected kinds of
+resources using :func:`aws_inventory_invalidate`, for example::
+
+    aws_inventory_invalidate("instances", "volumes")
+
+Setting ``cache_refresh`` to True in the environment (or using the
+``--refresh`` option of mico) makes :meth:`Inventory.loaded` always false
+and disables the remembered lookups, so lookups are sent to AWS instead of
+served from resources loaded before.
+"""
+
+import threading
+from functools import partial
+
+from mico import env
+from mico.lib.aws.region import aws_region
+from mico.lib.aws.region import aws_regions
+from mico.lib.aws.connection import aws_paginate
+
+
+def _index(d, key, value):
+    if key is not None:
+        d.setdefault(key, []).append(value)
+
+
+class Inventory(object):
+    """Models the inventory of the resources in one region.
+
+    :type region: str
+    :param region: the name of the region of the inventory.
+    """
+    def __init__(self, region):
+        self.region = region
+        self._lock = threading.RLock()
+        self._data = {}
+        self._memo = {}
+
+    def loaded(self, kind):
+        """Return True if the kind of resources passed as argument is
+        already loaded in the inventory, and the inventory can be used.
+        """
+        return kind in self._data and not env.get("cache_refresh", False)
+
+    def invalidate(self, *kinds):
+        """Drop the resources of the kinds passed as arguments, or all the
+        inventory if no kinds are passed.
+        """
+        with self._lock:
+            if not kinds:
+                self._data.clear()
+                self._memo.clear()
+            for kind in kinds:
+                self._data.pop(kind, None)
+                self._memo.pop(kind, None)
+
+    def remember(self, kind, key, value):
+        """Remember a resource of the kind passed as argument, found by a
+        lookup with the key passed as argument (i.e. a filtered describe),
+        until the kind of resources is invalidated. This way lookups do
+        not need to load all the resources of the kind.
+        """
+        with self._lock:
+            self._memo.setdefault(kind, {})[key] = value
+
+    def remembered(self, kind, key):
+        """Return the resource remembered for the kind and the key passed
+        as arguments, or None.
+        """
+        if env.get("cache_refresh", False):
+            return None
+        with self._lock:
+            return self._memo.get(kind, {}).get(key, None)
+
+    def _get(self, kind):
+        with self._lock:
+            if kind not in self._data:
+                self._data[kind] = getattr(self, "_load_%s" % kind)()
+            return self._data[kind]
+
+    def _load_instances(self):
+        from mico.lib.aws.ec2 import ec2_connect
+        from mico.lib.aws.ec2 import ec2_tag_barrier
+        from mico.lib.aws.ec2 import EC2_ALIVE_STATES
+
+        ec2_tag_barrier(self.region)
+        conn = ec2_connect(self.region)
+        data = {"all": [], "id": {}, "name": {}, "ip": {}, "group": {},
+                "zone": {}, "asg": {}, "volume": {}}
+
+        for reservation in aws_paginate(conn.get_all_reservations,
+                "max_results", 1000,
+                filters={"instance-state-name": EC2_ALIVE_STATES}):
+            for instance in reservation.instances:
+                data["all"].append(instance)
+                data["id"][instance.id] = instance
+                _index(data["name"], instance.tags.get("Name", None), instance)
+                _index(data["ip"], instance.ip_address, instance)
+                _index(data["ip"], instance.private_ip_address, instance)
+                _index(data["zone"], instance.placement, instance)
+                _index(data["asg"], instance.tags.get("aws:autoscaling:groupName", None), instance)
+                for group in instance.groups:
+                    _index(data["group"], group.name, instance)
+                    _index(data["group"], group.id, instance)
+                for device, bdt in (instance.block_device_mapping or {}).items():
+                    if bdt.volume_id:
+                        data["volume"][bdt.volume_id] = instance
+        return data
+
+    def _load_volumes(self):
+        from mico.lib.aws.ec2 import ec2_connect
+        from mico.lib.aws.ec2 import ec2_tag_barrier
+        from mico.lib.aws.ec2.ebs import _ebs_get_volumes
+
+        ec2_tag_barrier(self.region)
+        conn = ec2_connect(self.region)
+        data = {"all": [], "id": {}, "name": {}, "instance": {}, "zone": {}}
+
+        for volume in aws_paginate(partial(_ebs_get_volumes, conn),
+                                   "max_results", 1000):
+            data["all"].append(volume)
+            data["id"][volume.id] = volume
+            _index(data["name"], volume.tags.get("Name", None), volume)
+            _index(data["instance"], volume.attach_data.instance_id, volume)
+            _index(data["zone"], volume.zone, volume)
+        return data
+
+    def _load_security_groups(self):
+        from mico.lib.aws.ec2 import ec2_connect
+
+        conn = ec2_connect(self.region)
+        data = {"all": [], "id": {}, "name": {}}
+
+        for group in conn.get_all_security_groups():
+            data["all"].append(group)
+            data["id"][group.id] = group
+            _index(data["name"], group.name, group)
+        return data
+
+    def _load_autoscaling_groups(self):
+        from mico.lib.aws.ec2.autoscale import as_connect
+
+        conn = as_connect(self.region)
+        data = {"all": [], "name": {}}
+
+        for group in aws_paginate(conn.get_all_groups, "max_records", 100):
+            data["all"].append(group)
+            data["name"][group.name] = group
+        return data
+
+    def instances(self):
+        """Return all the instances which are not terminated."""
+        return self._get("instances")["all"]
+
+    def instance(self, instance_id):
+        """Return the instance with the id passed as argument or None."""
+        return self._get("instances")["id"].get(instance_id, None)
+
+    def instances_by_name(self, name):
+        """Return the instances which Name tag is name."""
+        return self._get("instances")["name"].get(name, [])
+
+    def instances_by_ip(self, address):
+        """Return the instances with the public or private IP address."""
+        return self._get("instances")["ip"].get(address, [])
+
+    def instances_by_group(self, group):
+        """Return the instances in the security group passed as argument,
+        which can be the name or the id of the group.
+        """
+        return self._get("instances")["group"].get(group, [])
+
+    def instances_by_zone(self, zone):
+        """Return the instances in the availability zone."""
+        return self._get("instances")["zone"].get(zone, [])
+
+    def instances_by_autoscaling_group(self, name):
+        """Return the instances launched by the autoscaling group."""
+        return self._get("instances")["asg"].get(name, [])
+
+    def instance_by_volume(self, volume_id):
+        """Return the instance which has attached the volume or None."""
+        return self._get("instances")["volume"].get(volume_id, None)
+
+    def volumes(self):
+        """Return all the volumes."""
+        return self._get("volumes")["all"]
+
+    def volume(self, volume_id):
+        """Return the volume with the id passed as argument or None."""
+        return self._get("volumes")["id"].get(volume_id, None)
+
+    def volumes_by_name(self, name):
+        """Return the volumes which Name tag is name."""
+        return self._get("volumes")["name"].get(name, [])
+
+    def volumes_by_instance(self, instance_id):
+        """Return the volumes attached to the instance."""
+        return self._get("volumes")["instance"].get(instance_id, [])
+
+    def volumes_by_zone(self, zone):
+        """Return the volumes in the availability zone."""
+        return self._get("volumes")["zone"].get(zone, [])
+
+    def security_groups(self):
+        """Return all the security groups."""
+        return self._get("security_groups")["all"]
+
+    def security_group(self, group_id):
+        """Return the security group with the id passed as argument."""
+        return self._get("security_groups")["id"].get(group_id, None)
+
+    def security_groups_by_name(self, name):
+        """Return the security groups with the name passed as argument."""
+        return self._get("security_groups")["name"].get(name, [])
+
+    def autoscaling_groups(self):
+        """Return all the autoscaling groups."""
+        return self._get("autoscaling_groups")["all"]
+
+    def autoscaling_group(self, name):
+        """Return the autoscaling group with the name passed as argument."""
+        return self._get("autoscaling_groups")["name"].get(name, None)
+
+
+_inventories = {}
+_inventories_lock = threading.Lock()
+
+
+def aws_inventory(region=None):
+    """Return the inventory for the region passed as argument, or for the
+    current region if None.
+    """
+    region = region or aws_region()
+    with _inventories_lock:
+        if region not in _inventories:
+            _inventories[region] = Inventory(region)
+        return _inventories[region]
+
+
+def aws_inventory_invalidate(*kinds, **kwargs):
+    """Invalidate the kinds of resources passed as arguments (all kinds if
+    None) in the inventories of the current regions, or in the region
+    passed in the keyword argument region.
+    """
+    regions = [kwargs["region"]] if kwargs.get("region", None) else aws_regions()
+    for region in regions:
+        aws_inventory(region).invalidate(*kinds)
+
+
+def aws_inventory_reset():
+    """Drop the inventories of all the regions. The mico command line
+    calls it before each command, so commands never see the resources
+    loaded by previous ones.
+    """
+    with _inventories_lock:
+        _inventories.clear()
@@ -6,14 +6,25 @@
 """
 
 from os import environ as os_environ
-from fnmatch import fnmatch
 from boto.route53.connection import Route53Connection
 
+from mico.util.matcher import GlobMatcher
+from mico.lib.aws.connection import aws_connection
+from mico.lib.aws.cache import aws_cached
+
 
 class R53LibraryError(Exception):
     """Models a R53 library error."""
 
 
+def _r53_new_connection(region, *args, **kwargs):
+    return Route53Connection(
+            os_environ.get("AWS_ACCESS_KEY_ID"),
+            os_environ.get("AWS_SECRET_ACCESS_KEY"),
+            *args, **kwargs
+    )
+
+
 def r53_connect(region=None, *args, **kwargs):
     """Helper to connect to Amazon Web Services Route53, using identify provided
     by environment, as also optional region in arguments.
@@ -27,13 +38,7 @@ def r53_connect(region=None, *args, **kwargs):
     if not os_environ.get("AWS_SECRET_ACCESS_KEY", None):
         raise R53LibraryError("Environment variable AWS_SECRET_ACCESS_KEY is not set.")
 
-    connection = Route53Connection(
-            os_environ.get("AWS_ACCESS_KEY_ID"),
-            os_environ.get("AWS_SECRET_ACCESS_KEY"),
-            *args, **kwargs
-    )
-
-    return connection
+    return aws_connection("route53", None, _r53_new_connection, *args, **kwargs)
 
 
 def r53_zones(name=None):
@@ -54,16 +59,16 @@ def r53_records(zone, name=None):
         return [zone.get_record(name)]
 
 
+@aws_cached("r53_list", r53_connect, regional=False)
 def r53_list(*args):
     """Get all records in R53.
     """
-    args = args or ('*',)
+    matcher = GlobMatcher(args or ('*',))
 
     for zone in r53_zones():
         for record in r53_records(zone):
-            for arg in args:
-                if fnmatch(record.name, arg):
-                    record.zone = zone.name
-                    record.zone_obj = zone
-                    yield record
+            if matcher.match(record.name):
+                record.zone = zone.name
+                record.zone_obj = zone
+                yield record
 
@@ -0,0 +1,103 @@
+#! /usr/bin/env python
+# -*- encoding: utf-8 -*-
+# vim:fenc=utf-8:
+
+"""The region module handles the regions where AWS functions work on. The
+region is taken from ``ec2_region`` variable in the environment (the
+``-R`` option in mico command line), which can be a single region name, a
+comma separated list of regions, or the special word "all" for every
+available region.
+
+Listing functions decorated with :func:`aws_multiregion` run once per
+region, concurrently, when more than one region is configured.
+"""
+
+import threading
+from functools import wraps
+
+import boto.ec2
+
+import mico.output
+from mico.util.workers import imap_unordered
+
+
+_local = threading.local()
+
+
+def aws_regions():
+    """Return the list of region names to work on, according to the
+    environment.
+    """
+    if getattr(_local, "region", None):
+        return [_local.region]
+
+    region = env.get("ec2_region", None)
+    if not region:
+        return [None]
+
+    if region == "all":
+        return [r.name for r in boto.ec2.regions()
+                if not r.name.startswith("cn-") and
+                   not r.name.startswith("us-gov-")]
+
+    return [r.strip() for r in region.split(",") if r.strip()]
+
+
+def aws_region():
+    """Return the region name for the current thread. If many regions are
+    configured in the environment, the first one is used.
+    """
+    return aws_regions()[0]
+
+
+class aws_region_context(object):
+    """Context manager to pin the region used by the current thread.
+
+    Example::
+
+        with aws_region_context("eu-west-1"):
+            ec2_connect() # connect to eu-west-1
+    """
+    def __init__(self, region):
+        self.region = region
+
+    def __enter__(self):
+        self._old_region = getattr(_local, "region", None)
+        _local.region = self.region
+        return self
+
+    def __exit__(self, typ, value, traceback):
+        _local.region = self._old_region
+
+
+def aws_multiregion(fn):
+    """Decorator for listing functions, which returns an iterable of
+    objects, to run the function in all configured regions. Regions are
+    processed concurrently using a bounded number of threads (see
+    :mod:`mico.util.workers`), and the objects of each region are yielded
+    as soon as the region is completed, tagged with a ``region_name``
+    attribute.
+    """
+    @wraps(fn)
+    def _inner(*args):
+        regions = aws_regions()
+        if len(regions) <= 1:
+            return fn(*args)
+        return _aws_fanout(fn, args, regions)
+    return _inner
+
+
+def _aws_fanout(fn, args, regions):
+    def _run(region):
+        with aws_region_context(region):
+            try:
+                return list(fn(*args))
+            except Exception as e:
+                mico.output.error("unable to list %s in region %s: %s" % (
+                    fn.__name__, region, e,))
+                return []
+
+    for region, items in imap_unordered(_run, regions):
+        for item in items:
+            item.region_name = region
+            yield item
@@ -7,6 +7,7 @@ import cmd
 import shlex
 import random
 import pkgutil
+import json
 import inspect
 
 import mico.path
@@ -41,11 +42,75 @@ class MicoCmdline(cmd.Cmd):
     def emptyline(self):
         pass
 
+    def precmd(self, line):
+        _aws = sys.modules.get("mico.lib.aws.connection", None)
+        if _aws is not None:
+            _aws.aws_retry_stats_reset()
+            _aws.aws_api_profile_reset()
+        _inventory = sys.modules.get("mico.lib.aws.inventory", None)
+        if _inventory is not None:
+            _inventory.aws_inventory_reset()
+        return line
+
+    def postcmd(self, stop, line):
+        "Write the pending tags and report the AWS requests throttled by the command, if any."
+        _tags = sys.modules.get("mico.lib.aws.ec2.tags", None)
+        if _tags is not None:
+            try:
+                _tags.ec2_tag_flush()
+            except Exception as e:
+                mico.output.error("unable to write pending tags: %s" % e)
+
+        _aws = sys.modules.get("mico.lib.aws.connection", None)
+        if _aws is not None:
+            stats = _aws.aws_retry_stats()
+            if stats.retries or stats.waited:
+                mico.output.warn("AWS throttling: %d retries (%s), %.2fs in backoff, %.2fs rate limited" % (
+                    stats.retries,
+                    ", ".join(["%s: %d" % x for x in sorted(stats.services.items())]) or "none",
+                    stats.backoff,
+                    stats.waited,))
+            if env.get("profile_api", None):
+                self._profile_api(line, _aws.aws_api_profile())
+        return stop
+
+    def _profile_api(self, line, profile):
+        """Print the profile of AWS API calls of a command, or append it as
+        a JSON line to the file set in profile_api environment variable.
+        """
+        total = {
+                "calls": sum([x.calls for x in profile]),
+                "retries": sum([x.retries for x in profile]),
+                "total": sum([x.total for x in profile]),
+                "bytes": sum([x.bytes for x in profile]),
+        }
+
+        if isinstance(env.profile_api, basestring) and env.profile_api != "-":
+            with open(env.profile_api, "a") as f:
+                f.write(json.dumps({
+                    "command": line,
+                    "operations": profile,
+                    "total": total,
+                }) + "\n")
+            return
+
+        print >> sys.stderr, "%-12s %-32s %6s %7s %9s %8s %8s %10s" % (
+            "service", "operation", "calls", "retries", "total", "p50",
+            "p99", "bytes",)
+        for x in profile:
+            print >> sys.stderr, "%-12s %-32s %6d %7d %8.3fs %7.3fs %7.3fs %10d" % (
+                x.service, x.operation, x.calls, x.retries, x.total, x.p50,
+                x.p99, x.bytes,)
+        print >> sys.stderr, "%-12s %-32s %6d %7d %8.3fs %8s %8s %10d" % (
+            "total", "", total["calls"], total["retries"], total["total"],
+            "", "", total["bytes"],)
+
     def do_set(self, args):
         """Set an environment variable, in teh form variable=value"""
         if "=" in args:
-            args = args.split("=")
-            val = " ".join(args[1:])
+            # only the first = splits the name, values can contain more.
+            args = args.split("=", 1)
+            val = args[1]
 
             if val == "True" or val == "true":
                 val = True
@@ -218,7 +283,9 @@ def main():
                                       default=[])
     cmdopt.add_argument("-R", "--region", action="store",
                                       dest="region",
-                                      help="set EC2 region to work on",
+                                      help="set EC2 region to work on, a comma "
+                                           "separated list or 'all' to list "
+                                           "resources in many regions",
                                       type=str,
                                       default="us-east-1")
 
@@ -249,6 +316,26 @@ def main():
                                       help="don't execute actions in parallel",
                                       default=True)
 
+    cmdopt.add_argument("--refresh", action="store_true",
+                                      dest="refresh",
+                                      help="refresh cached AWS listings",
+                                      default=False)
+
+    cmdopt.add_argument("--profile-api", action="store_true",
+                                      dest="profile_api",
+                                      help="print a profile of the AWS API "
+                                           "calls of each command",
+                                      default=False)
+
+    cmdopt.add_argument("--profile-api-file", action="store",
+                                      dest="profile_api_file",
+                                      metavar="FILE",
+                                      help="append the profile of the AWS API "
+                                           "calls of each command as JSON to "
+                                           "FILE",
+                                      type=str,
+                                      default=None)
+
     cmdopt.add_argument("stack",
                         nargs='*',
                         default=None,
@@ -277,13 +364,18 @@ def main():
 
         env.force = args.force
         env.parallel = args.parallel
+        if not args.parallel:
+            env.aws_max_workers = 1
+        env.cache_refresh = args.refresh
+        env.profile_api = args.profile_api_file or ("-" if args.profile_api else None)
         env.ec2_region = args.region
         env.args = args
 
         if len(args.stack) == 0:
             cmdlne.cmdloop()
         else:
-            cmdlne.onecmd(" ".join(args.stack))
+            line = cmdlne.precmd(" ".join(args.stack))
+            cmdlne.postcmd(cmdlne.onecmd(line), line)
     except Exception, e:
         if "debug" in env.loglevel:
             raise
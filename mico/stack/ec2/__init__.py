@@ -31,9 +31,12 @@ def reboot(*args):
 
         mico ec2 reboot apaches-* test-*
     """
-    for x in ec2_list(*args):
-        x.reboot()
-        mico.output.info("Reboot instance: %s (%s)" % (x.name, x.id,))
+    for x, e in ec2_reboot(ec2_list(*args)):
+        if e is None:
+            mico.output.info("Reboot instance: %s (%s)" % (x.name, x.id,))
+        else:
+            mico.output.error("Unable to reboot instance %s (%s): %s"
+                    % (x.name, x.id, e.error_message,))
 
 
 def stop(*args):
@@ -41,9 +44,12 @@ def stop(*args):
 
         mico ec2 stop apaches-* test-*
     """
-    for x in ec2_list(*args):
-        x.stop()
-        mico.output.info("Stop instance: %s (%s)" % (x.name, x.id,))
+    for x, e in ec2_stop(ec2_list(*args)):
+        if e is None:
+            mico.output.info("Stop instance: %s (%s)" % (x.name, x.id,))
+        else:
+            mico.output.error("Unable to stop instance %s (%s): %s"
+                    % (x.name, x.id, e.error_message,))
 
 
 def start(*args):
@@ -51,9 +57,12 @@ def start(*args):
 
         mico ec2 start apaches-* test-*
     """
-    for x in ec2_list(*args):
-        x.start()
-        mico.output.info("Start instance: %s (%s)" % (x.name, x.id,))
+    for x, e in ec2_start(ec2_list(*args)):
+        if e is None:
+            mico.output.info("Start instance: %s (%s)" % (x.name, x.id,))
+        else:
+            mico.output.error("Unable to start instance %s (%s): %s"
+                    % (x.name, x.id, e.error_message,))
 
 
 def terminate(*args):
@@ -64,14 +73,11 @@ def terminate(*args):
     If termination protection is enabled, then *force* variable must be
     setted to True into the environment, otherwise terminate will fail.
     """
-    for x in ec2_list(*args):
-        try:
-            if env.get("force", False):
-                x.modify_attribute("disableApiTermination", False)
-                mico.output.debug("Disabling termination protection for instance %s (%s)" % (x.name, x.id,))
-            x.terminate()
+    force = env.get("force", False)
+    for x, e in ec2_terminate(ec2_list(*args), force):
+        if e is None:
             mico.output.info("Terminate instance: %s (%s)" % (x.name, x.id,))
-        except boto.exception.EC2ResponseError as e:
+        else:
             mico.output.error("Unable to terminate instance %s (%s): %s"
                     % (x.name, x.id, e.error_message,))
 
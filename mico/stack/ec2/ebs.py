@@ -16,6 +16,11 @@ def ls(*args):
     example::
 
         mico ec2.ebs ls apaches-* test-*
+
+    Volumes can be filtered by status and availability zone too, using
+    patterns prefixed by ``status:`` and ``zone:``, for example::
+
+        mico ec2.ebs ls db-* status:in-use zone:us-east-1a
     """
     for x in ebs_list(*args):
         mico.output.dump(x, layout=env.get("layout", "vertical"))
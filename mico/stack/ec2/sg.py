@@ -16,10 +16,10 @@ def rm(*args):
         mico ec2.sg rm sg01 sg02
 
     If the security group is referenced by another security group, you need to set the *force*
-    variable to True in order to delete the rules before.
+    variable to True in order to delete the rules before. All the security groups are
+    deleted together, so the referencing rules of each group are revoked at once.
     """
-    for x in args:
-        _x = sg_delete(x, env.get("force", False))
+    for _x in sg_delete_many(args, env.get("force", False)):
         mico.output.info("Removed security group %s" % (_x.name,))
 
 
@@ -0,0 +1,101 @@
+#! /usr/bin/env python
+# -*- encoding: utf-8 -*-
+# vim:fenc=utf-8:
+
+"""The matcher module provides a matcher for a number of glob patterns,
+which uses the same syntax than :mod:`fnmatch`, but compile all the
+patterns once, instead of evaluate each pattern for each value. Example::
+
+    matcher = GlobMatcher(["web-*", "db-?", "cache"])
+    [x for x in ["web-1", "db-1", "db-10"] if matcher.match(x)]
+"""
+
+import re
+
+
+def _translate(pattern):
+    """Translate a glob pattern into a regular expression, without anchors
+    nor inline flags, so many of them can be joined in a unique regular
+    expression.
+    """
+    i, n = 0, len(pattern)
+    res = ""
+    while i < n:
+        c = pattern[i]
+        i = i + 1
+        if c == "*":
+            res = res + ".*"
+        elif c == "?":
+            res = res + "."
+        elif c == "[":
+            j = i
+            if j < n and pattern[j] == "!":
+                j = j + 1
+            if j < n and pattern[j] == "]":
+                j = j + 1
+            while j < n and pattern[j] != "]":
+                j = j + 1
+            if j >= n:
+                res = res + "\\["
+            else:
+                stuff = pattern[i:j].replace("\\", "\\\\")
+                i = j + 1
+                if stuff[0] == "!":
+                    stuff = "^" + stuff[1:]
+                elif stuff[0] == "^":
+                    stuff = "\\" + stuff
+                res = "%s[%s]" % (res, stuff)
+        else:
+            res = res + re.escape(c)
+    return res
+
+
+class GlobMatcher(object):
+    """Models a matcher for a number of glob patterns. A value matches if
+    it matches any of the patterns.
+
+    Patterns without wildcards are matched using a set, and patterns with
+    an unique wildcard ``*`` at the end are matched as prefixes. The rest
+    of patterns are compiled in a unique regular expression.
+
+    :type patterns: list
+    :param patterns: the list of glob patterns to match.
+    """
+    def __init__(self, patterns):
+        self.patterns = list(patterns)
+        self.match_all = False
+        self._literals = set()
+        self._prefixes = []
+        _complex = []
+
+        for pattern in self.patterns:
+            if pattern == "*":
+                self.match_all = True
+            elif not any(map(lambda x: x in pattern, "*?[")):
+                self._literals.add(pattern)
+            elif pattern.endswith("*") and \
+                    not any(map(lambda x: x in pattern[:-1], "*?[")):
+                self._prefixes.append(pattern[:-1])
+            else:
+                _complex.append(pattern)
+
+        self._prefixes = tuple(self._prefixes)
+        if _complex:
+            self._regex = re.compile("(?:%s)\\Z" % "|".join(
+                ["(?:%s)" % _translate(x) for x in _complex]), re.S)
+        else:
+            self._regex = None
+
+    def match(self, value):
+        """Return True if the value passed as argument matches any of the
+        patterns of the matcher. None never matches.
+        """
+        if value is None:
+            return False
+        if self.match_all or value in self._literals:
+            return True
+        if self._prefixes and value.startswith(self._prefixes):
+            return True
+        return self._regex is not None and self._regex.match(value) is not None
+
+    __call__ = match
@@ -0,0 +1,96 @@
+#! /usr/bin/env python
+# -*- encoding: utf-8 -*-
+# vim:fenc=utf-8:
+
+"""The workers module provides a bounded pool of threads to run a function
+over a number of items concurrently. The number of threads is taken from
+the ``aws_max_workers`` variable in the environment (8 by default), and if
+it is set to 1, items are processed serially in the current thread.
+
+The fan-out does not depend on the fabric ``parallel`` setting, which is
+False by default when mico is used as a library.
+"""
+
+import sys
+from Queue import Queue
+from threading import Thread
+
+from mico import env
+
+
+def max_workers(workers=None):
+    """Return the number of workers to use, according to the argument or
+    to the ``aws_max_workers`` environment variable.
+    """
+    try:
+        return max(1, int(workers or env.get("aws_max_workers", 8) or 8))
+    except ValueError:
+        return 8
+
+
+def imap_unordered(fn, items, workers=None):
+    """Run fn for each item in items using a bounded number of threads, and
+    yield tuples (item, result) as soon as each call is done. If some call
+    raises an exception, the exception is raised again in the caller
+    thread.
+
+    :type fn: callable
+    :param fn: the function to run, which receive an item as argument.
+
+    :type items: iterable
+    :param items: the items to process.
+
+    :type workers: int
+    :param workers: the maximum number of threads to use, by default the
+        ``aws_max_workers`` environment variable.
+    """
+    items = list(items)
+
+    if max_workers(workers) <= 1 or len(items) <= 1:
+        for item in items:
+            yield (item, fn(item))
+        return
+
+    tasks = Queue()
+    results = Queue()
+
+    def _worker():
+        while True:
+            item = tasks.get()
+            if item is _worker:
+                break
+            try:
+                results.put((item, True, fn(item)))
+            except Exception:
+                results.put((item, False, sys.exc_info()))
+
+    for item in items:
+        tasks.put(item)
+
+    threads = []
+    for _ in range(min(max_workers(workers), len(items))):
+        tasks.put(_worker)
+        th = Thread(target=_worker)
+        th.daemon = True
+        th.start()
+        threads.append(th)
+
+    for _ in range(len(items)):
+        item, ok, value = results.get()
+        if not ok:
+            raise value[0], value[1], value[2]
+        yield (item, value)
+
+    for th in threads:
+        th.join()
+
+
+def pmap(fn, items, workers=None):
+    """Run fn for each item in items using a bounded number of threads and
+    return the list of results, in the same order than items.
+    """
+    items = list(items)
+    ret = {}
+    for (i, _), value in imap_unordered(lambda x: fn(x[1]), enumerate(items), workers):
+        ret[i] = value
+    return [ret[i] for i in range(len(items))]
@@ -0,0 +1,98 @@
+#! /usr/bin/env python
+# -*- encoding: utf-8 -*-
+# vim:fenc=utf-8:
+
+"""Base test case for the tests which run against the fake AWS backend
+(see :mod:`mico.lib.aws.fake`).
+"""
+
+import os
+import unittest
+import threading
+from contextlib import contextmanager
+
+# The connect helpers require credentials, but any value is valid for the
+# fake backend.
+os.environ.setdefault("AWS_ACCESS_KEY_ID", "fake")
+os.environ.setdefault("AWS_SECRET_ACCESS_KEY", "fake")
+
+import mico
+import mico.lib.aws.fake
+from mico import env
+
+from mico.lib.aws.fake import aws_fake
+from mico.lib.aws.fake import aws_fake_reset
+from mico.lib.aws.connection import aws_api_calls
+from mico.lib.aws.connection import aws_api_calls_reset
+from mico.lib.aws.connection import aws_retry_stats_reset
+from mico.lib.aws.connection import aws_api_profile_reset
+from mico.lib.aws.ec2.tags import ec2_tag_flush
+
+
+class FakeTestCase(unittest.TestCase):
+    """Test case with a fresh fake AWS account in each test, and helpers
+    to check the number of API calls.
+    """
+    region = "us-east-1"
+
+    def setUp(self):
+        self._env = dict(env)
+        env.aws_backend = "fake"
+        env.ec2_region = self.region
+        env.aws_fake_latency = 0
+        env.aws_fake_throttle = 0
+        env.aws_fake_seed = None
+        env.ec2_wait_delay = 0.01
+        env.loglevel = set(["abort"])
+        aws_fake_reset()
+        aws_retry_stats_reset()
+        aws_api_calls_reset()
+        aws_api_profile_reset()
+
+    def tearDown(self):
+        ec2_tag_flush()
+        env.clear()
+        env.update(self._env)
+        aws_fake_reset()
+
+    def calls(self, operation=None, service="ec2"):
+        """Return the number of API calls since the last reset."""
+        return aws_api_calls(service, operation)
+
+    def reset_calls(self):
+        aws_api_calls_reset()
+
+    @contextmanager
+    def requests(self, *services):
+        """Record the requests sent to the fake backend for the services
+        passed as arguments (ec2 by default), in a list of tuples
+        (operation, owner, thread), where owner is the thread which created
+        the connection used to send the request (None if it was created
+        before).
+        """
+        ret = []
+        owners = {}
+        fake = aws_fake()
+        factories = dict([(x, mico.lib.aws.fake._factories[x])
+                          for x in services or ("ec2",)])
+
+        def _factory(factory):
+            def _new(region):
+                connection = factory(region)
+                owners[id(connection)] = threading.current_thread().ident
+                return connection
+            return _new
+
+        def _call(connection, operation, params):
+            ret.append((operation, owners.get(id(connection), None),
+                        threading.current_thread().ident))
+            return type(fake).call(fake, connection, operation, params)
+
+        for service, factory in factories.items():
+            mico.lib.aws.fake._factories[service] = _factory(factory)
+        fake.call = _call
+        try:
+            yield ret
+        finally:
+            mico.lib.aws.fake._factories.update(factories)
+            del fake.call
@@ -0,0 +1,24 @@
+#! /usr/bin/env python
+# -*- encoding: utf-8 -*-
+# vim:fenc=utf-8:
+
+"""The test suite of mico, run with ``python setup.py test``, or with
+``python -m unittest tests.test`` from the root of the repository.
+"""
+
+import os
+import unittest
+
+
+def suite():
+    return unittest.defaultTestLoader.discover(
+        os.path.dirname(os.path.abspath(__file__)), pattern="test_*.py",
+        top_level_dir=os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+
+def load_tests(loader, tests, pattern):
+    return suite()
+
+
+if __name__ == "__main__":
+    unittest.main(defaultTest="suite")
@@ -0,0 +1,163 @@
+#! /usr/bin/env python
+# -*- encoding: utf-8 -*-
+# vim:fenc=utf-8:
+
+from tests.base import FakeTestCase
+
+from mico import env
+from mico.lib.aws.fake import aws_fake
+from mico.lib.aws.fake import aws_fake_seed
+from mico.lib.aws.ec2.autoscale import as_activity
+from mico.lib.aws.ec2.autoscale import as_list_instances
+from mico.lib.aws.ec2.autoscale import as_list_alarms
+from mico.lib.aws.ec2.autoscale import as_config
+from mico.lib.aws.ec2.autoscale import as_policy
+from mico.lib.aws.ec2.autoscale import as_alarm
+from mico.lib.aws.ec2.autoscale import as_event
+from mico.lib.aws.ec2.autoscale import as_ensure
+
+
+class TestActivity(FakeTestCase):
+
+    def setUp(self):
+        super(TestActivity, self).setUp()
+        aws_fake_seed(autoscaling_groups=1, autoscaling_size=250)
+        self.group = aws_fake().region(self.region).autoscaling_groups.keys()[0]
+        self.reset_calls()
+
+    def _activities(self, max_records=None):
+        ret = list(as_activity(self.group, max_records))
+        return len(ret), self.calls("DescribeScalingActivities", "autoscale")
+
+    def test_all(self):
+        self.assertEqual(self._activities(), (250, 3))
+
+    def test_max_records_on_page_boundary(self):
+        self.assertEqual(self._activities(200), (200, 2))
+
+    def test_max_records_within_page(self):
+        self.assertEqual(self._activities(150), (150, 2))
+        self.reset_calls()
+        self.assertEqual(self._activities(10), (10, 1))
+
+
+class TestListInstances(FakeTestCase):
+
+    def setUp(self):
+        super(TestListInstances, self).setUp()
+        aws_fake_seed(autoscaling_groups=50, autoscaling_size=10)
+        self.reset_calls()
+
+    def test_batched(self):
+        instances = list(as_list_instances())
+        self.assertEqual(len(instances), 500)
+        self.assertEqual(len(set([x.id for x in instances])), 500)
+        self.assertEqual(self.calls("DescribeAutoScalingGroups", "autoscale"), 1)
+        # 500 ids in chunks of 200, instead of one call by instance.
+        self.assertEqual(self.calls("DescribeInstances"), 3)
+
+        instance = instances[0]
+        self.assertTrue(instance.autoscaling_group.startswith("asg-"))
+        self.assertEqual(instance.launch_config_name,
+                         "%s-config" % instance.autoscaling_group)
+        self.assertEqual(instance.name, instance.autoscaling_group)
+
+    def test_filtered(self):
+        instances = list(as_list_instances("asg-00[0-4]"))
+        self.assertEqual(sorted(set([x.autoscaling_group for x in instances])),
+                         ["asg-%03d" % i for i in range(5)])
+        self.assertEqual(len(instances), 50)
+        self.assertEqual(self.calls("DescribeInstances"), 1)
+
+    def test_regions(self):
+        aws_fake_seed(autoscaling_groups=5, autoscaling_size=2,
+                      region="eu-west-1")
+        env.ec2_region = "us-east-1,eu-west-1"
+        self.reset_calls()
+
+        instances = list(as_list_instances())
+        self.assertEqual(len(instances), 510)
+        self.assertEqual(self.calls("DescribeAutoScalingGroups", "autoscale"), 2)
+        self.assertEqual(self.calls("DescribeInstances"), 4)
+
+
+class TestListAlarms(FakeTestCase):
+
+    def setUp(self):
+        super(TestListAlarms, self).setUp()
+        aws_fake_seed(autoscaling_groups=5, alarms=250)
+        self.reset_calls()
+
+    def test_batched(self):
+        alarms = list(as_list_alarms())
+        self.assertEqual(sorted([x.name for x in alarms]),
+                         ["alarm-%05d" % i for i in range(250)])
+        # 250 names in batches of 100, instead of one call by alarm.
+        self.assertEqual(self.calls("DescribeAlarms", "cloudwatch"), 3)
+
+    def test_filtered(self):
+        alarms = list(as_list_alarms("alarm-0000*", "alarm-00249"))
+        self.assertEqual(len(alarms), 11)
+        self.assertEqual(self.calls("DescribeAlarms", "cloudwatch"), 1)
+
+    def test_none(self):
+        self.assertEqual(list(as_list_alarms("missing-*")), [])
+        self.assertEqual(self.calls("DescribeAlarms", "cloudwatch"), 0)
+
+
+class TestEnsure(FakeTestCase):
+
+    def setUp(self):
+        super(TestEnsure, self).setUp()
+        aws_fake_seed(instances=1)
+        self.fake = aws_fake().region(self.region)
+        self.config = as_config("web-config", "ami-00000000",
+                                security_groups=["group-000"])
+        self.reset_calls()
+
+    def _alarm(self, name, comparison, threshold):
+        return as_alarm(name, metric="CPUUtilization", namespace="AWS/EC2",
+                        statistic="Average", comparison=comparison,
+                        threshold=threshold, period=60, evaluation_periods=2)
+
+    def _events(self):
+        up = as_policy("web-up", scaling_adjustment=1)
+        down = as_policy("web-down", scaling_adjustment=-1)
+        return [as_event(self._alarm("web-cpu-high", ">=", 80), up),
+                as_event(self._alarm("web-cpu-low", "<=", 20), down),
+                as_event(self._alarm("web-cpu-peak", ">=", 95), up),
+                as_event(self._alarm("web-cpu-idle", "<=", 5), [down])]
+
+    def test_batched(self):
+        env.aws_max_workers = 4
+        with self.requests("autoscale", "cloudwatch") as requests:
+            as_ensure("web", ["us-east-1a"], self.config,
+                      events=self._events())
+
+        # one policy by distinct action, and their ARNs at once.
+        self.assertEqual(self.calls("PutScalingPolicy", "autoscale"), 2)
+        self.assertEqual(self.calls("DescribePolicies", "autoscale"), 1)
+        self.assertEqual(self.calls("PutMetricAlarm", "cloudwatch"), 4)
+
+        # and each worker uses a connection of its own.
+        for operation, owner, thread in requests:
+            if operation in ("PutScalingPolicy", "PutMetricAlarm"):
+                self.assertEqual(owner, thread)
+
+        arns = dict([(x["name"].rsplit("-", 1)[0], x["arn"])
+                     for x in self.fake.policies.values()])
+        actions = dict([(x["name"].rsplit("-", 1)[0], x["actions"])
+                        for x in self.fake.alarms.values()])
+        self.assertEqual(actions, {
+            "web-cpu-high": [arns["web-up"]],
+            "web-cpu-peak": [arns["web-up"]],
+            "web-cpu-low": [arns["web-down"]],
+            "web-cpu-idle": [arns["web-down"]],
+        })
+
+    def test_existent(self):
+        as_ensure("web", ["us-east-1a"], self.config, events=self._events())
+        self.reset_calls()
+        as_ensure("web", ["us-east-1a"], self.config, events=self._events())
+        self.assertEqual(self.calls("PutScalingPolicy", "autoscale"), 0)
+        self.assertEqual(self.calls("PutMetricAlarm", "cloudwatch"), 0)
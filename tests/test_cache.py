@@ -0,0 +1,118 @@
+#! /usr/bin/env python
+# -*- encoding: utf-8 -*-
+# vim:fenc=utf-8:
+
+import os
+import time
+import shutil
+import tempfile
+import unittest
+
+from mico import env
+from mico.lib.aws.cache import inventory_cache
+from mico.lib.aws.cache import aws_cached
+from mico.lib.aws.cache import aws_cache_invalidate
+
+
+class TestCache(unittest.TestCase):
+
+    def setUp(self):
+        self._env = dict(env)
+        self._path = inventory_cache.path
+        self._key = os.environ.get("AWS_ACCESS_KEY_ID")
+        inventory_cache.path = tempfile.mkdtemp()
+        os.environ["AWS_ACCESS_KEY_ID"] = "AKIA0000000000000001"
+        # the fake backend never uses the cache, and the listings below
+        # send no requests at all.
+        env.aws_backend = "aws"
+        env.ec2_region = "us-east-1"
+        env.cache_ttl = 60
+        env.cache_refresh = False
+        self.listed = []
+
+    def tearDown(self):
+        shutil.rmtree(inventory_cache.path)
+        inventory_cache.path = self._path
+        if self._key is None:
+            os.environ.pop("AWS_ACCESS_KEY_ID", None)
+        else:
+            os.environ["AWS_ACCESS_KEY_ID"] = self._key
+        env.clear()
+        env.update(self._env)
+
+    def _list(self, *args):
+        @aws_cached("test_list", lambda region: None)
+        def _test_list(*args):
+            self.listed.append(args)
+            return ["%s-%s" % (env.ec2_region, x) for x in args]
+        return list(_test_list(*args))
+
+    def test_cached(self):
+        self.assertEqual(self._list("a", "b"), ["us-east-1-a", "us-east-1-b"])
+        self.assertEqual(self._list("a", "b"), ["us-east-1-a", "us-east-1-b"])
+        self.assertEqual(len(self.listed), 1)
+
+    def test_ttl(self):
+        self.assertEqual(inventory_cache.get("test_list", "us-east-1", ("a",),
+                                             60, None), None)
+        inventory_cache.set("test_list", "us-east-1", ("a",), ["x"])
+        self.assertEqual(inventory_cache.get("test_list", "us-east-1", ("a",),
+                                             60, None), ["x"])
+
+        _path = inventory_cache._filename("test_list", "us-east-1", ("a",))
+        os.utime(_path, (time.time() - 61, time.time() - 61))
+        self.assertEqual(inventory_cache.get("test_list", "us-east-1", ("a",),
+                                             60, None), None)
+
+    def test_disabled(self):
+        env.cache_ttl = 0
+        self._list("a")
+        self._list("a")
+        self.assertEqual(len(self.listed), 2)
+
+        env.cache_ttl = 60
+        env.aws_backend = "fake"
+        self._list("a")
+        self._list("a")
+        self.assertEqual(len(self.listed), 4)
+
+    def test_refresh(self):
+        self._list("a")
+        env.cache_refresh = True
+        self._list("a")
+        self.assertEqual(len(self.listed), 2)
+
+        # the refreshed listing is stored again.
+        env.cache_refresh = False
+        self._list("a")
+        self.assertEqual(len(self.listed), 2)
+
+    def test_key_by_arguments_and_region(self):
+        self._list("a")
+        self._list("b")
+        env.ec2_region = "eu-west-1"
+        self.assertEqual(self._list("a"), ["eu-west-1-a"])
+        self.assertEqual(len(self.listed), 3)
+
+    def test_key_by_credentials(self):
+        self._list("a")
+        os.environ["AWS_ACCESS_KEY_ID"] = "AKIA0000000000000002"
+        self._list("a")
+        self.assertEqual(len(self.listed), 2)
+
+        os.environ["AWS_ACCESS_KEY_ID"] = "AKIA0000000000000001"
+        self._list("a")
+        self.assertEqual(len(self.listed), 2)
+
+    def test_invalidate(self):
+        self._list("a")
+        os.environ["AWS_ACCESS_KEY_ID"] = "AKIA0000000000000002"
+        self._list("a")
+        aws_cache_invalidate("test_list")
+        self._list("a")
+        self.assertEqual(len(self.listed), 3)
+
+        # the listings of other credentials are kept.
+        os.environ["AWS_ACCESS_KEY_ID"] = "AKIA0000000000000001"
+        self._list("a")
+        self.assertEqual(len(self.listed), 3)
@@ -0,0 +1,91 @@
+#! /usr/bin/env python
+# -*- encoding: utf-8 -*-
+# vim:fenc=utf-8:
+
+import os
+import sys
+import json
+import shutil
+import tempfile
+from StringIO import StringIO
+
+from tests.base import FakeTestCase
+
+from mico import env
+from mico.script.cmdline import MicoCmdline
+from mico.lib.aws.fake import aws_fake_seed
+from mico.lib.aws.ec2 import ec2_list
+from mico.lib.aws.connection import aws_api_profile
+
+
+class TestCmdline(FakeTestCase):
+
+    def test_set(self):
+        cmdline = MicoCmdline()
+        cmdline.do_set("some_flag=true")
+        cmdline.do_set("some_value=a b")
+        self.assertEqual(env.some_flag, True)
+        self.assertEqual(env.some_value, "a b")
+
+    def test_set_value_with_equals(self):
+        MicoCmdline().do_set("aws_fake_seed=instances=3,security_groups=2")
+        self.assertEqual(env.aws_fake_seed, "instances=3,security_groups=2")
+        self.assertEqual(len(list(ec2_list())), 3)
+
+
+class TestProfileApi(FakeTestCase):
+
+    def setUp(self):
+        super(TestProfileApi, self).setUp()
+        aws_fake_seed(instances=5, security_groups=2)
+        self.path = tempfile.mkdtemp()
+        self.addCleanup(shutil.rmtree, self.path)
+
+    def _run(self, line):
+        cmdline = MicoCmdline()
+        cmdline.precmd(line)
+        list(ec2_list())
+        cmdline.postcmd(False, line)
+
+    def test_profile(self):
+        env.profile_api = "-"
+        list(ec2_list())
+        list(ec2_list())
+        profile = aws_api_profile()
+        self.assertEqual([(x.service, x.operation, x.calls, x.retries)
+                          for x in profile],
+                         [("ec2", "DescribeInstances", 2, 0)])
+        self.assertTrue(profile[0].bytes > 0)
+        self.assertTrue(profile[0].p50 <= profile[0].p99 <= profile[0].total)
+
+    def test_disabled(self):
+        env.profile_api = None
+        list(ec2_list())
+        self.assertEqual(aws_api_profile(), [])
+
+    def test_file(self):
+        env.profile_api = os.path.join(self.path, "profile.json")
+        self._run("ec2 list")
+        self._run("ec2 list again")
+
+        with open(env.profile_api) as f:
+            lines = [json.loads(x) for x in f]
+        self.assertEqual([x["command"] for x in lines],
+                         ["ec2 list", "ec2 list again"])
+        # the profile is reset before each command.
+        for line in lines:
+            self.assertEqual(line["total"]["calls"], 1)
+            self.assertEqual(line["operations"][0]["operation"],
+                             "DescribeInstances")
+
+    def test_stderr(self):
+        env.profile_api = "-"
+        stderr, sys.stderr = sys.stderr, StringIO()
+        try:
+            self._run("ec2 list")
+            output = sys.stderr.getvalue()
+        finally:
+            sys.stderr = stderr
+        self.assertTrue("DescribeInstances" in output)
+        self.assertEqual(output.splitlines()[-1].split()[:3],
+                         ["total", "1", "0"])
@@ -0,0 +1,146 @@
+#! /usr/bin/env python
+# -*- encoding: utf-8 -*-
+# vim:fenc=utf-8:
+
+import gc
+import time
+import threading
+
+from boto.exception import BotoServerError
+
+from tests.base import FakeTestCase
+
+import mico.lib.aws.connection
+from mico import env
+from mico.lib.aws.fake import aws_fake
+from mico.lib.aws.fake import aws_fake_seed
+from mico.lib.aws.ec2 import ec2_list
+from mico.lib.aws.ec2 import ec2_connect
+from mico.lib.aws.connection import retry_stats
+from mico.lib.aws.connection import connection_pool
+from mico.lib.aws.connection import aws_connection_stats
+from mico.lib.aws.connection import aws_retry_stats
+from mico.lib.aws.connection import aws_retry_stats_reset
+
+
+class TestConnectionPool(FakeTestCase):
+
+    def setUp(self):
+        super(TestConnectionPool, self).setUp()
+        connection_pool.clear()
+
+    def test_reused_in_thread(self):
+        self.assertTrue(ec2_connect() is ec2_connect())
+        stats = aws_connection_stats()
+        self.assertEqual((stats.created, stats.reused, stats.alive),
+                         (1, 1, 1))
+
+    def test_one_by_thread(self):
+        connections = []
+
+        def _connect():
+            connections.append(ec2_connect())
+
+        threads = [threading.Thread(target=_connect) for _ in range(2)]
+        for th in threads:
+            th.start()
+        for th in threads:
+            th.join()
+        self.assertFalse(connections[0] is connections[1])
+
+    def test_released_when_thread_exits(self):
+        main = ec2_connect()
+        threads = [threading.Thread(target=ec2_connect) for _ in range(50)]
+        for th in threads:
+            th.start()
+        for th in threads:
+            th.join()
+        del threads
+        gc.collect()
+
+        stats = aws_connection_stats()
+        self.assertEqual(stats.created, 51)
+        self.assertEqual(stats.alive, 1)
+        self.assertTrue(ec2_connect() is main)
+
+
+class FakeClock(object):
+    """Models a clock where sleeping only moves the time forward."""
+    def __init__(self):
+        self.slept = 0.0
+
+    def time(self):
+        return time.time() + self.slept
+
+    def sleep(self, seconds):
+        self.slept += seconds
+
+
+class TestRetry(FakeTestCase):
+
+    def setUp(self):
+        super(TestRetry, self).setUp()
+        aws_fake_seed(instances=5)
+        self.clock = FakeClock()
+        mico.lib.aws.connection.time = self.clock
+        self.throttled = 0
+        env.retry_attempts = 5
+        env.retry_budget = 500
+
+    def tearDown(self):
+        mico.lib.aws.connection.time = time
+        super(TestRetry, self).tearDown()
+
+    def _throttle(self, count):
+        """Throttle the next count requests, or all of them if None."""
+        fake = aws_fake()
+
+        def _call(connection, operation, params):
+            env.aws_fake_throttle = 1 if count is None or \
+                self.throttled < count else 0
+            self.throttled += env.aws_fake_throttle
+            return type(fake).call(fake, connection, operation, params)
+
+        fake.call = _call
+        self.addCleanup(delattr, fake, "call")
+
+    def test_retry(self):
+        self._throttle(2)
+        self.assertEqual(len(list(ec2_list())), 5)
+        self.assertEqual(self.calls("DescribeInstances"), 3)
+
+        stats = aws_retry_stats()
+        self.assertEqual(stats.retries, 2)
+        self.assertEqual(stats.services, {"ec2": 2})
+        self.assertTrue(stats.backoff > 0)
+        self.assertTrue(self.clock.slept >= stats.backoff)
+
+    def test_attempts(self):
+        env.retry_attempts = 3
+        self._throttle(None)
+        self.assertRaises(BotoServerError, list, ec2_list())
+        self.assertEqual(self.calls("DescribeInstances"), 3)
+        self.assertEqual(aws_retry_stats().retries, 2)
+
+    def test_budget(self):
+        env.retry_budget = 3
+        self._throttle(None)
+        self.assertRaises(BotoServerError, list, ec2_list())
+        self.assertEqual(self.calls("DescribeInstances"), 4)
+
+        # once the budget is exhausted, throttled requests fail at once.
+        self.reset_calls()
+        self.assertRaises(BotoServerError, list, ec2_list())
+        self.assertEqual(self.calls("DescribeInstances"), 1)
+        self.assertEqual(aws_retry_stats().retries, 3)
+
+    def test_reset(self):
+        env.retry_budget = 1
+        self._throttle(2)
+        self.assertRaises(BotoServerError, list, ec2_list())
+        self.assertTrue(retry_stats.bucket("ec2").rate is not None)
+
+        aws_retry_stats_reset()
+        self.assertEqual(aws_retry_stats().retries, 0)
+        self.assertEqual(retry_stats.bucket("ec2").rate, None)
+        self.assertEqual(len(list(ec2_list())), 5)
@@ -0,0 +1,183 @@
+#! /usr/bin/env python
+# -*- encoding: utf-8 -*-
+# vim:fenc=utf-8:
+
+import __builtin__
+
+from tests.base import FakeTestCase
+
+from mico import env
+from mico.lib.aws.fake import aws_fake
+from mico.lib.aws.fake import aws_fake_seed
+from mico.lib.aws.ec2 import ec2_ensure
+from mico.lib.aws.ec2 import ec2_tag_flush
+from mico.lib.aws.ec2 import EC2LibraryError
+from mico.lib.aws.ec2.ebs import ebs_list
+from mico.lib.aws.ec2.ebs import ebs_ensure_many
+from mico.lib.aws.ec2.ebs import ebs_raid_ensure
+
+
+class FakeResult(str):
+    """Models the result of a command run in the fake host."""
+    def __new__(cls, output="", return_code=0):
+        ret = str.__new__(cls, output)
+        ret.return_code = return_code
+        return ret
+
+
+class FakeHost(object):
+    """Models a host which answers the commands used to build a RAID array,
+    keeping the state of the array, the filesystem and the mount.
+    """
+    def __init__(self):
+        self.commands = []
+        self.members = set()
+        self.array = False
+        self.filesystem = None
+        self.mounted = False
+
+    def __call__(self, command, force=False):
+        self.commands.append(command)
+        code, output = 0, ""
+        if command.startswith("mdadm --detail /dev/md0"):
+            code = 0 if self.array else 1
+        elif command.startswith("mdadm --examine"):
+            code = 0 if command.split()[-1] in self.members else 1
+        elif command.startswith("mdadm --create"):
+            self.array = True
+            self.members.update([x for x in command.split() if x.startswith("/dev/xvd")])
+        elif command.startswith("mdadm --assemble"):
+            self.array = True
+        elif command.startswith("for i in"):
+            output = command.split("for d in ")[1].split(";")[0].split()[-1]
+        elif command.startswith("blkid"):
+            output = self.filesystem or ""
+        elif command.startswith("mkfs"):
+            self.filesystem = command.split()[2]
+        elif command.startswith("mountpoint"):
+            code = 0 if self.mounted else 1
+        elif command.startswith("mount "):
+            self.mounted = True
+        return [FakeResult(output, code)]
+
+    def ran(self, prefix):
+        return [x for x in self.commands if x.startswith(prefix)]
+
+
+class TestList(FakeTestCase):
+
+    def setUp(self):
+        super(TestList, self).setUp()
+        aws_fake_seed(instances=300, volumes=600)
+        self.reset_calls()
+
+    def test_filtered(self):
+        volumes = list(ebs_list("volume-0001*"))
+        self.assertEqual(len(volumes), 10)
+        self.assertEqual(self.calls("DescribeVolumes"), 1)
+        # only the attached instances, in a single request.
+        self.assertEqual(self.calls("DescribeInstances"), 1)
+        self.assertTrue(all([x.instance_id.startswith("host-") for x in volumes]))
+
+    def test_status(self):
+        volumes = list(ebs_list("status:available"))
+        self.assertTrue(volumes)
+        self.assertEqual(set([x.status for x in volumes]), set(["available"]))
+        self.assertEqual(self.calls("DescribeInstances"), 0)
+
+
+class TestEnsureMany(FakeTestCase):
+
+    def setUp(self):
+        super(TestEnsureMany, self).setUp()
+        aws_fake_seed(instances=2)
+        self.instance = ec2_ensure("ami-00000000", name="db-1")
+        ec2_tag_flush()
+        self.reset_calls()
+
+    def test_create_and_attach(self):
+        devices = ["/dev/sd%s" % x for x in "fghijklm"]
+        volumes = ebs_ensure_many(dict([(x, 10) for x in devices]),
+                                  instance=self.instance)
+        self.assertEqual(sorted(volumes), devices)
+        self.assertEqual(self.calls("CreateVolume"), 8)
+        self.assertEqual(self.calls("AttachVolume"), 8)
+
+        ec2_tag_flush()
+        self.reset_calls()
+        again = ebs_ensure_many(dict([(x, 10) for x in devices]),
+                                instance=self.instance)
+        self.assertEqual(sorted([x.id for x in again.values()]),
+                         sorted([x.id for x in volumes.values()]))
+        self.assertEqual(self.calls(), 1)
+
+    def test_connection_by_worker(self):
+        env.aws_max_workers = 4
+        with self.requests() as requests:
+            ebs_ensure_many(dict([("/dev/sd%s" % x, 10) for x in "fghi"]),
+                            instance=self.instance)
+
+        workers = [x for x in requests
+                   if x[0] in ("CreateVolume", "AttachVolume")]
+        self.assertEqual(len(workers), 8)
+        for operation, owner, thread in workers:
+            self.assertEqual(owner, thread)
+
+
+class TestRaid(FakeTestCase):
+
+    def setUp(self):
+        super(TestRaid, self).setUp()
+        aws_fake_seed(instances=2)
+        self.instance = ec2_ensure("ami-00000000", name="db-1")
+        self.host = FakeHost()
+        self._run = getattr(__builtin__, "run", None)
+        __builtin__.run = self.host
+
+    def tearDown(self):
+        __builtin__.run = self._run
+        super(TestRaid, self).tearDown()
+
+    def _raid(self):
+        return ebs_raid_ensure(self.instance, 4, 100, volume_type="io1",
+                               iops=1000, mount="/srv/data")
+
+    def test_create(self):
+        volumes = self._raid()
+        self.assertEqual(sorted(volumes), ["/dev/sdf", "/dev/sdg", "/dev/sdh", "/dev/sdi"])
+        self.assertEqual(len(self.host.ran("mdadm --create")), 1)
+        self.assertIn("--raid-devices=4", self.host.ran("mdadm --create")[0])
+        self.assertEqual(self.host.ran("mkfs"), ["mkfs -t ext4  /dev/md0"])
+        self.assertTrue(self.host.mounted)
+
+        fake = aws_fake().region(self.region)
+        for volume in volumes.values():
+            self.assertEqual(fake.volumes[volume.id]["type"], "io1")
+            self.assertEqual(fake.volumes[volume.id]["iops"], 1000)
+
+    def test_idempotent(self):
+        volumes = self._raid()
+        ec2_tag_flush()
+        self.host.commands = []
+        self.reset_calls()
+
+        again = self._raid()
+        self.assertEqual(sorted([x.id for x in again.values()]),
+                         sorted([x.id for x in volumes.values()]))
+        self.assertEqual(self.calls("CreateVolume"), 0)
+        self.assertEqual(self.calls("AttachVolume"), 0)
+        self.assertEqual(self.host.ran("mdadm --create"), [])
+        self.assertEqual(self.host.ran("mdadm --assemble"), [])
+        self.assertEqual(self.host.ran("mkfs"), [])
+        self.assertEqual(self.host.ran("mount "), [])
+
+    def test_assemble_existent_members(self):
+        self.host.members.update(["/dev/xvd%s" % x for x in "fghi"])
+        self._raid()
+        self.assertEqual(self.host.ran("mdadm --create"), [])
+        self.assertEqual(len(self.host.ran("mdadm --assemble")), 1)
+
+    def test_partial_members(self):
+        self.host.members.update(["/dev/xvdf"])
+        self.assertRaises(EC2LibraryError, self._raid)
+        self.assertEqual(self.host.ran("mdadm --create"), [])
@@ -0,0 +1,174 @@
+#! /usr/bin/env python
+# -*- encoding: utf-8 -*-
+# vim:fenc=utf-8:
+
+from tests.base import FakeTestCase
+
+from mico.lib.aws.fake import aws_fake
+from mico.lib.aws.fake import aws_fake_seed
+from mico.lib.aws.ec2 import ec2_exists
+from mico.lib.aws.ec2 import ec2_ensure
+from mico.lib.aws.ec2 import ec2_ensure_many
+from mico.lib.aws.ec2 import ec2_list
+from mico.lib.aws.ec2 import ec2_tag_batch
+from mico.lib.aws.ec2 import ec2_tag_flush
+from mico.lib.aws.ec2 import ec2_stop
+from mico.lib.aws.ec2 import ec2_start
+from mico.lib.aws.ec2 import ec2_reboot
+from mico.lib.aws.ec2 import ec2_terminate
+from mico.lib.aws.ec2 import EC2_ALIVE_STATES
+from mico.lib.aws.ec2 import _ec2_list_queries
+
+
+class TestList(FakeTestCase):
+
+    def setUp(self):
+        super(TestList, self).setUp()
+        self.seed = aws_fake_seed(instances=300, security_groups=3)
+        self.reset_calls()
+
+    def _names(self, *args):
+        return sorted([x.name for x in ec2_list(*args)])
+
+    def test_queries(self):
+        self.assertEqual(_ec2_list_queries(["web-*", "ip:54.*", "db-?"]), [
+            ("name", {"instance-state-name": EC2_ALIVE_STATES,
+                      "tag:Name": ["web-*", "db-?"]}),
+            ("ip", {"instance-state-name": EC2_ALIVE_STATES,
+                    "ip-address": ["54.*"]}),
+        ])
+        self.assertEqual(_ec2_list_queries(["sec:group-00*"]), [
+            ("sec", {"instance-state-name": EC2_ALIVE_STATES,
+                     "instance.group-name": ["group-00*"]}),
+        ])
+        # character classes are matched in the client side.
+        self.assertEqual(_ec2_list_queries(["web-*", "host-[01]*"]), [
+            (None, {"instance-state-name": EC2_ALIVE_STATES}),
+        ])
+
+    def test_filtered(self):
+        self.assertEqual(self._names("host-0001*"),
+                         ["host-%05d" % i for i in range(10, 20)])
+        self.assertEqual(self.calls(), 1)
+        self.assertEqual(self.calls("DescribeInstances"), 1)
+
+    def test_one_call_by_kind(self):
+        by_group = [x.name for x in ec2_list("sec:group-000")]
+        self.reset_calls()
+        names = self._names("host-0001*", "host-0002*", "sec:group-000")
+        self.assertEqual(names, sorted(set(
+            ["host-%05d" % i for i in range(10, 30)] + by_group)))
+        self.assertEqual(self.calls("DescribeInstances"), 2)
+
+    def test_client_side(self):
+        self.assertEqual(self._names("host-0000[13]"),
+                         ["host-00001", "host-00003"])
+        self.assertEqual(self.calls("DescribeInstances"), 1)
+
+    def test_terminated(self):
+        fake = aws_fake().region(self.region)
+        for record in fake.instances.values():
+            if record["tags"].get("Name") == "host-00010":
+                record["state"] = "terminated"
+        self.assertEqual(len(self._names("host-0001*")), 9)
+        self.assertEqual(len(self._names("host-0001[0-9]")), 9)
+
+
+class TestExists(FakeTestCase):
+
+    def setUp(self):
+        super(TestExists, self).setUp()
+        aws_fake_seed(instances=20)
+        self.reset_calls()
+
+    def test_one_describe_by_lookup(self):
+        self.assertEqual(ec2_exists({"Name": "host-00003"}).tags["Name"], "host-00003")
+        self.assertEqual(ec2_exists({"Name": "missing"}), [])
+        self.assertEqual(self.calls(), 2)
+        self.assertEqual(self.calls("DescribeInstances"), 2)
+
+    def test_ensure_existent(self):
+        instance = ec2_ensure("ami-00000000", name="host-00003")
+        self.assertEqual(instance.tags["Name"], "host-00003")
+        self.assertEqual(self.calls(), 1)
+        self.assertEqual(self.calls("DescribeInstances"), 1)
+
+    def test_pending_tags_flushed_only_when_they_match(self):
+        instances = list(ec2_list())
+        ec2_tag_batch(instances[:5], {"role": "web"})
+        self.reset_calls()
+
+        ec2_exists({"Name": "host-00003", "role": "db"})
+        self.assertEqual(self.calls("CreateTags"), 0)
+
+        self.assertEqual(len(ec2_exists({"role": "web"})), 5)
+        self.assertEqual(self.calls("CreateTags"), 1)
+        self.assertEqual(self.calls("DescribeInstances"), 2)
+
+
+class TestEnsureMany(FakeTestCase):
+
+    def test_one_run_instances(self):
+        names = ["web-%02d" % i for i in range(20)]
+        instances = ec2_ensure_many("ami-00000000", names + names[:5])
+        self.assertEqual([x.tags["Name"] for x in instances], names)
+        self.assertEqual(self.calls("RunInstances"), 1)
+
+        ec2_tag_flush()
+        self.reset_calls()
+        again = ec2_ensure_many("ami-00000000", names)
+        self.assertEqual([x.id for x in again], [x.id for x in instances])
+        self.assertEqual(self.calls(), 1)
+        self.assertEqual(self.calls("DescribeInstances"), 1)
+
+
+class TestBulk(FakeTestCase):
+
+    def setUp(self):
+        super(TestBulk, self).setUp()
+        aws_fake_seed(instances=250)
+        self.fake = aws_fake().region(self.region)
+        self.instances = list(ec2_list())
+        self.reset_calls()
+
+    def _states(self):
+        return set([x["state"] for x in self.fake.instances.values()])
+
+    def test_chunks(self):
+        results = list(ec2_stop(self.instances))
+        self.assertEqual(len(results), 250)
+        self.assertEqual([e for _, e in results if e is not None], [])
+        self.assertEqual(self.calls("StopInstances"), 3)
+        self.assertEqual(self._states(), set(["stopping"]))
+
+        for record in self.fake.instances.values():
+            record["state"] = "stopped"
+        self.reset_calls()
+        results = list(ec2_start(self.instances))
+        self.assertEqual([e for _, e in results if e is not None], [])
+        self.assertEqual(self.calls(), 3)
+
+        self.reset_calls()
+        self.assertEqual(len(list(ec2_reboot(self.instances[:10]))), 10)
+        self.assertEqual(self.calls(), 1)
+
+    def test_errors_by_instance(self):
+        protected = self.instances[5]
+        self.fake.instances[protected.id]["termination_protection"] = True
+
+        results = list(ec2_terminate(self.instances))
+        errors = [x for x, e in results if e is not None]
+        self.assertEqual(errors, [protected])
+        self.assertEqual(len(results), 250)
+        # the failed chunk is retried instance by instance.
+        self.assertEqual(self.calls("TerminateInstances"), 3 + 100)
+        self.assertEqual(self.fake.instances[protected.id]["state"], "running")
+
+    def test_force(self):
+        for instance in self.instances[:3]:
+            self.fake.instances[instance.id]["termination_protection"] = True
+
+        results = list(ec2_terminate(self.instances, force=True))
+        self.assertEqual([e for _, e in results if e is not None], [])
+        self.assertEqual(self.calls("ModifyInstanceAttribute"), 250)
+        self.assertEqual(self.calls("TerminateInstances"), 3)
@@ -0,0 +1,107 @@
+#! /usr/bin/env python
+# -*- encoding: utf-8 -*-
+# vim:fenc=utf-8:
+
+from tests.base import FakeTestCase
+
+from mico import env
+from mico.script.cmdline import MicoCmdline
+from mico.lib.aws.fake import aws_fake
+from mico.lib.aws.fake import aws_fake_seed
+from mico.lib.aws.fake.ec2 import new_instance
+from mico.lib.aws.inventory import aws_inventory
+from mico.lib.aws.ec2 import ec2_list
+from mico.lib.aws.ec2 import EC2LibraryError
+from mico.lib.aws.ec2.ebs import ebs_list
+from mico.lib.aws.ec2.sg import sg_exists
+from mico.lib.aws.ec2.sg import sg_delete
+from mico.lib.aws.ec2.autoscale import as_list_instances
+
+
+class TestInventory(FakeTestCase):
+
+    def setUp(self):
+        super(TestInventory, self).setUp()
+        aws_fake_seed(instances=5)
+        self.fake = aws_fake().region(self.region)
+        aws_inventory().instances()
+        self.reset_calls()
+
+    def test_loaded(self):
+        self.assertEqual(len(list(ec2_list())), 5)
+        self.assertEqual(self.calls(), 0)
+
+    def test_reset_before_each_command(self):
+        new_instance(self.fake, tags={"Name": "other"})
+        self.assertEqual(len(list(ec2_list())), 5)
+
+        MicoCmdline().precmd("ec2 ls")
+        self.assertEqual(len(list(ec2_list())), 6)
+        self.assertEqual(self.calls("DescribeInstances"), 1)
+
+    def test_refresh(self):
+        env.cache_refresh = True
+        new_instance(self.fake, tags={"Name": "other"})
+        self.assertEqual(len(list(ec2_list())), 6)
+        self.assertEqual(self.calls("DescribeInstances"), 1)
+
+
+class TestInventoryReaders(FakeTestCase):
+
+    def setUp(self):
+        super(TestInventoryReaders, self).setUp()
+        self.seed = aws_fake_seed(instances=20, volumes=30, security_groups=3,
+                                  autoscaling_groups=4, autoscaling_size=2)
+        self.inventory = aws_inventory()
+        self.reset_calls()
+
+    def test_indexes(self):
+        instances = self.inventory.instances()
+        instance = instances[0]
+        self.assertEqual(self.inventory.instances_by_name(instance.tags["Name"]),
+                         [instance])
+        self.assertIn(instance, self.inventory.instances_by_group(instance.groups[0].id))
+        self.assertIn(instance, self.inventory.instances_by_zone(instance.placement))
+        self.assertEqual(len(self.inventory.autoscaling_groups()), 4)
+        self.assertEqual(len(self.inventory.security_groups_by_name("group-000")), 1)
+        self.assertEqual(self.calls("DescribeInstances"), 1)
+        self.assertEqual(self.calls("DescribeSecurityGroups"), 1)
+
+    def test_ebs_list(self):
+        expected = sorted([x.id for x in ebs_list("volume-0001*")])
+        self.inventory.volumes()
+        self.inventory.instances()
+        self.reset_calls()
+
+        self.assertEqual(sorted([x.id for x in ebs_list("volume-0001*")]),
+                         expected)
+        self.assertEqual(self.calls(), 0)
+
+    def test_ebs_list_invalidated(self):
+        self.inventory.volumes()
+        self.inventory.invalidate("volumes")
+        self.reset_calls()
+        list(ebs_list("volume-0001*"))
+        self.assertEqual(self.calls("DescribeVolumes"), 1)
+
+    def test_as_list_instances(self):
+        self.assertEqual(len(list(as_list_instances())), 8)
+        self.assertEqual(self.calls("DescribeAutoScalingGroups", "autoscale"), 1)
+
+        self.reset_calls()
+        self.inventory.instances()
+        self.assertEqual(len(list(as_list_instances("asg-000"))), 2)
+        self.assertEqual(self.calls("DescribeAutoScalingGroups", "autoscale"), 0)
+        self.assertEqual(self.calls("DescribeInstances"), 1)
+
+    def test_sg_delete(self):
+        self.inventory.instances()
+        self.reset_calls()
+        self.assertRaises(EC2LibraryError, sg_delete, "group-000", force=True)
+        # the users of the group are taken from the inventory.
+        self.assertEqual(self.calls("DescribeInstances"), 0)
+        self.assertEqual(self.calls("DescribeSecurityGroups"), 1)
+
+        # and the groups loaded for the graph serve later lookups.
+        self.assertEqual(sg_exists("group-001").name, "group-001")
+        self.assertEqual(self.calls("DescribeSecurityGroups"), 1)
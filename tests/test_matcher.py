@@ -0,0 +1,51 @@
+#! /usr/bin/env python
+# -*- encoding: utf-8 -*-
+# vim:fenc=utf-8:
+
+import unittest
+from fnmatch import fnmatchcase
+
+from mico.util.matcher import GlobMatcher
+
+
+VALUES = ["web-1", "web-10", "web-", "db-1", "db-12", "cache", "cache-1",
+          "a.b", "a+b", "a[b", "ab", "a]b", "x!y", "", "WEB-1"]
+
+
+class TestGlobMatcher(unittest.TestCase):
+
+    def _check(self, patterns):
+        matcher = GlobMatcher(patterns)
+        for value in VALUES:
+            expected = any([fnmatchcase(value, x) for x in patterns])
+            self.assertEqual(matcher.match(value), expected,
+                             "%r with %r" % (value, patterns))
+
+    def test_same_as_fnmatch(self):
+        for patterns in [
+            ["*"],
+            ["cache"],
+            ["web-*"],
+            ["db-?"],
+            ["*-1"],
+            ["a.b", "a+b"],
+            ["a[!.]b"],
+            ["a[]]b"],
+            ["a[b"],
+            ["web-[0-9]*", "db-[!2]*"],
+            ["cache", "web-*", "db-?", "*1[02]"],
+            [],
+        ]:
+            self._check(patterns)
+
+    def test_kinds(self):
+        matcher = GlobMatcher(["cache", "web-*", "db-?"])
+        self.assertEqual(matcher._literals, set(["cache"]))
+        self.assertEqual(matcher._prefixes, ("web-",))
+        self.assertTrue(matcher._regex is not None)
+        self.assertEqual(GlobMatcher(["web-*"])._regex, None)
+
+    def test_none(self):
+        self.assertFalse(GlobMatcher(["*"]).match(None))
+        self.assertFalse(GlobMatcher(["*"])(None))
+        self.assertTrue(GlobMatcher(["web-*"])("web-1"))
@@ -0,0 +1,189 @@
+#! /usr/bin/env python
+# -*- encoding: utf-8 -*-
+# vim:fenc=utf-8:
+
+from tests.base import FakeTestCase
+
+from mico import env
+
+from mico.lib.aws.fake import aws_fake
+from mico.lib.aws.fake import aws_fake_seed
+from mico.lib.aws.fake.ec2 import new_security_group
+from mico.lib.aws.fake.ec2 import new_instance
+from mico.lib.aws.ec2 import EC2LibraryError
+from mico.lib.aws.ec2.sg import sg_rule
+from mico.lib.aws.ec2.sg import sg_ensure
+from mico.lib.aws.ec2.sg import sg_delete
+from mico.lib.aws.ec2.sg import sg_delete_many
+from mico.lib.aws.ec2.sg import sg_exists
+from mico.lib.aws.ec2.sg import sg_exists_many
+
+
+class TestSecurityGroupDelete(FakeTestCase):
+
+    def setUp(self):
+        super(TestSecurityGroupDelete, self).setUp()
+        self.seed = aws_fake_seed(instances=10, security_groups=5)
+        self.fake = aws_fake().region(self.region)
+        self.targets = [new_security_group(self.fake, "target-%d" % i)
+                        for i in range(3)]
+        for group_id in self.seed.security_groups:
+            for target in self.targets:
+                self.fake.security_groups[group_id]["rules"].append(
+                    ("tcp", "0", "65535", "group", target["id"]))
+
+    def _references(self):
+        ids = set([x["id"] for x in self.targets])
+        return [r for g in self.fake.security_groups.values()
+                for r in g["rules"] if r[3] == "group" and r[4] in ids]
+
+    def test_force_revokes_in_batches(self):
+        self.reset_calls()
+        deleted = sg_delete_many([x["name"] for x in self.targets], force=True)
+        self.assertEqual(sorted([x.name for x in deleted]),
+                         sorted([x["name"] for x in self.targets]))
+        self.assertEqual(self._references(), [])
+        # one revoke by referencing group, whatever the number of targets.
+        self.assertEqual(self.calls("RevokeSecurityGroupIngress"),
+                         len(self.seed.security_groups))
+        self.assertEqual(self.calls("DescribeSecurityGroups"), 1)
+        self.assertEqual(self.calls("DeleteSecurityGroup"), len(self.targets))
+
+    def test_connection_by_worker(self):
+        env.aws_max_workers = 4
+        with self.requests() as requests:
+            sg_delete_many([x["name"] for x in self.targets], force=True)
+
+        workers = [x for x in requests
+                   if x[0] in ("RevokeSecurityGroupIngress",
+                               "DeleteSecurityGroup")]
+        self.assertEqual(len(workers),
+                         len(self.seed.security_groups) + len(self.targets))
+        for operation, owner, thread in workers:
+            self.assertEqual(owner, thread)
+
+    def test_force_in_use_by_instance(self):
+        self.assertRaises(EC2LibraryError, sg_delete, "group-000", force=True)
+
+    def test_force_in_use_by_classic_instance(self):
+        # instances in EC2-Classic have no network interfaces.
+        instance = new_instance(self.fake, groups=[self.targets[0]["id"]],
+                                tags={"Name": "classic"})
+        instance["classic"] = True
+        self.reset_calls()
+        with self.assertRaises(EC2LibraryError) as e:
+            sg_delete(self.targets[0]["name"], force=True)
+        self.assertIn("classic", str(e.exception))
+        self.assertEqual(self.calls("RevokeSecurityGroupIngress"), 0)
+        self.assertEqual(len(self._references()),
+                         len(self.targets) * len(self.seed.security_groups))
+
+    def test_missing(self):
+        self.assertRaises(EC2LibraryError, sg_delete, "missing")
+        self.assertRaises(EC2LibraryError, sg_delete, "missing", force=True)
+
+
+class TestSecurityGroupEnsure(FakeTestCase):
+
+    def setUp(self):
+        super(TestSecurityGroupEnsure, self).setUp()
+        aws_fake_seed(instances=0, security_groups=3)
+        self.fake = aws_fake().region(self.region)
+
+    def _rules(self, ports):
+        return [sg_rule("tcp", "0.0.0.0/0", port) for port in ports] + \
+               [sg_rule("tcp", ["group-001", "group-002"], "22"),
+                sg_rule("icmp", "10.0.0.0/8")]
+
+    def _fake_rules(self, name):
+        group = [x for x in self.fake.security_groups.values()
+                 if x["name"] == name][0]
+        return sorted(group["rules"])
+
+    def test_authorize_in_one_request(self):
+        sg_ensure("web", "web", rules=self._rules(range(8000, 8020)))
+        self.assertEqual(self.calls("AuthorizeSecurityGroupIngress"), 1)
+        self.assertEqual(len(self._fake_rules("web")), 23)
+
+    def test_ensure_again_sends_nothing(self):
+        sg_ensure("web", "web", rules=self._rules(range(8000, 8020)))
+        rules = self._fake_rules("web")
+        self.reset_calls()
+
+        sg_ensure("web", "web", rules=self._rules(range(8000, 8020)), force=True)
+        self.assertEqual(self.calls("AuthorizeSecurityGroupIngress"), 0)
+        self.assertEqual(self.calls("RevokeSecurityGroupIngress"), 0)
+        self.assertEqual(self._fake_rules("web"), rules)
+
+    def test_add_only_the_missing_rules(self):
+        sg_ensure("web", "web", rules=self._rules(range(8000, 8010)))
+        self.reset_calls()
+
+        sg_ensure("web", "web", rules=self._rules(range(8000, 8012)), force=True)
+        self.assertEqual(self.calls("AuthorizeSecurityGroupIngress"), 1)
+        self.assertEqual(self.calls("RevokeSecurityGroupIngress"), 0)
+        self.assertEqual(len(self._fake_rules("web")), 15)
+
+    def test_exact(self):
+        sg_ensure("web", "web", rules=self._rules(range(8000, 8010)))
+        self.reset_calls()
+
+        sg_ensure("web", "web", rules=self._rules(range(8005, 8015)),
+                  force=True, exact=True)
+        self.assertEqual(self.calls("AuthorizeSecurityGroupIngress"), 1)
+        self.assertEqual(self.calls("RevokeSecurityGroupIngress"), 1)
+        ports = sorted([int(x[1]) for x in self._fake_rules("web")
+                        if x[0] == "tcp" and x[3] == "cidr"])
+        self.assertEqual(ports, range(8005, 8015))
+
+
+class TestSecurityGroupExists(FakeTestCase):
+
+    def setUp(self):
+        super(TestSecurityGroupExists, self).setUp()
+        aws_fake_seed(instances=0, security_groups=300)
+        self.names = ["group-%03d" % i for i in range(0, 300, 30)]
+        self.reset_calls()
+
+    def test_one_filtered_describe(self):
+        groups = sg_exists_many(self.names + ["missing"] + self.names)
+        self.assertEqual(sorted(groups.keys()), self.names)
+        self.assertEqual([groups[x].name for x in self.names], self.names)
+        self.assertEqual(self.calls(), 1)
+        self.assertEqual(self.calls("DescribeSecurityGroups"), 1)
+
+    def test_remembered(self):
+        sg_exists_many(self.names)
+        self.reset_calls()
+        self.assertEqual(sg_exists(self.names[3]).name, self.names[3])
+        self.assertEqual(len(sg_exists_many(self.names)), len(self.names))
+        self.assertEqual(self.calls(), 0)
+
+        # missing groups are not remembered, they could be created later.
+        self.assertEqual(sg_exists("missing"), None)
+        self.assertEqual(sg_exists("missing"), None)
+        self.assertEqual(self.calls("DescribeSecurityGroups"), 2)
+
+    def test_vpc(self):
+        self.assertEqual(sg_exists(self.names[0], vpc_id="vpc-00000000"),
+                         None)
+        self.assertEqual(sg_exists(self.names[0]).name, self.names[0])
+        self.assertEqual(self.calls("DescribeSecurityGroups"), 2)
+
+    def test_rules_resolve_once(self):
+        sg_ensure("web", "web", rules=[sg_rule("tcp", self.names, "22")])
+        # one lookup for the sources of the rule, one for the group itself.
+        self.assertEqual(self.calls("DescribeSecurityGroups"), 2)
+        self.assertEqual(self.calls("AuthorizeSecurityGroupIngress"), 1)
+
+    def test_invalidated_on_create_and_delete(self):
+        self.assertEqual(sg_exists("web"), None)
+        created = sg_ensure("web", "web")
+        self.reset_calls()
+        self.assertEqual(sg_exists("web").id, created.id)
+        self.assertEqual(self.calls(), 0)
+
+        sg_delete("web")
+        self.reset_calls()
+        self.assertEqual(sg_exists("web"), None)
+        self.assertEqual(self.calls("DescribeSecurityGroups"), 1)
@@ -0,0 +1,93 @@
+#! /usr/bin/env python
+# -*- encoding: utf-8 -*-
+# vim:fenc=utf-8:
+
+from contextlib import contextmanager
+
+from boto.exception import BotoServerError
+
+from tests.base import FakeTestCase
+
+from mico.lib.aws.fake import aws_fake
+from mico.lib.aws.fake import aws_fake_seed
+from mico.lib.aws.ec2 import ec2_list
+from mico.lib.aws.ec2 import ec2_tag_batch
+from mico.lib.aws.ec2 import ec2_tag_flush
+from mico.lib.aws.ec2.tags import tag_batcher
+
+
+class TestTags(FakeTestCase):
+
+    def setUp(self):
+        super(TestTags, self).setUp()
+        aws_fake_seed(instances=50)
+        self.instances = list(ec2_list())
+        self.reset_calls()
+
+    @contextmanager
+    def _failing(self, before=None):
+        """Context where the CreateTags calls fail, after calling before,
+        if any.
+        """
+        fake = aws_fake()
+
+        def _call(connection, operation, params):
+            if operation == "CreateTags":
+                if before is not None:
+                    before()
+                raise BotoServerError(400, "Bad Request", "InternalFailure")
+            return type(fake).call(fake, connection, operation, params)
+
+        fake.call = _call
+        try:
+            yield
+        finally:
+            del fake.call
+
+    def _tags(self, instance):
+        return aws_fake().region(self.region).instances[instance.id]["tags"]
+
+    def test_one_call_by_flush(self):
+        ec2_tag_batch(self.instances, {"env": "prod"})
+        ec2_tag_batch(self.instances, {"team": "ops"})
+        self.assertEqual(self.calls(), 0)
+        self.assertEqual(ec2_tag_flush(), 1)
+        self.assertEqual(self.calls("CreateTags"), 1)
+        self.assertEqual(ec2_tag_flush(), 0)
+
+        for instance in self.instances:
+            tags = self._tags(instance)
+            self.assertEqual((tags["env"], tags["team"]), ("prod", "ops"))
+
+    def test_one_call_by_distinct_value(self):
+        for i, instance in enumerate(self.instances):
+            ec2_tag_batch([instance], {"env": "prod", "slot": str(i % 3)})
+        self.assertEqual(ec2_tag_flush(), 4)
+
+    def test_failed_flush_keeps_tags(self):
+        ec2_tag_batch(self.instances, {"env": "prod"})
+        with self._failing():
+            self.assertRaises(BotoServerError, ec2_tag_flush)
+        self.assertEqual(tag_batcher.pending(), len(self.instances))
+
+        self.assertEqual(ec2_tag_flush(), 1)
+        self.assertEqual(tag_batcher.pending(), 0)
+        for instance in self.instances:
+            self.assertEqual(self._tags(instance)["env"], "prod")
+
+    def test_failed_flush_keeps_newer_values(self):
+        ec2_tag_batch(self.instances, {"env": "prod", "team": "ops"})
+        with self._failing(lambda: ec2_tag_batch(self.instances[:1], {"env": "dev"})):
+            self.assertRaises(BotoServerError, ec2_tag_flush)
+
+        ec2_tag_flush()
+        self.assertEqual(self._tags(self.instances[0])["env"], "dev")
+        self.assertEqual(self._tags(self.instances[0])["team"], "ops")
+        self.assertEqual(self._tags(self.instances[1])["env"], "prod")
+
+    def test_read_does_not_raise(self):
+        ec2_tag_batch(self.instances[:5], {"env": "prod"})
+        with self._failing():
+            self.assertEqual(len(list(ec2_list())), len(self.instances))
+        self.assertEqual(tag_batcher.pending(), 5)
+        self.assertEqual(ec2_tag_flush(), 1)
@@ -0,0 +1,85 @@
+#! /usr/bin/env python
+# -*- encoding: utf-8 -*-
+# vim:fenc=utf-8:
+
+from tests.base import FakeTestCase
+
+from mico import env
+from mico.lib.aws.fake import aws_fake
+from mico.lib.aws.fake import aws_fake_seed
+from mico.lib.aws.fake.base import transition
+from mico.lib.aws.ec2 import ec2_wait
+from mico.lib.aws.ec2 import EC2LibraryError
+from mico.lib.aws.ec2.waiter import Waiter
+
+
+class TestWait(FakeTestCase):
+
+    def setUp(self):
+        super(TestWait, self).setUp()
+        self.seed = aws_fake_seed(instances=450, volumes=20)
+        self.fake = aws_fake().region(self.region)
+        self.ids = list(self.fake.instances.keys())
+        self.reset_calls()
+
+    def _pending(self, ids, delay=0):
+        env.aws_fake_delay = delay
+        for instance_id in ids:
+            transition(self.fake.instances[instance_id], "pending", "running")
+
+    def test_one_describe_by_chunk(self):
+        self._pending(self.ids)
+        instances = ec2_wait(self.ids, "running")
+        self.assertEqual([x.id for x in instances], self.ids)
+        self.assertEqual(set([x.state for x in instances]), set(["running"]))
+        # 450 instances in chunks of 200, in a single round.
+        self.assertEqual(self.calls(), 3)
+        self.assertEqual(self.calls("DescribeInstances"), 3)
+
+    def test_one_describe_by_round(self):
+        self._pending(self.ids[:10], delay=0.05)
+        waiter = Waiter("instances")
+        for instance_id in self.ids[:10]:
+            waiter.add(instance_id, "running")
+        waiter.wait()
+        self.assertTrue(waiter.rounds > 1)
+        self.assertEqual(self.calls("DescribeInstances"), waiter.rounds)
+
+    def test_callback(self):
+        self._pending(self.ids[:3], delay=0.05)
+        changes = []
+        ec2_wait(self.ids[:3], "running",
+                 callback=lambda x, old, new: changes.append((x.id, old, new)))
+        self.assertEqual(sorted(changes), sorted(
+            [(x, None, "pending") for x in self.ids[:3]] +
+            [(x, "pending", "running") for x in self.ids[:3]]))
+
+    def test_failed(self):
+        self._pending(self.ids[:5])
+        transition(self.fake.instances[self.ids[0]], "shutting-down",
+                   "terminated")
+        self.assertRaises(EC2LibraryError, ec2_wait, self.ids[:5], "running")
+
+    def test_timeout(self):
+        self._pending(self.ids[:5], delay=60)
+        self.assertRaises(EC2LibraryError, ec2_wait, self.ids[:5], "running",
+                          timeout=0)
+        self.assertEqual(self.calls("DescribeInstances"), 1)
+
+    def test_volumes(self):
+        self.assertEqual(len(ec2_wait(self.seed.volumes, "in-use")), 20)
+        self.assertEqual(self.calls(), 1)
+        self.assertEqual(self.calls("DescribeVolumes"), 1)
+
+    def test_regions(self):
+        aws_fake_seed(instances=10, region="eu-west-1")
+        others = list(aws_fake().region("eu-west-1").instances.keys())
+        self.reset_calls()
+
+        waiter = Waiter("instances")
+        for instance_id in self.ids[:10]:
+            waiter.add(instance_id, "running")
+        for instance_id in others:
+            waiter.add(instance_id, "running", region="eu-west-1")
+        self.assertEqual(len(waiter.wait()), 20)
+        self.assertEqual(self.calls("DescribeInstances"), 2)
@@ -0,0 +1,74 @@
+#! /usr/bin/env python
+# -*- encoding: utf-8 -*-
+# vim:fenc=utf-8:
+
+import threading
+import unittest
+
+from mico import env
+from mico.util.workers import imap_unordered, pmap
+
+
+class TestWorkers(unittest.TestCase):
+
+    def setUp(self):
+        self._env = dict(env)
+
+    def tearDown(self):
+        env.clear()
+        env.update(self._env)
+
+    def test_concurrent_by_default(self):
+        # fabric sets parallel to False, which must not disable the
+        # fan-out of the AWS calls.
+        env.parallel = False
+        env.pop("aws_max_workers", None)
+        running = []
+        seen = []
+        lock = threading.Lock()
+        event = threading.Event()
+
+        def _fn(item):
+            with lock:
+                running.append(item)
+                seen.append(len(running))
+                if len(running) == 4:
+                    event.set()
+            event.wait(1)
+            with lock:
+                running.remove(item)
+            return item * 2
+
+        ret = dict(imap_unordered(_fn, range(4)))
+        self.assertEqual(ret, {0: 0, 1: 2, 2: 4, 3: 6})
+        self.assertEqual(max(seen), 4)
+
+    def test_serial(self):
+        env.aws_max_workers = 1
+        idents = set()
+
+        def _fn(item):
+            idents.add(threading.current_thread().ident)
+            return item * 2
+
+        self.assertEqual(pmap(_fn, range(10)), [x * 2 for x in range(10)])
+        self.assertEqual(idents, set([threading.current_thread().ident]))
+
+    def test_bounded(self):
+        env.aws_max_workers = 3
+        idents = set()
+
+        def _fn(item):
+            idents.add(threading.current_thread().ident)
+            return item
+
+        self.assertEqual(pmap(_fn, range(20)), range(20))
+        self.assertTrue(len(idents) <= 3)
+
+    def test_exception(self):
+        def _fn(item):
+            if item == 3:
+                raise ValueError(item)
+            return item
+
+        self.assertRaises(ValueError, pmap, _fn, range(5))